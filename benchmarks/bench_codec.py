@@ -0,0 +1,65 @@
+"""Micro-benchmark of the JSON codec backends used for gateway ingest and command publishing.
+
+Usage: python benchmarks/bench_codec.py [--devices 100] [--number 2000] [--repeat 5]
+"""
+import argparse
+import importlib.util
+import json
+import pathlib
+import timeit
+
+CODEC_PATH = pathlib.Path(__file__).resolve().parent.parent / "custom_components" / "mhtzn" / "codec.py"
+
+
+def load_codec():
+    """Load codec.py on its own, without importing Home Assistant"""
+    spec = importlib.util.spec_from_file_location("mhtzn_codec", CODEC_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_state_payload(devices: int) -> bytes:
+    """An event/3 burst reporting the state of the given number of lights"""
+    return json.dumps({
+        "seq": 1,
+        "data": [
+            {"sn": f"{index:012d}", "on": 1, "level": 0.5, "kelvin": 4000, "rgb": 16777215}
+            for index in range(devices)
+        ]
+    }).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=100, help="Number of reports in each event/3 payload")
+    parser.add_argument("--number", type=int, default=2000, help="Iterations of each measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="Measurements of which the fastest is kept")
+    args = parser.parse_args()
+
+    codec = load_codec()
+    payload = build_state_payload(args.devices)
+
+    print(f"payload: {len(payload)} bytes, {args.devices} reports, {args.number} iterations")
+    print(f"{'backend':<8} {'decode (us)':>12} {'naive cmd (us)':>15} {'envelope cmd (us)':>18}")
+
+    for name, backend in codec.CODECS.items():
+        decode = min(timeit.repeat(lambda: backend.loads(payload), number=args.number, repeat=args.repeat))
+
+        def naive_command():
+            return backend.dumps({"seq": 1, "data": {"sn": "000000000001", "on": 1, "level": 0.5}})
+
+        envelope = codec.CommandEnvelope("P/0/center/q20", {"sn": "000000000001"}, backend=backend)
+
+        def envelope_command():
+            return envelope.encode({"on": 1, "level": 0.5})
+
+        naive = min(timeit.repeat(naive_command, number=args.number * 10, repeat=args.repeat))
+        enveloped = min(timeit.repeat(envelope_command, number=args.number * 10, repeat=args.repeat))
+
+        print(f"{name:<8} {decode / args.number * 1e6:>12.2f} "
+              f"{naive / (args.number * 10) * 1e6:>15.3f} {enveloped / (args.number * 10) * 1e6:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Micro-benchmark of the colour temperature conversions: per-call math and lookup tables.
+
+Usage: python benchmarks/bench_color.py [--lights 500] [--number 200]
+"""
+import argparse
+import importlib.util
+import pathlib
+import random
+import timeit
+
+COLOR_PATH = pathlib.Path(__file__).resolve().parent.parent / "custom_components" / "mhtzn" / "color.py"
+
+
+def load_color():
+    """Load color.py on its own, without importing Home Assistant"""
+    spec = importlib.util.spec_from_file_location("mhtzn_color", COLOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lights", type=int, default=500, help="Number of lights in one scene burst")
+    parser.add_argument("--number", type=int, default=200, help="Iterations of each measurement")
+    args = parser.parse_args()
+
+    color = load_color()
+    kelvins = [random.randint(color.LIGHT_MHT_MIN_KELVIN, color.LIGHT_MHT_MAX_KELVIN) for _ in range(args.lights)]
+    mireds = [random.randint(color.LIGHT_MIN_KELVIN, color.LIGHT_MAX_KELVIN) for _ in range(args.lights)]
+
+    cases = {
+        "kelvin->mired math": lambda: [color.compute_device_kelvin_to_mired(k) for k in kelvins],
+        "kelvin->mired table": lambda: [color.device_kelvin_to_mired(k) for k in kelvins],
+        "mired->kelvin math": lambda: [color.compute_mired_to_device_kelvin(m) for m in mireds],
+        "mired->kelvin table": lambda: [color.mired_to_device_kelvin(m) for m in mireds],
+        "kelvin->rgb math": lambda: [color.compute_color_temp_to_rgb(k) for k in kelvins],
+        "kelvin->rgb table": lambda: [color.color_temp_to_rgb(k) for k in kelvins],
+    }
+
+    print(f"{args.lights} lights per burst, {args.number} iterations")
+    for name, case in cases.items():
+        seconds = timeit.timeit(case, number=args.number)
+        print(f"{name:<22} {seconds / args.number * 1e6:>10.1f} us/burst")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""End-to-end load benchmark of Gateway and the entity platforms against the simulated gateway.
+
+For each device count it creates a Home Assistant instance, connects a Gateway to benchmarks/simulator.py,
+measures the discovery time with the number of async_add_entities batches and entity registry updates it
+took, then sends an event/3 storm and reports the reports/s and the p50/p99 latency from sending a report to
+writing the entity state. Runs offline, Home Assistant must be installed.
+
+Usage: python benchmarks/bench_gateway.py [--devices 100,1000,10000] [--messages 500] [--reports 20]
+"""
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from homeassistant.const import CONF_NAME, EVENT_STATE_CHANGED  # noqa: E402
+from homeassistant.helpers.entity_registry import EVENT_ENTITY_REGISTRY_UPDATED  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+"""Imported before the helpers, entity_platform cannot be the first module to import config_entries"""
+from homeassistant import config_entries  # noqa: E402,F401
+from homeassistant.helpers import device_registry, entity_registry  # noqa: E402
+from homeassistant.helpers.entity_platform import EntityPlatform  # noqa: E402
+
+from custom_components.mhtzn import climate, cover, light, scene  # noqa: E402
+from custom_components.mhtzn.Gateway import Gateway  # noqa: E402
+from custom_components.mhtzn.const import DOMAIN, CONF_LIGHT_DEVICE_TYPE, CONF_STATE_COALESCE_WINDOW, \
+    DEFAULT_STATE_COALESCE_WINDOW  # noqa: E402
+from simulator import GatewaySimulator  # noqa: E402
+
+PLATFORM_MODULES = {"light": light, "cover": cover, "climate": climate, "scene": scene}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def create_hass(config_dir: str) -> HomeAssistant:
+    try:
+        hass = HomeAssistant(config_dir)
+    except TypeError:
+        """Releases before 2023 take no argument"""
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    await entity_registry.async_load(hass)
+    await device_registry.async_load(hass)
+    return hass
+
+
+class BenchEntry:
+    """The parts of a config entry used by the integration"""
+
+    def __init__(self, entry_id: str, data: dict, options=None) -> None:
+        self.entry_id = entry_id
+        self.unique_id = entry_id
+        self.title = entry_id
+        self.options = options or {}
+        self.data = data
+        self._on_unload = []
+
+    def async_on_unload(self, func) -> None:
+        self._on_unload.append(func)
+
+    def async_run_unload_callbacks(self) -> None:
+        while self._on_unload:
+            self._on_unload.pop()()
+
+
+def build_simulator(devices: int) -> GatewaySimulator:
+    """80% lights, 10% covers and 10% climates"""
+    return GatewaySimulator(
+        lights=devices * 8 // 10, covers=devices // 10, climates=devices - devices * 8 // 10 - devices // 10
+    )
+
+
+async def async_setup_gateway(hass: HomeAssistant, simulator: GatewaySimulator, entry: BenchEntry):
+    """Set up the gateway and its platforms like async_setup_entry does and wait for the discovery"""
+
+    gateway = Gateway(hass, entry, mqtt_factory=simulator.client_factory)
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = gateway
+
+    platforms = []
+    for component, module in PLATFORM_MODULES.items():
+        platform = EntityPlatform(
+            hass=hass, logger=logging.getLogger(component), domain=component, platform_name=DOMAIN,
+            platform=None, scan_interval=None, entity_namespace=None,
+        )
+        platforms.append(platform)
+        await module.async_setup_entry(hass, entry, platform._async_schedule_add_entities)
+
+    await gateway.connect()
+    await async_wait_discovery(hass, gateway)
+    return gateway, platforms
+
+
+async def async_wait_discovery(hass: HomeAssistant, gateway: Gateway) -> None:
+    """Wait for the catalog of a connected gateway and the entities it creates"""
+
+    while gateway._discovery_task is None:
+        await asyncio.sleep(0.001)
+    await gateway._discovery_task
+    await hass.async_block_till_done()
+
+
+async def async_unload_gateway(hass: HomeAssistant, entry: BenchEntry, platforms: list[EntityPlatform]) -> None:
+    """Unload the platforms and the gateway like async_unload_entry does"""
+
+    """Destroyed rather than only reset, a reset platform stays registered in hass.data with its entity dict"""
+    for platform in platforms:
+        await platform.async_destroy()
+    entry.async_run_unload_callbacks()
+    await hass.data[DOMAIN].pop(entry.entry_id).async_unload()
+    await hass.async_block_till_done()
+
+
+async def run(devices: int, messages: int, reports: int, rate: float, window: float, light_type: str) -> dict:
+    simulator = build_simulator(devices)
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await create_hass(config_dir)
+        entry = BenchEntry(
+            "bench", {CONF_NAME: "bench", CONF_LIGHT_DEVICE_TYPE: light_type}, {CONF_STATE_COALESCE_WINDOW: window}
+        )
+
+        registry_updates = 0
+
+        def registry_updated(_event):
+            nonlocal registry_updates
+            registry_updates += 1
+
+        remove_registry_listener = hass.bus.async_listen(EVENT_ENTITY_REGISTRY_UPDATED, registry_updated)
+        started = time.monotonic()
+        gateway, platforms = await async_setup_gateway(hass, simulator, entry)
+        discovery = time.monotonic() - started
+        remove_registry_listener()
+
+        sn_by_entity_id = {
+            entity.entity_id: entity.unique_id for platform in platforms for entity in platform.entities.values()
+        }
+
+        latencies = []
+        last_write = started
+
+        def state_changed(event):
+            nonlocal last_write
+            sn = sn_by_entity_id.get(event.data["entity_id"])
+            sent_at = simulator.sent_at.get(sn)
+            if sent_at is not None:
+                last_write = time.monotonic()
+                latencies.append(last_write - sent_at)
+
+        remove_listener = hass.bus.async_listen(EVENT_STATE_CHANGED, state_changed)
+
+        storm_started = time.monotonic()
+        await simulator.async_storm(messages, reports, rate)
+        await asyncio.sleep(window * 2 + 0.1)
+        await hass.async_block_till_done()
+        elapsed = last_write - storm_started
+        remove_listener()
+
+        """State resynchronisation as run after a reconnection"""
+        q5_before = simulator.queries.get("q5", 0)
+        resync_started = time.monotonic()
+        await gateway.async_resync_states()
+        await hass.async_block_till_done()
+        resync = time.monotonic() - resync_started
+        resync_requests = simulator.queries.get("q5", 0) - q5_before
+
+        await async_unload_gateway(hass, entry, platforms)
+        try:
+            await hass.async_stop(force=True)
+        except TypeError:
+            await hass.async_stop()
+
+    return {
+        "devices": devices,
+        "entities": len(sn_by_entity_id),
+        "discovery_s": discovery,
+        "q5_requests": q5_before,
+        "batches": gateway.registration_stats.batches,
+        "registry_updates": registry_updates,
+        "reports_per_s": messages * reports / elapsed if elapsed > 0 else float("nan"),
+        "writes": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "resync_s": resync,
+        "resync_q5": resync_requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", default="100,1000,10000", help="Comma separated device counts")
+    parser.add_argument("--messages", type=int, default=500, help="Number of event/3 messages of the storm")
+    parser.add_argument("--reports", type=int, default=20, help="Device reports in each event/3 message")
+    parser.add_argument("--rate", type=float, default=0, help="event/3 messages per second, 0 = unthrottled")
+    parser.add_argument("--window", type=float, default=DEFAULT_STATE_COALESCE_WINDOW,
+                        help="State coalescing window in seconds")
+    parser.add_argument("--light-device-type", default="single", choices=["single", "group"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'devices':>8} {'entities':>8} {'discovery s':>12} {'q5':>5} {'batches':>7} {'registry':>8} "
+          f"{'reports/s':>10} {'writes':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'resync s':>9} {'q5':>5}")
+    for devices in (int(count) for count in args.devices.split(",")):
+        result = asyncio.run(run(devices, args.messages, args.reports, args.rate, args.window,
+                                 args.light_device_type))
+        print(f"{result['devices']:>8} {result['entities']:>8} {result['discovery_s']:>12.3f} "
+              f"{result['q5_requests']:>5} {result['batches']:>7} {result['registry_updates']:>8} "
+              f"{result['reports_per_s']:>10.0f} {result['writes']:>8} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['resync_s']:>9.3f} "
+              f"{result['resync_q5']:>5}")
+
+
+if __name__ == "__main__":
+    main()
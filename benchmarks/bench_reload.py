@@ -0,0 +1,157 @@
+"""Memory growth across config entry reloads.
+
+Sets up a config entry with thousands of simulated devices, sends a state storm, reloads the entry through
+hass.config_entries and repeats, so async_setup_entry and async_unload_entry run as in Home Assistant. After
+each cycle it reports the traced memory and the number of live Gateway and entity objects, which must not grow
+with the number of cycles. Runs offline, Home Assistant must be installed.
+
+Usage: python benchmarks/bench_reload.py [--devices 5000] [--cycles 10]
+"""
+import argparse
+import asyncio
+import functools
+import gc
+import logging
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from bench_gateway import build_simulator, create_hass, async_wait_discovery
+
+from homeassistant import config_entries
+from homeassistant.const import CONF_NAME
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import DATA_ENTITY_PLATFORM
+
+import custom_components.mhtzn as integration
+from custom_components.mhtzn.Gateway import Gateway
+from custom_components.mhtzn.climate import CustomClimate
+from custom_components.mhtzn.cover import CustomCover
+from custom_components.mhtzn.light import CustomLight
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE, DOMAIN
+
+TRACKED_TYPES = (Gateway, CustomLight, CustomCover, CustomClimate)
+
+
+def live_objects() -> dict[str, int]:
+    gc.collect()
+    counts = {tracked.__name__: 0 for tracked in TRACKED_TYPES}
+    for obj in gc.get_objects():
+        if isinstance(obj, TRACKED_TYPES):
+            counts[type(obj).__name__] += 1
+    return counts
+
+
+async def async_setup_hass(config_dir: str) -> HomeAssistant:
+    """Home Assistant with its config entries, the gateways connect to the simulator so the mqtt integration
+    they depend on is marked as set up rather than started"""
+
+    hass = await create_hass(config_dir)
+    hass.config.skip_pip = True
+    hass.config.components.add("mqtt")
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    return hass
+
+
+def create_entry(name: str) -> config_entries.ConfigEntry:
+    return config_entries.ConfigEntry(
+        version=1, domain=DOMAIN, title=name, data={CONF_NAME: name, CONF_LIGHT_DEVICE_TYPE: "single"},
+        source=config_entries.SOURCE_USER, options={},
+    )
+
+
+def simulated_gateway(simulator):
+    """Make async_setup_entry create gateways connected to the simulator"""
+    return mock.patch.object(integration, "Gateway", functools.partial(Gateway, mqtt_factory=simulator.client_factory))
+
+
+def entry_gateway(hass: HomeAssistant, entry: config_entries.ConfigEntry) -> Gateway:
+    return hass.data[DOMAIN][entry.entry_id]
+
+
+async def async_reload(hass: HomeAssistant, entry: config_entries.ConfigEntry) -> None:
+    """Reload the entry through hass.config_entries and wait for the discovery of the new gateway.
+
+    Home Assistant 2023.2 resets the platforms of an unloaded entry but keeps them in hass.data with their
+    emptied entity dicts, they are dropped so the growth measured is the one of the integration"""
+
+    platforms = hass.data.get(DATA_ENTITY_PLATFORM, {}).get(DOMAIN, [])
+    previous = list(platforms)
+    await hass.config_entries.async_reload(entry.entry_id)
+    platforms[:] = [platform for platform in platforms if platform not in previous]
+    await async_wait_discovery(hass, entry_gateway(hass, entry))
+
+
+async def async_reload_cycles(devices: int, cycles: int, messages: int,
+                              report=None) -> tuple[list[int], dict[str, int]]:
+    """Run the reload cycles, return the traced memory growth since the first cycle after each cycle and the
+    objects still alive once the entry is unloaded. report(cycle, current, growth, counts) is called after
+    each cycle, with the objects of the reloaded entry alive"""
+
+    simulator = build_simulator(devices)
+
+    with tempfile.TemporaryDirectory() as config_dir, simulated_gateway(simulator):
+        hass = await async_setup_hass(config_dir)
+        entry = create_entry("reload")
+        await hass.config_entries.async_add(entry)
+        await async_wait_discovery(hass, entry_gateway(hass, entry))
+
+        tracemalloc.start()
+        baseline = None
+        growth = []
+        try:
+            for cycle in range(1, cycles + 1):
+                await simulator.async_storm(messages, 50)
+                await asyncio.sleep(0.2)
+                await hass.async_block_till_done()
+                await async_reload(hass, entry)
+
+                counts = live_objects()
+                current, _peak = tracemalloc.get_traced_memory()
+                if baseline is None:
+                    baseline = current
+                growth.append(current - baseline)
+                if report is not None:
+                    report(cycle, current, current - baseline, counts)
+        finally:
+            tracemalloc.stop()
+
+        await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+        counts = live_objects()
+        await hass.async_stop(force=True)
+
+    return growth, counts
+
+
+def growth_per_cycle(growth: list[int]) -> float:
+    """Bytes per cycle over the second half, the first cycles warm up caches"""
+    return (growth[-1] - growth[len(growth) // 2]) / max(1, len(growth) - 1 - len(growth) // 2)
+
+
+async def run(devices: int, cycles: int, messages: int) -> bool:
+    def report(cycle, current, growth, counts):
+        print(f"cycle {cycle:>3}: {current / 1024 / 1024:8.2f} MiB traced, "
+              f"{growth / 1024:+10.0f} KiB since cycle 1, live objects {counts}")
+
+    growth, counts = await async_reload_cycles(devices, cycles, messages, report)
+    print(f"growth per cycle over the second half: {growth_per_cycle(growth) / 1024:.0f} KiB")
+    return not any(counts.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=100, help="event/3 messages sent in each cycle")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    ok = asyncio.run(run(args.devices, args.cycles, args.messages))
+    print("no gateway or entity object left after unload" if ok else "objects still alive after unload")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Local gateway simulator for the benchmarks.
+
+FakeMQTTClient stands in for the Home Assistant MQTT client used by Gateway and routes its publishes to a
+GatewaySimulator, which answers the q5 paging, q28, q33 and q31 queries like a real gateway and produces
+configurable event/3 storms. Everything runs in-process on the event loop, no broker or network needed.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import random
+import time
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels) or (level != "+" and level != topic_levels[index]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class ReceiveMessage:
+    """Message delivered to the subscription callbacks, same attributes as the HA MQTT message"""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "subscribed_topic", "timestamp")
+
+    def __init__(self, topic: str, payload: bytes, subscribed_topic: str) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+        self.retain = False
+        self.subscribed_topic = subscribed_topic
+        self.timestamp = time.monotonic()
+
+
+class FakeMQTTClient:
+    """In-process replacement of homeassistant.components.mqtt.MQTT, connected to a GatewaySimulator"""
+
+    def __init__(self, simulator: "GatewaySimulator", hass, entry, conf) -> None:
+        self.simulator = simulator
+        self.hass = hass
+        self.conf = conf
+        self.connected = False
+        self.subscriptions: list[tuple[str, object]] = []
+        self.published = 0
+
+    def init_client(self) -> None:
+        pass
+
+    async def async_connect(self) -> None:
+        self.connected = self.simulator.reachable
+        if self.connected and self not in self.simulator.clients:
+            self.simulator.clients.append(self)
+
+    async def async_disconnect(self) -> None:
+        self.connected = False
+        if self in self.simulator.clients:
+            self.simulator.clients.remove(self)
+
+    async def async_subscribe(self, topic: str, msg_callback, qos: int = 0, encoding: str | None = "utf-8"):
+        subscription = (topic, msg_callback)
+        self.subscriptions.append(subscription)
+
+        def async_remove():
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+        return async_remove
+
+    async def async_publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> None:
+        self.published += 1
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.simulator.receive(topic, payload)
+
+    def deliver(self, topic: str, payload: bytes) -> None:
+        """Deliver a message from the gateway to the matching subscriptions"""
+        for pattern, msg_callback in list(self.subscriptions):
+            if topic_matches(pattern, topic):
+                result = msg_callback(ReceiveMessage(topic, payload, pattern))
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+
+
+class GatewaySimulator:
+    """Simulated gateway with a configurable device population"""
+
+    def __init__(self, lights: int = 100, covers: int = 0, climates: int = 0, scenes: int = 10,
+                 rooms: int = 10, subgroups: int = 2, latency: float = 0.005, gateway_sn: str = "SIM0001",
+                 seed: int = 1) -> None:
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.gateway_sn = gateway_sn
+        self.reachable = True
+        self.clients: list[FakeMQTTClient] = []
+
+        """Number of queries answered, per query topic"""
+        self.queries: dict[str, int] = {}
+
+        """Monotonic time at which the last report of each device was sent"""
+        self.sent_at: dict[str, float] = {}
+
+        self.rooms = [{"id": room, "name": f"Room {room}"} for room in range(1, rooms + 1)]
+        self.subgroups = [{"id": subgroup, "name": f"Group {subgroup}"} for subgroup in range(1, subgroups + 1)]
+        self.scenes = [{"id": scene, "name": f"Scene {scene}"} for scene in range(1, scenes + 1)]
+
+        self.devices: list[dict] = []
+        for index in range(lights):
+            self.devices.append({
+                "sn": f"L{index:07d}", "devType": 1, "name": f"Light {index}",
+                "room": index % rooms + 1, "subgroup": index % subgroups + 1 if subgroups else 0,
+                "on": 0, "level": 1.0, "kelvin": 4000,
+            })
+        for index in range(covers):
+            self.devices.append({
+                "sn": f"C{index:07d}", "devType": 3, "name": f"Cover {index}",
+                "room": index % rooms + 1, "travel": 1.0,
+            })
+        for index in range(climates):
+            self.devices.append({
+                "sn": f"A{index:07d}", "devType": 11, "name": f"Climate {index}",
+                "room": index % rooms + 1, "a64": 0, "a65": 24, "a66": 1, "a67": 0, "a19": 25,
+            })
+
+    def client_factory(self, hass, entry, conf) -> FakeMQTTClient:
+        """Factory to pass to Gateway(mqtt_factory=...)"""
+        return FakeMQTTClient(self, hass, entry, conf)
+
+    def receive(self, topic: str, payload: bytes) -> None:
+        """Handle a message published by the integration"""
+
+        message = json.loads(payload)
+        name = topic.rsplit("/", 1)[-1]
+        self.queries[name] = self.queries.get(name, 0) + 1
+
+        data = message.get("data", {})
+        response_to = message.get("rspTo", "mhtzn")
+        response = None
+
+        if name == "q5":
+            dev_types = set(data.get("devTypes", [1, 3, 11]))
+            devices = [device for device in self.devices if device["devType"] in dev_types]
+            start = int(data.get("start", 0))
+            page = devices[start:start + int(data.get("max", 100))]
+            response = {"start": start, "count": len(page), "total": len(devices), "list": page}
+        elif name == "q28":
+            response = self.scenes
+        elif name == "q33":
+            response = {"rooms": self.rooms, "lightsSubgroups": self.subgroups}
+        elif name == "q31":
+            response = [
+                {"room": room["id"], "lights": [0, *(group["id"] for group in self.subgroups)]}
+                for room in [{"id": 0}, *self.rooms]
+            ]
+
+        if response is not None:
+            body = json.dumps({"seq": message.get("seq"), "data": response}).encode()
+            reply_topic = f"{response_to}/center/p{name[1:]}"
+            asyncio.get_running_loop().call_later(self.latency, self.publish, reply_topic, body)
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        for client in list(self.clients):
+            client.deliver(topic, payload)
+
+    def state_report(self, device: dict) -> dict:
+        """A random state change of a device"""
+
+        if device["devType"] == 1:
+            return {"sn": device["sn"], "on": self.random.randint(0, 1),
+                    "level": round(self.random.random(), 2), "kelvin": self.random.randint(2700, 6500)}
+        if device["devType"] == 3:
+            return {"sn": device["sn"], "travel": round(self.random.random(), 2)}
+        return {"sn": device["sn"], "a64": 1, "a65": self.random.randint(16, 30), "a19": self.random.randint(16, 30)}
+
+    async def async_storm(self, messages: int, reports_per_message: int = 20, rate: float = 0,
+                          repeat_ratio: float = 0.0) -> None:
+        """Send event/3 messages, `rate` messages per second (0 = as fast as possible).
+
+        repeat_ratio is the share of reports repeating the previous report of the device"""
+
+        topic = f"p/{self.gateway_sn}/event/3"
+        previous: dict[str, dict] = {}
+        interval = 1 / rate if rate > 0 else 0
+
+        for _ in range(messages):
+            reports = []
+            for device in self.random.sample(self.devices, min(reports_per_message, len(self.devices))):
+                report = previous.get(device["sn"])
+                if report is None or self.random.random() >= repeat_ratio:
+                    report = self.state_report(device)
+                    previous[device["sn"]] = report
+                reports.append(report)
+                self.sent_at[device["sn"]] = time.monotonic()
+
+            self.publish(topic, json.dumps({"seq": 0, "data": reports}).encode())
+            await asyncio.sleep(interval)
@@ -1,230 +1,725 @@
 """Define a gateway class for managing MQTT connections within the gateway"""
+from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import time
 
 from homeassistant.components.mqtt import MQTT
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_NAME, EVENT_HOMEASSISTANT_STOP
-from homeassistant.core import HomeAssistant, Event
+from homeassistant.core import HomeAssistant, Event, callback, CALLBACK_TYPE
+from homeassistant.helpers import entity_registry
 from homeassistant.helpers.dispatcher import async_dispatcher_send
 
-from .const import MQTT_CLIENT_INSTANCE, CONF_LIGHT_DEVICE_TYPE, EVENT_ENTITY_REGISTER, MQTT_TOPIC_PREFIX, \
-    EVENT_ENTITY_STATE_UPDATE, DEVICE_COUNT_MAX
+from .const import CONF_LIGHT_DEVICE_TYPE, EVENT_ENTITY_REGISTER, MQTT_TOPIC_PREFIX, \
+    CONF_STATE_COALESCE_WINDOW, DOMAIN, CONF_LIGHT_COMMAND_RATE
+from .cache import CatalogCache
+from .capture import TrafficRecorder, async_replay
+from .catalog import DeviceCatalogFetcher
+from .coalescer import StateCoalescer
+from .codec import loads, dumps, DecodeError, CommandEnvelope
+from .command_queue import CommandQueue
+from .connection import ConnectionManager
+from .entity import StateWriteStats, RegistrationStats, StateHandler
+from .metrics import GatewayMetrics, UNROUTED
+from .optimistic import OptimisticStats
+from .pipeline import CommandPipeline
+from .planner import GroupCommandPlanner
+from .request import RequestManager, DEFAULT_REQUEST_TIMEOUT
+from .router import TopicRouter
+from .util import gateway_options
 
 _LOGGER = logging.getLogger(__name__)
 
+"""Seconds to wait for the complete device list"""
+DISCOVERY_TIMEOUT = 120
+
+DISCOVERY_REQUEST_RETRIES = 2
+
+"""Seconds between two checks of the connection acknowledgement"""
+CONNECT_POLL_INTERVAL = 0.1
+
+"""Seconds to wait for the state of every device after a reconnection"""
+RESYNC_TIMEOUT = 30
+
+"""Longest time state reports are held back so a resynchronisation is written in one pass"""
+RESYNC_HOLD_MAX = 5
+
 
 class Gateway:
     """Class for gateway and managing MQTT connections within the gateway"""
 
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
-        """Init dummy hub."""
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, mqtt_factory=MQTT) -> None:
+        """Init dummy hub.
+
+        mqtt_factory creates the MQTT client from (hass, entry, conf), the benchmarks use it to connect to a
+        simulated gateway"""
         self._hass = hass
         self._entry = entry
+        self._mqtt_factory = mqtt_factory
         self._id = entry.data[CONF_NAME]
 
+        """MQTT client of this gateway, every gateway has its own connection"""
+        self.mqtt_client: MQTT | None = None
+        self._remove_stop_listener = None
+
         self.light_group_map = {}
         self.room_map = {}
 
         """Lighting Control Type"""
         self.light_device_type = entry.data[CONF_LIGHT_DEVICE_TYPE]
 
+        """Last known catalog, used to create the entities before the gateway has answered"""
+        self.catalog_cache = CatalogCache(hass, entry)
+
+        """Discovery payloads of the entities known to the gateway, per platform"""
+        self._entities: dict[str, dict[str, dict]] = {}
+        """Platforms whose entity listener is ready, entities of other platforms are held back until it is"""
+        self._ready_platforms: set[str] = set()
+        """unique_ids reported by the gateway since the last refresh started, per platform"""
+        self._live_ids: dict[str, set[str]] = {}
+        self._devices_reconciled = False
+        """Number of entity batches sent to the platforms and the entities they contained"""
+        self.registration_stats = RegistrationStats()
+
+        """State handler of the entity of each device sn, registered while the entity is in HA"""
+        self._state_handlers: dict[str, StateHandler] = {}
+
+        """Tunables of the options flow the gateway was set up with"""
+        self.options = gateway_options(entry)
+
+        """Merge bursts of device state reports so each entity is written once per window"""
+        self.state_coalescer = StateCoalescer(
+            hass,
+            self.options[CONF_STATE_COALESCE_WINDOW],
+            self._async_dispatch_state,
+        )
+
+        """Counters of the entity state writes performed and skipped because nothing changed"""
+        self.write_stats = StateWriteStats()
+
+        """Counters of the commands shown before the devices confirmed them"""
+        self.optimistic_stats = OptimisticStats()
+
+        """Sequence numbers of the outgoing messages and the requests waiting for a response"""
+        self.requests = RequestManager(hass, self._async_mqtt_publish)
+
+        """Ordered command queue of each device"""
+        self.command_queue = CommandQueue(hass)
+
+        """Latest-wins coalescing of the light commands, such as the values sent while dragging a slider"""
+        self.light_pipeline = CommandPipeline(
+            hass,
+            self.options[CONF_LIGHT_COMMAND_RATE],
+            self._async_send_group_commands,
+        )
+
+        """Send one room or light group command instead of the same command to each of its lights"""
+        self.group_planner = GroupCommandPlanner(
+            lambda: (light for light in self._entities.get("light", {}).values() if not light.get("is_group")),
+            lambda: self.catalog_fetcher.complete,
+        )
+
+        """Fetch the device list with several pages in flight"""
+        self.catalog_fetcher = DeviceCatalogFetcher(
+            hass, lambda data: self._async_mqtt_publish("P/0/center/q5", data)
+        )
+
+        """Keep the MQTT link up, with exponential backoff while the gateway is unreachable"""
+        self.connection = ConnectionManager(
+            hass, self._id, self._async_connect_client, self._is_connected, self._async_on_connected
+        )
+        self._subscribed = False
+        self._discovery_task: asyncio.Task | None = None
+        self._resync_task: asyncio.Task | None = None
+        """Number of state resynchronisations after a reconnection and duration of the last one"""
+        self.resync_count = 0
+        self.resync_seconds: float | None = None
+
+        """Counters and latency histograms of the received and published messages"""
+        self.metrics = GatewayMetrics()
+
+        """Recorder of the received traffic while a capture is running"""
+        self.recorder: TrafficRecorder | None = None
+
+        """Route each subscribed topic to its handler"""
+        self.router = TopicRouter()
+        """Responses carrying the catalog, they create and remove entities and are not replayed"""
+        self._catalog_routes = {
+            # Subscribe to device list
+            self.router.register(f"{MQTT_TOPIC_PREFIX}/center/p5", self._handle_device_list),
+            # Subscribe to scene list
+            self.router.register(f"{MQTT_TOPIC_PREFIX}/center/p28", self._handle_scene_list),
+            # Subscribe to all basic data Room list, light group list, curtain group list
+            self.router.register(f"{MQTT_TOPIC_PREFIX}/center/p33", self._handle_basic_data),
+            # Subscribe to room and light group relationship
+            self.router.register(f"{MQTT_TOPIC_PREFIX}/center/p31", self._handle_group_relation),
+        }
+        # Subscribe to device property change events
+        self.router.register("p/+/event/3", self._handle_device_state)
+
     async def connect(self):
-        """Connect to gateway internal MQTT"""
+        """Connect to gateway internal MQTT, the connection is kept up by the connection manager"""
 
-        self._hass.data[MQTT_CLIENT_INSTANCE] = MQTT(
+        self.mqtt_client = self._mqtt_factory(
             self._hass,
             self._entry,
             self._entry.data,
         )
 
-        await self._hass.data[MQTT_CLIENT_INSTANCE].async_connect()
+        self.connection.async_start()
 
         async def async_stop_mqtt(_event: Event):
             """Stop MQTT component."""
+            self._remove_stop_listener = None
             await self.disconnect()
 
-        self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_mqtt)
+        self._remove_stop_listener = self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_mqtt)
+
+    def _is_connected(self) -> bool:
+        return self.mqtt_client is not None and self.mqtt_client.connected
+
+    async def _async_connect_client(self) -> bool:
+        """Perform one connection attempt, return True once the broker accepted it.
+
+        Retries reconnect the same client, which keeps its subscriptions and subscribes them again once
+        connected, it is only rebuilt when the connection settings change"""
+
+        mqtt_client = self.mqtt_client
+        if mqtt_client.connected:
+            return True
+
+        await mqtt_client.async_connect()
+
+        while not mqtt_client.connected:
+            await asyncio.sleep(CONNECT_POLL_INTERVAL)
+
+        return True
+
+    async def _async_on_connected(self, first: bool):
+        """Called by the connection manager every time the link comes up"""
+
+        if not self._subscribed:
+            await self._async_subscribe()
+
+        if first:
+            """Initialize gateway information and synchronize child device list to HA"""
+            self._discovery_task = self._hass.async_create_task(self.async_discover())
+        elif self._discovery_task is None or self._discovery_task.done():
+            """Reports sent while the link was down are lost, fetch the current state of every device"""
+            if self._resync_task is not None and not self._resync_task.done():
+                self._resync_task.cancel()
+            self._resync_task = self._hass.async_create_task(self.async_resync_states())
+
+    async def _async_subscribe(self):
+        """Subscribe to the routed topics, the MQTT client subscribes them again by itself after a reconnection"""
+
+        discovery_topics = self.router.patterns
+        await asyncio.gather(
+            *(
+                self.mqtt_client.async_subscribe(
+                    topic,
+                    self._async_mqtt_subscribe,
+                    0,
+                    None
+                )
+                for topic in discovery_topics
+            )
+        )
+        self._subscribed = True
 
     async def disconnect(self):
         """Disconnect gateway MQTT connection"""
 
-        mqtt_client: MQTT = self._hass.data[MQTT_CLIENT_INSTANCE]
-
-        await mqtt_client.async_disconnect()
+        if self._remove_stop_listener is not None:
+            self._remove_stop_listener()
+            self._remove_stop_listener = None
+
+        await self.connection.async_stop()
+        if self._discovery_task is not None and not self._discovery_task.done():
+            self._discovery_task.cancel()
+        if self._resync_task is not None and not self._resync_task.done():
+            self._resync_task.cancel()
+
+        self.state_coalescer.async_flush()
+        self.catalog_fetcher.async_cancel()
+        self.requests.async_cancel()
+        self.light_pipeline.async_cancel()
+        self.command_queue.async_cancel()
+        await self.catalog_cache.async_flush()
+        await self.async_stop_capture()
+
+        if self.mqtt_client is not None:
+            await self.mqtt_client.async_disconnect()
+
+    async def async_unload(self):
+        """Disconnect and release the catalog and the entity handlers, called when the config entry is unloaded"""
+
+        await self.disconnect()
+
+        self.room_map.clear()
+        self.light_group_map.clear()
+        self._entities.clear()
+        self._live_ids.clear()
+        self._ready_platforms.clear()
+        self._state_handlers.clear()
+        self.group_planner.invalidate()
+        self.mqtt_client = None
 
     async def _async_mqtt_subscribe(self, msg):
         """Process received MQTT messages"""
 
-        payload = msg.payload
-        topic = msg.topic
+        if self.recorder is not None and msg.payload:
+            self.recorder.async_record(msg.topic, msg.payload)
+
+        await self._async_process_message(msg.topic, msg.payload)
+
+    async def _async_process_message(self, topic: str, payload, replay: bool = False):
+        """Process a raw message received from the gateway or replayed from a capture"""
+
+        route = self.router.resolve(topic)
+        metrics = self.metrics.topic(route.pattern if route is not None else UNROUTED)
+        metrics.received += 1
+
+        """Size of the raw payload, passed to the handlers that adapt to the size of the gateway data"""
+        payload_size = len(payload) if payload else 0
+        metrics.bytes += payload_size
 
         if payload:
+            started = time.perf_counter()
             try:
-                payload = json.loads(payload)
-            except ValueError:
+                payload = loads(payload)
+            except DecodeError:
+                metrics.dropped += 1
                 _LOGGER.warning("Unable to parse JSON: '%s'", payload)
                 return
+            metrics.parse.observe(time.perf_counter() - started)
         else:
+            metrics.dropped += 1
             _LOGGER.warning("JSON None")
             return
 
-        if topic.endswith("p5"):
-
-            start = payload["data"]["start"]
-            count = payload["data"]["count"]
-            total = payload["data"]["total"]
-
-            """Device List data"""
-            device_list = payload["data"]["list"]
-            for device in device_list:
-                device_type = device["devType"]
-                device["unique_id"] = f"{device['sn']}"
-                if device_type == 3:
-                    """Curtain"""
-                    await self._add_entity("cover", device)
-                elif device_type == 1 and self.light_device_type == "single":
-                    """Light"""
-                    device["is_group"] = False
-                    await self._add_entity("light", device)
-                elif device_type == 11:
-                    """Climate"""
-                    await self._add_entity("climate", device)
-
-            if start + count < total:
-                data = {
-                    "start": start + count,
-                    "max": DEVICE_COUNT_MAX,
-                    "devTypes": [1, 3, 11],
+        if replay and route in self._catalog_routes:
+            """A replayed catalog may come from another gateway, it must not create or remove entities, write the
+            catalog cache or answer the pending requests, only its decoding is measured"""
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.router.async_dispatch(topic, payload, payload_size)
+        except Exception:
+            metrics.failed += 1
+            raise
+        finally:
+            metrics.dispatch.observe(time.perf_counter() - started)
+            """Resolve after the handler, so a request only returns once its response has been processed"""
+            self.requests.async_resolve(topic, payload)
+
+    async def _handle_device_list(self, topic: str, payload: dict, payload_size: int):
+        """Device List data"""
+
+        device_list = await self.catalog_fetcher.async_handle_page(payload["data"], payload_size)
+
+        """Collect the devices of the page per platform, each platform adds them in one batch"""
+        covers = []
+        lights = []
+        climates = []
+        for device in device_list:
+            device_type = device["devType"]
+            device["unique_id"] = f"{device['sn']}"
+            if device_type == 3:
+                """Curtain"""
+                covers.append(device)
+            elif device_type == 1 and self.light_device_type == "single":
+                """Light"""
+                device["is_group"] = False
+                lights.append(device)
+            elif device_type == 11:
+                """Climate"""
+                climates.append(device)
+
+        await self._add_entities("cover", covers)
+        await self._add_entities("light", lights)
+        await self._add_entities("climate", climates)
+
+        if self.catalog_fetcher.complete and not self._devices_reconciled:
+            """The whole device list has been received, drop the cached devices the gateway no longer has"""
+            self._devices_reconciled = True
+            _LOGGER.info(
+                "Device list of %s received: %s devices, %s requests, %s entity batches (%s entities) so far",
+                self._id, self.catalog_fetcher.total, self.catalog_fetcher.requests,
+                self.registration_stats.batches, self.registration_stats.entities
+            )
+            self._async_remove_stale("cover")
+            self._async_remove_stale("climate")
+            self._async_remove_stale(
+                "light", lambda light: not light.get("is_group") or self.light_device_type != "group"
+            )
+
+    async def _handle_scene_list(self, topic: str, payload: dict, payload_size: int):
+        """Scene List data"""
+
+        scene_list = payload["data"]
+        for scene in scene_list:
+            scene["unique_id"] = self.scoped_id(scene["id"])
+        await self._add_entities("scene", scene_list)
+
+        self._async_remove_stale("scene")
+
+    async def _handle_device_state(self, topic: str, payload: dict, payload_size: int):
+        """Device state data"""
+
+        stats_list = payload["data"]
+        for state in stats_list:
+            self.state_coalescer.async_add(state)
+
+    @callback
+    def async_register_state_handler(self, sn: str, handler: StateHandler) -> CALLBACK_TYPE:
+        """Deliver the state reports of a device to handler, return the function removing it"""
+
+        self._state_handlers[sn] = handler
+
+        @callback
+        def async_remove():
+            if self._state_handlers.get(sn) is handler:
+                del self._state_handlers[sn]
+
+        return async_remove
+
+    @callback
+    def _async_dispatch_state(self, sn: str, state: dict):
+        """Send the merged state of a device to its entity"""
+
+        handler = self._state_handlers.get(sn)
+        if handler is None:
+            """No entity for this device, such as a device type the platforms do not support"""
+            self.metrics.unknown_sn += 1
+            return
+
+        try:
+            handler(state)
+        except Exception:
+            _LOGGER.exception("Error while applying the state of %s", sn)
+
+    async def _handle_basic_data(self, topic: str, payload: dict, payload_size: int):
+        """Basic data, including room information, light group information, curtain group information"""
+
+        """Replaced as a whole, so rooms and light groups deleted on the gateway do not stay in memory"""
+        self.room_map = {room["id"]: room for room in payload["data"]["rooms"]}
+        self.light_group_map = {lightGroup["id"]: lightGroup for lightGroup in payload["data"]["lightsSubgroups"]}
+
+        self.catalog_cache.async_set_groups(self.room_map, self.light_group_map)
+
+    async def _handle_group_relation(self, topic: str, payload: dict, payload_size: int):
+        """Relationship data for rooms and groups"""
+
+        groups = []
+        for room in payload["data"]:
+            room_id = room["room"]
+            room_name = "默认房间"
+            if room_id == 0:
+                room_name = "全屋"
+            elif room_id in self.room_map:
+                room_instance = self.room_map[room_id]
+                room_name = room_instance["name"]
+
+            for light_group_id in room["lights"]:
+                device_name = "默认灯组"
+                if light_group_id == 0:
+                    device_name = "所有灯"
+                elif light_group_id in self.light_group_map:
+                    light_group = self.light_group_map[light_group_id]
+                    device_name = light_group["name"]
+
+                group = {
+                    "unique_id": self.scoped_id(f"{room_id}-{light_group_id}"),
+                    "room": room_id,
+                    "subgroup": light_group_id,
+                    "is_group": True,
+                    "name": f"{room_name}-{device_name}",
                 }
-                await self._async_mqtt_publish("P/0/center/q5", data)
-
-        elif topic.endswith("p28"):
-            """Scene List data"""
-            scene_list = payload["data"]
-            for scene in scene_list:
-                scene["unique_id"] = f"{scene['id']}"
-                await self._add_entity("scene", scene)
-        elif topic.endswith("event/3"):
-            """Device state data"""
-            stats_list = payload["data"]
-            for state in stats_list:
-                async_dispatcher_send(
-                    self._hass, EVENT_ENTITY_STATE_UPDATE.format(state["sn"]), state
-                )
-        elif topic.endswith("p33"):
-            """Basic data, including room information, light group information, curtain group information"""
-            for room in payload["data"]["rooms"]:
-                self.room_map[room["id"]] = room
-            for lightGroup in payload["data"]["lightsSubgroups"]:
-                self.light_group_map[lightGroup["id"]] = lightGroup
-        elif topic.endswith("p31"):
-            """Relationship data for rooms and groups"""
-            for room in payload["data"]:
-                room_id = room["room"]
-                room_name = "默认房间"
-                if room_id == 0:
-                    room_name = "全屋"
-                elif room_id in self.room_map:
-                    room_instance = self.room_map[room_id]
-                    room_name = room_instance["name"]
-
-                for light_group_id in room["lights"]:
-                    device_name = "默认灯组"
-                    if light_group_id == 0:
-                        device_name = "所有灯"
-                    elif light_group_id in self.light_group_map:
-                        light_group = self.light_group_map[light_group_id]
-                        device_name = light_group["name"]
-
-                    group = {
-                        "unique_id": f"{room_id}-{light_group_id}",
-                        "room": room_id,
-                        "subgroup": light_group_id,
-                        "is_group": True,
-                        "name": f"{room_name}-{device_name}",
-                    }
-                    await self._add_entity("light", group)
-
-    async def _add_entity(self, component: str, device: dict):
-        """Add child device information"""
+                groups.append(group)
+
+        await self._add_entities("light", groups)
+
+        self._async_remove_stale("light", lambda light: light.get("is_group"))
+
+    async def async_load_cache(self):
+        """Load the last known catalog, its entities are created as soon as their platform is ready"""
+
+        if not await self.catalog_cache.async_load():
+            return
+
+        self.room_map.update(self.catalog_cache.room_map)
+        self.light_group_map.update(self.catalog_cache.light_group_map)
+
+        for component, entity_map in self.catalog_cache.entities.items():
+            self._entities.setdefault(component, {}).update(entity_map)
+
+        _LOGGER.debug("Loaded %s cached entities", sum(len(item) for item in self._entities.values()))
+
+    @callback
+    def async_platform_ready(self, component: str):
+        """Called by a platform once it listens for new entities, create the entities already known"""
+
+        self._ready_platforms.add(component)
+
+        self._async_dispatch_entities(component, list(self._entities.get(component, {}).values()))
+
+    async def _add_entities(self, component: str, devices: list[dict]):
+        """Add child device information, the new devices are sent to their platform in one batch"""
+
+        known = self._entities.setdefault(component, {})
+        live_ids = self._live_ids.setdefault(component, set())
+
+        new_devices = []
+        for device in devices:
+            unique_id = device["unique_id"]
+            live_ids.add(unique_id)
+            self.catalog_cache.async_set_entity(component, device)
+
+            if unique_id in known:
+                """Already created (from the cache), only refresh its payload and state"""
+                known[unique_id] = device
+                if "sn" in device and component != "scene":
+                    self.state_coalescer.async_add(device)
+                continue
+
+            known[unique_id] = device
+            new_devices.append(device)
+
+        if component in self._ready_platforms:
+            self._async_dispatch_entities(component, new_devices)
+
+        if component == "light":
+            self.group_planner.invalidate()
+
+    @callback
+    def _async_dispatch_entities(self, component: str, devices: list[dict]):
+        if not devices:
+            return
+
         async_dispatcher_send(
-            self._hass, EVENT_ENTITY_REGISTER.format(component), device
+            self._hass, EVENT_ENTITY_REGISTER.format(self._entry.entry_id, component), devices
+        )
+        self.registration_stats.batches += 1
+        self.registration_stats.entities += len(devices)
+
+    @callback
+    def _async_remove_stale(self, component: str, predicate=None):
+        """Remove the entities of a platform that the gateway did not report during the last refresh"""
+
+        live_ids = self._live_ids.get(component, set())
+        known = self._entities.get(component, {})
+        registry = entity_registry.async_get(self._hass)
+        removed = False
+
+        for unique_id, device in list(known.items()):
+            if unique_id in live_ids or (predicate is not None and not predicate(device)):
+                continue
+
+            _LOGGER.info("Removing %s %s which is no longer reported by the gateway", component, unique_id)
+            known.pop(unique_id)
+            removed = True
+            self.catalog_cache.async_remove_entity(component, unique_id)
+
+            entity_id = registry.async_get_entity_id(component, DOMAIN, unique_id)
+            if entity_id is not None:
+                registry.async_remove(entity_id)
+
+        if removed and component == "light":
+            """A room or light group command must not stand for a light that is gone"""
+            self.group_planner.invalidate()
+
+    def scoped_id(self, local_id) -> str:
+        """unique_id of a scene or light group, whose ids are only unique within a gateway.
+
+        Entries created before several gateways were supported have no unique_id and keep the bare ids,
+        so their existing entities are not recreated"""
+        if self._entry.unique_id:
+            return f"{self._entry.unique_id}-{local_id}"
+        return f"{local_id}"
+
+    def capture_path(self) -> str:
+        """Default capture file of the gateway, in the configuration directory"""
+        return self._hass.config.path(f"{DOMAIN}_{self._entry.entry_id}.capture")
+
+    @callback
+    def async_start_capture(self, path: str | None = None) -> str:
+        """Start recording the received traffic, return the capture file"""
+
+        if self.recorder is None:
+            self.recorder = TrafficRecorder(self._hass, path or self.capture_path())
+            _LOGGER.info("Capturing the traffic of %s to %s", self._id, self.recorder.path)
+        return self.recorder.path
+
+    async def async_stop_capture(self):
+        """Stop recording and write the buffered messages"""
+
+        recorder = self.recorder
+        if recorder is None:
+            return
+        self.recorder = None
+        await recorder.async_flush()
+        _LOGGER.info(
+            "Capture of %s stopped: %s messages, %s bytes in %s", self._id, recorder.frames, recorder.bytes,
+            recorder.path
+        )
+
+    async def async_replay_capture(self, path: str | None = None, speed: float = 1.0) -> int:
+        """Feed a capture to the integration as if the gateway had sent it, speed 0 replays as fast as possible.
+
+        The state reports reach the entities of this gateway, the catalog responses are only decoded"""
+
+        path = path or self.capture_path()
+        started = time.monotonic()
+        count = await async_replay(
+            self._hass, path, lambda topic, payload: self._async_process_message(topic, payload, replay=True), speed
         )
+        _LOGGER.info("Replayed %s messages of %s in %.2fs", count, path, time.monotonic() - started)
+        return count
 
     async def reconnect(self, entry: ConfigEntry):
-        """Reconnect gateway MQTT"""
-        mqtt_client: MQTT = self._hass.data[MQTT_CLIENT_INSTANCE]
+        """Reconnect gateway MQTT with the updated connection information"""
+        mqtt_client = self.mqtt_client
+        if mqtt_client is None:
+            return
         mqtt_client.conf = entry.data
         await mqtt_client.async_disconnect()
         mqtt_client.init_client()
-        await mqtt_client.async_connect()
+        self.connection.async_check_now()
 
-    async def init(self, entry: ConfigEntry):
-        """Initialize the gateway business logic, including subscribing to device data, scene data, and basic data,
-        and sending data reporting instructions to the gateway"""
+    async def async_discover(self):
+        """Refresh the device, scene and group catalog.
 
-        mqtt_connected = self._hass.data[MQTT_CLIENT_INSTANCE].connected
-        _LOGGER.warning(mqtt_connected)
+        The independent queries are sent at the same time, and the room and light group relationship
+        is queried as soon as the rooms and light groups it refers to have been processed"""
 
-        while not mqtt_connected:
-            await self.reconnect(entry)
-            await asyncio.sleep(1)
-            mqtt_connected = self._hass.data[MQTT_CLIENT_INSTANCE].connected
-            _LOGGER.warning(mqtt_connected)
+        """Start a refresh, the entities not reported again are removed once it is complete"""
+        self._live_ids = {}
+        self._devices_reconciled = False
 
-        discovery_topics = [
-            # Subscribe to device list
-            f"{MQTT_TOPIC_PREFIX}/center/p5",
-            # Subscribe to scene list
-            f"{MQTT_TOPIC_PREFIX}/center/p28",
-            # Subscribe to all basic data Room list, light group list, curtain group list
-            f"{MQTT_TOPIC_PREFIX}/center/p33",
-            # Subscribe to room and light group relationship
-            f"{MQTT_TOPIC_PREFIX}/center/p31",
-            # Subscribe to device property change events
-            "p/+/event/3",
+        started = time.monotonic()
+        phases = [
+            # publish payload to get device list
+            self._async_discovery_phase("devices", started, self._async_discover_devices()),
+            # publish payload to get scene list
+            self._async_discovery_phase("scenes", started, self.async_request(
+                "P/0/center/q28", {}, retries=DISCOVERY_REQUEST_RETRIES
+            )),
         ]
-        await asyncio.gather(
-            *(
-                self._hass.data[MQTT_CLIENT_INSTANCE].async_subscribe(
-                    topic,
-                    self._async_mqtt_subscribe,
-                    0,
-                    "utf-8"
-                )
-                for topic in discovery_topics
+        if self.light_device_type == "group":
+            phases.append(self._async_discovery_phase("groups", started, self._async_discover_groups()))
+
+        await asyncio.gather(*phases)
+
+        _LOGGER.info("Discovery of %s finished in %.2fs", self._id, time.monotonic() - started)
+
+    async def async_resync_states(self) -> bool:
+        """Fetch the current state of every device and apply it in one pass, return True if all were received.
+
+        The pages of the device list carry the state of the devices, they are fetched with the pipelined
+        paging of the discovery and reach the entities through the state coalescer, which holds them (and
+        the live reports received meanwhile) until the list is complete or RESYNC_HOLD_MAX has passed"""
+
+        started = time.monotonic()
+        self.state_coalescer.async_hold()
+        release = self._hass.loop.call_later(RESYNC_HOLD_MAX, self.state_coalescer.async_release)
+        try:
+            await self.catalog_fetcher.async_start()
+            complete = await self.catalog_fetcher.async_wait(RESYNC_TIMEOUT)
+        finally:
+            release.cancel()
+            self.state_coalescer.async_release()
+
+        self.resync_count += 1
+        self.resync_seconds = time.monotonic() - started
+        if complete:
+            _LOGGER.info(
+                "State of %s devices of %s resynchronised in %.2fs with %s requests",
+                self.catalog_fetcher.total, self._id, self.resync_seconds, self.catalog_fetcher.requests
             )
+        else:
+            _LOGGER.warning("State of %s only partly resynchronised after %.2fs", self._id, self.resync_seconds)
+        return complete
+
+    async def _async_discover_devices(self):
+        await self.catalog_fetcher.async_start()
+        if not await self.catalog_fetcher.async_wait(DISCOVERY_TIMEOUT):
+            raise asyncio.TimeoutError("Device list incomplete")
+
+    async def _async_discover_groups(self):
+        # publish payload to get all basic data Room list, light group list, curtain group list
+        await self.async_request("P/0/center/q33", {}, retries=DISCOVERY_REQUEST_RETRIES)
+        # publish payload to get room and light group relationship, which needs the rooms and light groups
+        await self.async_request("P/0/center/q31", {}, retries=DISCOVERY_REQUEST_RETRIES)
+
+    async def _async_discovery_phase(self, name: str, started: float, phase):
+        """Run a discovery phase and log the time it took"""
+
+        try:
+            await phase
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Discovery of %s: %s not received after %.2fs", self._id, name, time.monotonic() - started)
+        else:
+            _LOGGER.info("Discovery of %s: %s received after %.2fs", self._id, name, time.monotonic() - started)
+
+    async def async_request(self, topic: str, data: dict, timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                            retries: int = 0) -> dict:
+        """Send a query to the gateway and wait for its response"""
+        return await self.requests.async_request(topic, data, timeout, retries)
+
+    async def async_publish_command(self, command: CommandEnvelope, data: dict | None = None,
+                                    key: str | None = None, gap: float = 0) -> int:
+        """Publish an entity command, return the sequence number it was sent with.
+
+        Commands with a key are sent in order through the queue of that key, and the next command of the
+        same key waits gap seconds after this one"""
+
+        if key is None:
+            return await self._async_publish_command(command, data)
+
+        return await self.command_queue.async_send(
+            key, lambda: self._async_publish_command(command, data), gap
         )
 
-        if mqtt_connected:
-            # publish payload to get device list
-            data = {
-                "start": 0,
-                "max": DEVICE_COUNT_MAX,
-                "devTypes": [1, 3, 11],
-            }
-            await self._async_mqtt_publish("P/0/center/q5", data)
-            # publish payload to get scene list
-            await self._async_mqtt_publish("P/0/center/q28", {})
-            if self.light_device_type == "group":
-                # publish payload to get all basic data Room list, light group list, curtain group list
-                await self._async_mqtt_publish("P/0/center/q33", {})
-                # publish payload to get room and light group relationship
-                await asyncio.sleep(5)
-                await self._async_mqtt_publish("P/0/center/q31", {})
-
-    async def _async_mqtt_publish(self, topic: str, data: dict):
+    async def _async_send_group_commands(self, commands: dict[str, dict]) -> set[str]:
+        """Send the light commands of a batch that cover whole rooms or light groups as group commands,
+        return the lights taken care of"""
+
+        group_commands, covered = self.group_planner.plan(commands)
+        if group_commands:
+            _LOGGER.debug("Sending %s group commands instead of %s light commands", len(group_commands), len(covered))
+            await asyncio.gather(*(
+                self.async_publish_command(
+                    command, data, key=self.scoped_id("-".join(map(str, command.fixed.values())))
+                )
+                for command, data in group_commands
+            ))
+        return covered
+
+    async def _async_publish_command(self, command: CommandEnvelope, data: dict | None) -> int:
+        seq = self.requests.next_seq()
+        self.metrics.record_publish(command.topic)
+        await self.mqtt_client.async_publish(
+            command.topic,
+            command.encode(data, seq),
+            0,
+            False
+        )
+        return seq
+
+    async def _async_mqtt_publish(self, topic: str, data: dict, seq: int | None = None):
         query_device_payload = {
-            "seq": 1,
+            "seq": seq if seq is not None else self.requests.next_seq(),
             "rspTo": MQTT_TOPIC_PREFIX,
             "data": data
         }
-        await self._hass.data[MQTT_CLIENT_INSTANCE].async_publish(
+        self.metrics.record_publish(topic)
+        await self.mqtt_client.async_publish(
             topic,
-            json.dumps(query_device_payload),
+            dumps(query_device_payload),
             0,
             False
         )
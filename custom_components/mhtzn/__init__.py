@@ -3,27 +3,102 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import pathlib
+
+import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
 
 from .Gateway import Gateway
-from .const import PLATFORMS, MQTT_CLIENT_INSTANCE, CONF_LIGHT_DEVICE_TYPE, DOMAIN, FLAG_IS_INITIALIZED, \
-    CACHE_ENTITY_STATE_UPDATE_KEY_DICT
+from .const import PLATFORMS, CONF_LIGHT_DEVICE_TYPE, DOMAIN, SERVICE_START_CAPTURE, SERVICE_STOP_CAPTURE, \
+    SERVICE_REPLAY_CAPTURE, SERVICE_PROFILE
+from .profiler import async_profile, METHOD_SAMPLING, METHOD_DETERMINISTIC
+from .util import gateway_options
 
 _LOGGER = logging.getLogger(__name__)
 
+ATTR_PATH = "path"
+
+ATTR_SPEED = "speed"
+
+ATTR_DURATION = "duration"
+
+ATTR_METHOD = "method"
+
+ATTR_INTERVAL = "interval"
+
+CAPTURE_SCHEMA = vol.Schema({vol.Optional(ATTR_PATH): cv.string})
+
+REPLAY_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_PATH): cv.string,
+    vol.Optional(ATTR_SPEED, default=1.0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+})
+
+PROFILE_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_DURATION, default=30): vol.All(vol.Coerce(float), vol.Range(min=1, max=600)),
+    vol.Optional(ATTR_METHOD, default=METHOD_SAMPLING): vol.In([METHOD_SAMPLING, METHOD_DETERMINISTIC]),
+    vol.Optional(ATTR_INTERVAL, default=5): vol.All(vol.Coerce(float), vol.Range(min=1, max=100)),
+})
+
 
 async def _async_config_entry_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """This method is triggered when the entry configuration changes, and the gateway connection is updated"""
 
-    hub = hass.data[DOMAIN][entry.unique_id]
+    hub = hass.data[DOMAIN][entry.entry_id]
+    if hub.options != gateway_options(entry):
+        """The tunables of the options flow are used when the gateway is set up"""
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
     """reconnect gateway"""
     await hub.reconnect(entry)
-    """Initialize gateway information and synchronize child device list to HA"""
-    hass.async_create_task(
-        hub.init(entry)
-    )
+
+
+def _capture_path(hass: HomeAssistant, call: ServiceCall) -> str | None:
+    """Capture file of a service call, relative paths are in the configuration directory.
+
+    Files in the configuration directory, where the default captures are written, and in the allowed external
+    directories are accepted"""
+
+    path = call.data.get(ATTR_PATH)
+    if path is None:
+        return None
+    path = hass.config.path(path)
+    config_dir = pathlib.Path(hass.config.config_dir).resolve()
+    if not pathlib.Path(path).resolve().is_relative_to(config_dir) and not hass.config.is_allowed_path(path):
+        raise HomeAssistantError(f"Access to {path} is not allowed")
+    return path
+
+
+def _async_register_services(hass: HomeAssistant) -> None:
+    """Register the services, the capture services apply to every gateway"""
+
+    if hass.services.has_service(DOMAIN, SERVICE_START_CAPTURE):
+        return
+
+    async def async_start_capture(call: ServiceCall) -> None:
+        path = _capture_path(hass, call)
+        for hub in hass.data[DOMAIN].values():
+            hub.async_start_capture(path if len(hass.data[DOMAIN]) == 1 else None)
+
+    async def async_stop_capture(call: ServiceCall) -> None:
+        await asyncio.gather(*(hub.async_stop_capture() for hub in hass.data[DOMAIN].values()))
+
+    async def async_replay_capture(call: ServiceCall) -> None:
+        path = _capture_path(hass, call)
+        await asyncio.gather(*(
+            hub.async_replay_capture(path, call.data[ATTR_SPEED]) for hub in hass.data[DOMAIN].values()
+        ))
+
+    async def async_run_profile(call: ServiceCall) -> None:
+        await async_profile(hass, call.data[ATTR_DURATION], call.data[ATTR_METHOD], call.data[ATTR_INTERVAL] / 1000)
+
+    hass.services.async_register(DOMAIN, SERVICE_START_CAPTURE, async_start_capture, schema=CAPTURE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_CAPTURE, async_stop_capture)
+    hass.services.async_register(DOMAIN, SERVICE_REPLAY_CAPTURE, async_replay_capture, schema=REPLAY_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE, async_run_profile, schema=PROFILE_SCHEMA)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -31,33 +106,22 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     hub = Gateway(hass, entry)
 
-    hass.data.setdefault(DOMAIN, {})[entry.unique_id] = hub
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = hub
 
-    """Set a flag to record whether the current integration has been initialized"""
-    if FLAG_IS_INITIALIZED not in hass.data:
-        hass.data[FLAG_IS_INITIALIZED] = False
+    """Load the last known catalog so entities are available before the gateway has answered"""
+    await hub.async_load_cache()
 
-    """Set a dictionary to record whether the sub-device state change event has been created, 
-    to avoid the same device from repeatedly creating state change events"""
-    if CACHE_ENTITY_STATE_UPDATE_KEY_DICT not in hass.data:
-        hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT] = {}
+    """Every gateway has its own platforms, bound to its config entry"""
+    hass.config_entries.async_setup_platforms(entry, PLATFORMS)
 
-    """Determine whether the current integration has been initialized to avoid repeated installation of platform list"""
-    if not hass.data[FLAG_IS_INITIALIZED]:
-        hass.data[FLAG_IS_INITIALIZED] = True
-        hass.config_entries.async_setup_platforms(entry, PLATFORMS)
+    _async_register_services(hass)
 
-    """Connection gateway"""
+    """Connection gateway, the gateway information and child device list are synchronized once connected"""
     await hub.connect()
 
-    """Initialize gateway information and synchronize child device list to HA"""
-    hass.async_create_task(
-        hub.init(entry)
-    )
-
     """Add an entry configuration change event listener to trigger the specified method 
     when the configuration changes"""
-    entry.add_update_listener(_async_config_entry_updated)
+    entry.async_on_unload(entry.add_update_listener(_async_config_entry_updated))
 
     return True
 
@@ -65,8 +129,16 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """This method is triggered when the entry is unload"""
 
-    hub = hass.data[DOMAIN].pop(entry.unique_id)
-    """Perform a gateway disconnect operation"""
-    await hub.disconnect()
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if not unload_ok:
+        return False
+
+    hub = hass.data[DOMAIN].pop(entry.entry_id)
+    """Perform a gateway disconnect operation and release everything it holds"""
+    await hub.async_unload()
+
+    if not hass.data[DOMAIN]:
+        for service in (SERVICE_START_CAPTURE, SERVICE_STOP_CAPTURE, SERVICE_REPLAY_CAPTURE, SERVICE_PROFILE):
+            hass.services.async_remove(DOMAIN, service)
 
     return True
@@ -0,0 +1,99 @@
+"""Persistent cache of the device, scene and group catalog of a gateway"""
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+
+"""Seconds to wait before writing changes, so a whole discovery is written at once"""
+SAVE_DELAY = 10
+
+
+class CatalogCache:
+    """Last known catalog of a gateway, stored with the Home Assistant storage helper.
+
+    Entities are created from it right after setup, and it is kept up to date by the live discovery,
+    so the next start does not have to wait for the gateway to answer."""
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.catalog")
+
+        """unique_id -> discovery payload, per platform"""
+        self.entities: dict[str, dict[str, dict]] = {}
+        self.room_map: dict[int, dict] = {}
+        self.light_group_map: dict[int, dict] = {}
+
+        self._dirty = False
+
+    async def async_load(self) -> bool:
+        """Load the cached catalog, return True if one was found"""
+
+        try:
+            data = await self._store.async_load()
+        except Exception:
+            _LOGGER.exception("Unable to load the cached gateway catalog")
+            return False
+
+        if not data:
+            return False
+
+        self.entities = {
+            component: {entity["unique_id"]: entity for entity in entity_list}
+            for component, entity_list in data.get("entities", {}).items()
+        }
+        self.room_map = {room["id"]: room for room in data.get("rooms", [])}
+        self.light_group_map = {group["id"]: group for group in data.get("light_groups", [])}
+
+        return True
+
+    @callback
+    def async_set_entity(self, component: str, payload: dict) -> None:
+        """Record the discovery payload of an entity"""
+
+        self.entities.setdefault(component, {})[payload["unique_id"]] = payload
+        self._async_schedule_save()
+
+    @callback
+    def async_remove_entity(self, component: str, unique_id: str) -> None:
+        if self.entities.get(component, {}).pop(unique_id, None) is not None:
+            self._async_schedule_save()
+
+    @callback
+    def async_set_groups(self, room_map: dict[int, dict], light_group_map: dict[int, dict]) -> None:
+        """Record the rooms and light groups"""
+
+        self.room_map = dict(room_map)
+        self.light_group_map = dict(light_group_map)
+        self._async_schedule_save()
+
+    async def async_flush(self) -> None:
+        """Write pending changes now"""
+
+        if self._dirty:
+            await self._store.async_save(self._data_to_save())
+
+    @callback
+    def _async_schedule_save(self) -> None:
+        self._dirty = True
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        self._dirty = False
+        return {
+            "entities": {
+                component: list(entity_map.values())
+                for component, entity_map in self.entities.items()
+            },
+            "rooms": list(self.room_map.values()),
+            "light_groups": list(self.light_group_map.values()),
+        }
@@ -0,0 +1,172 @@
+"""Capture of the raw gateway traffic to a rotating file, and its replay"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import Awaitable, Callable, Iterator
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"MHTZNCAP1\n"
+
+"""Frame header: wall clock time of reception, topic length, payload length. Topic and payload follow as is"""
+FRAME_HEADER = struct.Struct("<dHI")
+
+"""Size of a capture file before it is rotated, and number of rotated files kept"""
+CAPTURE_MAX_BYTES = 10 * 1024 * 1024
+
+CAPTURE_BACKUPS = 3
+
+"""Captured frames are written from the executor at most every FLUSH_INTERVAL seconds, or once
+FLUSH_BYTES are buffered"""
+FLUSH_INTERVAL = 1
+
+FLUSH_BYTES = 256 * 1024
+
+Handler = Callable[[str, bytes], Awaitable[object]]
+
+
+def capture_files(path: str, backups: int = CAPTURE_BACKUPS) -> list[str]:
+    """Existing files of a capture, oldest first"""
+    candidates = [f"{path}.{index}" for index in range(backups, 0, -1)] + [path]
+    return [candidate for candidate in candidates if os.path.exists(candidate)]
+
+
+def read_capture(path: str, backups: int = CAPTURE_BACKUPS) -> Iterator[tuple[float, str, bytes]]:
+    """Frames (timestamp, topic, payload) of a capture and its rotated files, oldest first"""
+
+    for file_path in capture_files(path, backups):
+        with open(file_path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                _LOGGER.warning("%s is not a gateway capture, skipped", file_path)
+                continue
+            while True:
+                header = file.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                timestamp, topic_size, payload_size = FRAME_HEADER.unpack(header)
+                topic = file.read(topic_size)
+                payload = file.read(payload_size)
+                if len(payload) < payload_size:
+                    """Truncated by a crash while writing"""
+                    break
+                yield timestamp, topic.decode(), payload
+
+
+class TrafficRecorder:
+    """Append the received topics and payloads to a capture file, rotated once it reaches max_bytes.
+
+    Frames are buffered in memory and written from the executor, so recording costs the event loop
+    one struct.pack per message."""
+
+    def __init__(self, hass: HomeAssistant, path: str, max_bytes: int = CAPTURE_MAX_BYTES,
+                 backups: int = CAPTURE_BACKUPS) -> None:
+        self._hass = hass
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._buffer = bytearray()
+        self._handle: asyncio.TimerHandle | None = None
+        self._lock = asyncio.Lock()
+
+        """Number of frames recorded and bytes written"""
+        self.frames = 0
+        self.bytes = 0
+
+    @callback
+    def async_record(self, topic: str, payload: bytes | str) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        topic_bytes = topic.encode()
+
+        self._buffer += FRAME_HEADER.pack(time.time(), len(topic_bytes), len(payload))
+        self._buffer += topic_bytes
+        self._buffer += payload
+        self.frames += 1
+
+        if len(self._buffer) >= FLUSH_BYTES:
+            self._async_schedule_flush(0)
+        elif self._handle is None:
+            self._async_schedule_flush(FLUSH_INTERVAL)
+
+    @callback
+    def _async_schedule_flush(self, delay: float) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = self._hass.loop.call_later(
+            delay, lambda: self._hass.async_create_task(self.async_flush())
+        )
+
+    async def async_flush(self) -> None:
+        """Write the buffered frames"""
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        async with self._lock:
+            if not self._buffer:
+                return
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            try:
+                await self._hass.async_add_executor_job(self._write, data)
+            except OSError as err:
+                _LOGGER.error("Unable to write the gateway capture %s: %s", self.path, err)
+            else:
+                self.bytes += len(data)
+
+    def _write(self, data: bytes) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+
+        if size and size + len(data) > self._max_bytes:
+            self._rotate()
+            size = 0
+
+        with open(self.path, "ab") as file:
+            if not size:
+                file.write(MAGIC)
+            file.write(data)
+
+    def _rotate(self) -> None:
+        for index in range(self._backups, 0, -1):
+            source = f"{self.path}.{index - 1}" if index > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if not self._backups:
+            os.remove(self.path)
+
+
+async def async_replay(hass: HomeAssistant, path: str, handler: Handler, speed: float = 1.0) -> int:
+    """Feed a capture to handler(topic, payload), speed times faster than recorded, 0 for as fast as possible.
+
+    Return the number of replayed messages"""
+
+    frames = await hass.async_add_executor_job(lambda: list(read_capture(path)))
+    if not frames:
+        return 0
+
+    first = frames[0][0]
+    started = time.monotonic()
+    for timestamp, topic, payload in frames:
+        if speed > 0:
+            delay = (timestamp - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            """Still let the event loop run the timers, such as the state coalescer"""
+            await asyncio.sleep(0)
+        try:
+            await handler(topic, payload)
+        except Exception:
+            _LOGGER.exception("Error while replaying a message of %s", topic)
+
+    return len(frames)
@@ -0,0 +1,258 @@
+"""Pipelined and adaptive paging of the device list (q5/p5) of the gateway"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DEVICE_COUNT_MAX
+
+_LOGGER = logging.getLogger(__name__)
+
+DEVICE_TYPES = [1, 3, 11]
+
+"""Bounds of the adaptive page size"""
+PAGE_SIZE_MIN = 20
+
+PAGE_SIZE_MAX = 500
+
+"""Largest payload a single page should produce"""
+PAGE_TARGET_BYTES = 64 * 1024
+
+"""Time a single page should take to arrive, used with the measured throughput to size the pages"""
+PAGE_TARGET_SECONDS = 0.5
+
+"""Number of pages requested at the same time once the total is known"""
+PAGE_WINDOW = 4
+
+"""Seconds to wait for a page before requesting it again"""
+PAGE_TIMEOUT = 5
+
+PAGE_RETRIES = 3
+
+
+class _PageRequest:
+    """A q5 request waiting for its p5 page"""
+
+    __slots__ = ("start", "count", "sent", "attempts", "timer")
+
+    def __init__(self, start: int, count: int, attempts: int) -> None:
+        self.start = start
+        self.count = count
+        self.sent = time.monotonic()
+        self.attempts = attempts
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class DeviceCatalogFetcher:
+    """Fetch the complete device list of the gateway in as few round trips as possible.
+
+    The first page is requested alone to learn the total. Then up to PAGE_WINDOW pages are kept in
+    flight. The page size follows the measured payload size per device and the throughput of the
+    previous pages. Pages that do not arrive in time, or arrive with fewer devices than requested, are
+    requested again, and devices received twice are only reported once."""
+
+    def __init__(self, hass: HomeAssistant, publish: Callable[[dict], Awaitable[None]]) -> None:
+        self._hass = hass
+        self._publish = publish
+
+        self.page_size = DEVICE_COUNT_MAX
+        self.total: int | None = None
+
+        self._received: bytearray = bytearray()
+        self._received_count = 0
+        self._next_start = 0
+        self._in_flight: dict[int, _PageRequest] = {}
+        self._seen: set[str] = set()
+        self._done = asyncio.Event()
+        self._failed = False
+
+        """Counters of the last fetch"""
+        self.requests = 0
+        self.retries = 0
+        self.duplicates = 0
+
+    @property
+    def complete(self) -> bool:
+        """True when every device of the last fetch has been received"""
+        return self._done.is_set() and not self._failed
+
+    async def async_start(self) -> None:
+        """Start fetching the device list from the beginning"""
+
+        self._cancel_timers()
+        self.total = None
+        self._received = bytearray()
+        self._received_count = 0
+        self._next_start = 0
+        self._in_flight = {}
+        self._seen = set()
+        self._done = asyncio.Event()
+        self._failed = False
+        self.requests = 0
+        self.retries = 0
+        self.duplicates = 0
+
+        await self._async_request(0, self.page_size)
+
+    async def async_wait(self, timeout: float | None = None) -> bool:
+        """Wait for the fetch to finish, return True if every device has been received"""
+
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self._failed
+
+    @callback
+    def async_cancel(self) -> None:
+        """Stop waiting for outstanding pages"""
+
+        self._cancel_timers()
+        self._in_flight = {}
+
+    async def async_handle_page(self, data: dict, payload_size: int) -> list[dict]:
+        """Process a p5 page, return the devices that were not received before"""
+
+        start = int(data["start"])
+        total = int(data["total"])
+        device_list = data["list"]
+        received = len(device_list)
+
+        request = self._in_flight.pop(start, None)
+        if request is not None:
+            if request.timer is not None:
+                request.timer.cancel()
+            if received:
+                self._adapt_page_size(payload_size, received, time.monotonic() - request.sent)
+
+        if self.total is None or total != self.total:
+            self._set_total(total)
+
+        end = min(start + received, self.total)
+        for index in range(start, end):
+            if not self._received[index]:
+                self._received[index] = 1
+                self._received_count += 1
+
+        if request is not None and start + received < min(start + request.count, self.total):
+            """The gateway returned a short page, request the rest of it again"""
+            self._next_start = min(self._next_start, start + received)
+
+        devices = []
+        for device in device_list:
+            sn = device["sn"]
+            if sn in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(sn)
+            devices.append(device)
+
+        await self._async_fill()
+
+        return devices
+
+    def _set_total(self, total: int) -> None:
+        """Size the received map when the total becomes known (or changes)"""
+
+        received = self._received[:total]
+        received.extend(bytes(max(total - len(received), 0)))
+        self._received = received
+        self._received_count = sum(received)
+        self.total = total
+
+    def _adapt_page_size(self, payload_size: int, received: int, latency: float) -> None:
+        """Size the next pages from the measured payload size and throughput"""
+
+        bytes_per_device = max(payload_size / received, 1)
+
+        page_bytes = PAGE_TARGET_BYTES
+        if latency > 0:
+            page_bytes = min(page_bytes, payload_size / latency * PAGE_TARGET_SECONDS)
+
+        size = int(page_bytes / bytes_per_device)
+        self.page_size = max(PAGE_SIZE_MIN, min(PAGE_SIZE_MAX, size))
+
+    def _next_missing(self) -> int | None:
+        """First index from the cursor that was neither received nor requested"""
+
+        requested = [(request.start, request.start + request.count) for request in self._in_flight.values()]
+        index = self._next_start
+        while index < self.total:
+            if self._received[index]:
+                index += 1
+                continue
+            for start, end in requested:
+                if start <= index < end:
+                    index = end
+                    break
+            else:
+                return index
+        return None
+
+    async def _async_fill(self) -> None:
+        """Keep the request window full until every page has been requested"""
+
+        if self.total is None or self._done.is_set():
+            return
+
+        while len(self._in_flight) < PAGE_WINDOW:
+            start = self._next_missing()
+            if start is None:
+                self._next_start = self.total
+                break
+            count = self.page_size
+            self._next_start = start + count
+            await self._async_request(start, count)
+
+        if self._received_count >= self.total:
+            self._cancel_timers()
+            self._in_flight = {}
+            self._done.set()
+        elif not self._in_flight:
+            """Nothing left to request but devices are missing, go over the list again"""
+            self._next_start = 0
+            if self._next_missing() is not None:
+                await self._async_fill()
+
+    async def _async_request(self, start: int, count: int, attempts: int = 0) -> None:
+        """Publish a q5 request for a page"""
+
+        request = _PageRequest(start, count, attempts)
+        request.timer = self._hass.loop.call_later(
+            PAGE_TIMEOUT, lambda: self._hass.async_create_task(self._async_retry(start))
+        )
+        self._in_flight[start] = request
+        self.requests += 1
+
+        await self._publish({
+            "start": start,
+            "max": count,
+            "devTypes": DEVICE_TYPES,
+        })
+
+    async def _async_retry(self, start: int) -> None:
+        """Request a page again when it did not arrive in time"""
+
+        request = self._in_flight.pop(start, None)
+        if request is None:
+            return
+
+        if request.attempts >= PAGE_RETRIES:
+            _LOGGER.warning("Device page %s-%s did not arrive after %s attempts",
+                            start, start + request.count, request.attempts + 1)
+            if not self._in_flight:
+                self._failed = True
+                self._done.set()
+            return
+
+        self.retries += 1
+        await self._async_request(start, request.count, request.attempts + 1)
+
+    def _cancel_timers(self) -> None:
+        for request in self._in_flight.values():
+            if request.timer is not None:
+                request.timer.cancel()
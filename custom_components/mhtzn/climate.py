@@ -1,9 +1,7 @@
 """Business logic for climate entity."""
 from __future__ import annotations
 
-import json
 import logging
-import time
 from abc import ABC
 
 from homeassistant.components.climate import ClimateEntity, HVACMode, ClimateEntityFeature, FAN_LOW, FAN_MEDIUM, \
@@ -17,13 +15,26 @@ from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DOMAIN, MQTT_CLIENT_INSTANCE, EVENT_ENTITY_STATE_UPDATE, CACHE_ENTITY_STATE_UPDATE_KEY_DICT, \
-    EVENT_ENTITY_REGISTER, MANUFACTURER
+from .codec import CommandEnvelope
+from .const import DOMAIN, EVENT_ENTITY_REGISTER, MANUFACTURER
+from .entity import StateChangeMixin
 
 _LOGGER = logging.getLogger(__name__)
 
 COMPONENT = "climate"
 
+"""Seconds between powering on a unit and sending its mode"""
+POWER_ON_DELAY = 1
+
+"""Mode value (a66) of each HVAC mode other than off"""
+HVAC_MODE_VALUES = {
+    HVAC_MODE_AUTO: 0,
+    HVAC_MODE_COOL: 1,
+    HVAC_MODE_HEAT: 2,
+    HVAC_MODE_FAN_ONLY: 3,
+    HVAC_MODE_DRY: 4,
+}
+
 
 async def async_setup_entry(
         hass: HomeAssistant,
@@ -33,18 +44,24 @@ async def async_setup_entry(
     """This method is executed after the integration is initialized to create an event listener,
     which is used to create a sub-device"""
 
-    async def async_discover(config_payload):
+    async def async_discover(config_payloads: list[dict]):
         try:
-            async_add_entities([CustomClimate(hass, config_payload, config_entry)])
+            async_add_entities(
+                [CustomClimate(hass, config_payload, config_entry) for config_payload in config_payloads]
+            )
         except Exception:
             raise
 
-    async_dispatcher_connect(
-        hass, EVENT_ENTITY_REGISTER.format(COMPONENT), async_discover
-    )
+    """The listener is removed when the entry is unloaded, so a reload does not keep the old platform alive"""
+    config_entry.async_on_unload(async_dispatcher_connect(
+        hass, EVENT_ENTITY_REGISTER.format(config_entry.entry_id, COMPONENT), async_discover
+    ))
+
+    """Create the entities the gateway already knows, including those restored from the catalog cache"""
+    hass.data[DOMAIN][config_entry.entry_id].async_platform_ready(COMPONENT)
 
 
-class CustomClimate(ClimateEntity, ABC):
+class CustomClimate(StateChangeMixin, ClimateEntity, ABC):
     """Custom entity class to handle business logic related to climates"""
 
     should_poll = False
@@ -74,6 +91,9 @@ class CustomClimate(ClimateEntity, ABC):
 
     _attr_fan_mode = FAN_AUTO
 
+    """Powering on and setting the mode are two commands separated by POWER_ON_DELAY"""
+    optimistic_timeout = 10
+
     def __init__(self, hass: HomeAssistant, config: dict, config_entry: ConfigEntry) -> None:
         self._attr_unique_id = config["unique_id"]
 
@@ -81,6 +101,8 @@ class CustomClimate(ClimateEntity, ABC):
 
         self.sn = config["sn"]
 
+        self._command = CommandEnvelope("P/0/center/q74", {"sn": self.sn})
+
         self._attr_name = config["name"]
 
         self._attr_device_class = COMPONENT
@@ -89,22 +111,7 @@ class CustomClimate(ClimateEntity, ABC):
 
         self.config_entry = config_entry
 
-        self.update_state(config)
-
-        async def async_discover(data: dict):
-            try:
-                self.update_state(data)
-                self.async_write_ha_state()
-            except Exception:
-                raise
-
-        """Add a device state change event listener, and execute the specified method when the device state changes. 
-        Note: It is necessary to determine whether an event listener has been added here to avoid repeated additions."""
-        key = EVENT_ENTITY_STATE_UPDATE.format(self.unique_id)
-        if key not in hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT]:
-            hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT][key] = async_dispatcher_connect(
-                hass, key, async_discover
-            )
+        self.init_state(config)
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -116,6 +123,10 @@ class CustomClimate(ClimateEntity, ABC):
             "manufacturer": MANUFACTURER,
         }
 
+    def state_snapshot(self) -> tuple:
+        return (self._attr_hvac_mode, self._attr_target_temperature, self._attr_current_temperature,
+                self._attr_fan_mode)
+
     def update_state(self, data):
         # _LOGGER.warning("update_state : %s", data)
 
@@ -173,8 +184,7 @@ class CustomClimate(ClimateEntity, ABC):
         # _LOGGER.warning("set_temperature : %s", kwargs)
         if "temperature" in kwargs:
             temperature = float(kwargs["temperature"])
-            await self.exec_command(20, temperature)
-            self._attr_target_temperature = temperature
+            await self.async_publish_optimistic({"a65": temperature}, self.exec_command(20, temperature))
 
     async def async_set_fan_mode(self, fan_mode: str) -> None:
         # _LOGGER.warning("set_fan_mode : %s", fan_mode)
@@ -192,47 +202,27 @@ class CustomClimate(ClimateEntity, ABC):
         elif fan_mode == FAN_TOP:
             fan_level = 5
 
-        await self.exec_command(22, fan_level)
-        self._attr_fan_mode = fan_mode
-        self.async_write_ha_state()
+        await self.async_publish_optimistic({"a67": fan_level}, self.exec_command(22, fan_level))
 
     async def async_set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         # _LOGGER.warning("set_hvac_mode : %s", hvac_mode)
         if hvac_mode == HVAC_MODE_OFF:
-            await self.exec_command(19, 0)
-        else:
-            if self._attr_hvac_mode == HVAC_MODE_OFF:
-                await self.exec_command(19, 1)
-                time.sleep(1)
-            if hvac_mode == HVAC_MODE_AUTO:
-                await self.exec_command(21, 0)
-            elif hvac_mode == HVAC_MODE_COOL:
-                await self.exec_command(21, 1)
-            elif hvac_mode == HVAC_MODE_HEAT:
-                await self.exec_command(21, 2)
-            elif hvac_mode == HVAC_MODE_FAN_ONLY:
-                await self.exec_command(21, 3)
-            elif hvac_mode == HVAC_MODE_DRY:
-                await self.exec_command(21, 4)
-
-        self._attr_hvac_mode = hvac_mode
-        self.hvac_mode_cache = HVAC_MODE_HEAT
-        self.async_write_ha_state()
-
-    async def exec_command(self, i: int, v):
-        """Execute MQTT commands"""
-        message = {
-            "seq": 1,
-            "data": {
-                "sn": self.sn,
-                "i": i,
-                "v": v
-            }
-        }
+            await self.async_publish_optimistic({"a64": 0}, self.exec_command(19, 0))
+            return
+
+        mode = HVAC_MODE_VALUES.get(hvac_mode)
+        if mode is None:
+            return
+        power_on = self._attr_hvac_mode == HVAC_MODE_OFF
 
-        await self.hass.data[MQTT_CLIENT_INSTANCE].async_publish(
-            "P/0/center/q74",
-            json.dumps(message),
-            0,
-            False
-        )
+        async def async_send():
+            if power_on:
+                """The unit needs some time after being powered on before it accepts the mode"""
+                await self.exec_command(19, 1, gap=POWER_ON_DELAY)
+            await self.exec_command(21, mode)
+
+        await self.async_publish_optimistic({"a64": 1, "a66": mode}, async_send())
+
+    async def exec_command(self, i: int, v, gap: float = 0):
+        """Execute MQTT commands"""
+        await self.async_publish_command(self._command, {"i": i, "v": v}, gap=gap)
@@ -0,0 +1,101 @@
+"""Coalesce bursts of device state reports before they are written to the entities"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StateCoalescer:
+    """Merge the partial state reports of each device received within a short window.
+
+    Reports are merged per sn (later values overwrite earlier ones), and when the window closes each
+    device is handed to the flush callback once with the merged data. A window of 0 flushes on the
+    next event loop tick, which still merges every report delivered within the same iteration.
+
+    While held, reports are only merged, they are delivered together when the coalescer is released."""
+
+    def __init__(self, hass: HomeAssistant, window: float, flush: Callable[[str, dict], None]) -> None:
+        self._hass = hass
+        self._window = max(float(window), 0.0)
+        self._flush = flush
+        self._pending: dict[str, dict] = {}
+        self._handle: asyncio.Handle | asyncio.TimerHandle | None = None
+        self._held = False
+
+        """Number of reports received and number of merged reports handed to the flush callback"""
+        self.received = 0
+        self.flushed = 0
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    @callback
+    def async_add(self, state: dict) -> None:
+        """Queue a state report, merging it with the pending report of the same device"""
+
+        self.received += 1
+
+        sn = state["sn"]
+        pending = self._pending.get(sn)
+        if pending is None:
+            self._pending[sn] = dict(state)
+        else:
+            pending.update(state)
+
+        if self._handle is None and not self._held:
+            if self._window > 0:
+                self._handle = self._hass.loop.call_later(self._window, self.async_flush)
+            else:
+                self._handle = self._hass.loop.call_soon(self.async_flush)
+
+    @callback
+    def async_hold(self) -> None:
+        """Keep merging the reports without delivering them, until async_release"""
+
+        self._held = True
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    @callback
+    def async_release(self) -> None:
+        """Deliver the reports merged while held in one pass and go back to the normal window"""
+
+        if self._held:
+            self._held = False
+            self.async_flush()
+
+    @callback
+    def async_flush(self) -> None:
+        """Deliver all pending reports"""
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        pending = self._pending
+        self._pending = {}
+
+        for sn, state in pending.items():
+            self.flushed += 1
+            try:
+                self._flush(sn, state)
+            except Exception:
+                _LOGGER.exception("Error while applying state of device %s", sn)
+
+    @callback
+    def async_cancel(self) -> None:
+        """Drop all pending reports"""
+
+        self._held = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        self._pending.clear()
@@ -0,0 +1,117 @@
+"""JSON codec used for the messages exchanged with the gateway.
+
+orjson is used when it is installed (Home Assistant ships it), otherwise the standard library json
+module. Both backends decode bytes directly and encode to compact bytes, so payloads never take a
+bytes -> str -> object round trip.
+
+This module must not import anything from Home Assistant or the integration, so it can also be
+loaded on its own by the benchmarks."""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+class StdlibCodec:
+    """Codec based on the standard library json module"""
+
+    name = "json"
+
+    """Splicing the changing fields into a pre-encoded envelope beats encoding the whole message"""
+    templates = True
+
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def loads(data: bytes | bytearray | str) -> Any:
+        return json.loads(data)
+
+    @classmethod
+    def dumps(cls, obj: Any) -> bytes:
+        return cls._encoder.encode(obj).encode("utf-8")
+
+
+class OrjsonCodec:
+    """Codec based on orjson"""
+
+    name = "orjson"
+
+    """Splicing bytes in Python saves nothing over orjson encoding the whole message, see benchmarks/bench_codec.py"""
+    templates = False
+
+    @staticmethod
+    def loads(data: bytes | bytearray | str) -> Any:
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+
+CODECS = {StdlibCodec.name: StdlibCodec}
+if orjson is not None:
+    CODECS[OrjsonCodec.name] = OrjsonCodec
+
+"""Fastest available codec"""
+codec = OrjsonCodec if orjson is not None else StdlibCodec
+
+DecodeError = ValueError
+
+loads = codec.loads
+
+dumps = codec.dumps
+
+
+class CommandEnvelope:
+    """Envelope of the commands an entity sends to a fixed topic.
+
+    With a backend that uses templates the fixed part of the message data (sn, or room and subgroup) is
+    encoded once when the entity is created, so each command only serializes its sequence number and the
+    fields that change. Otherwise each command encodes the whole message."""
+
+    __slots__ = ("topic", "fixed", "rsp_to", "_template", "_dumps")
+
+    def __init__(self, topic: str, fixed: dict | None = None, rsp_to: str | None = None,
+                 backend=None) -> None:
+        backend = backend or codec
+
+        self.topic = topic
+        self.fixed = dict(fixed or {})
+        self.rsp_to = rsp_to
+        self._dumps = backend.dumps
+
+        if not backend.templates:
+            self._template = None
+            return
+
+        body = b''
+        if rsp_to is not None:
+            body += b',"rspTo":' + backend.dumps(rsp_to)
+        """Encoded fixed data without its closing brace, the changing fields are appended to it"""
+        body += b',"data":' + backend.dumps(self.fixed)[:-1]
+        self._template = b'{"seq":%d' + body.replace(b"%", b"%%") + b'%b}'
+
+    def encode(self, fields: dict | None = None, seq: int = 1) -> bytes:
+        """Encode a command message containing the fixed data and the given fields"""
+
+        if self._template is None:
+            data = {**self.fixed, **fields} if fields else self.fixed
+            if self.rsp_to is None:
+                return self._dumps({"seq": seq, "data": data})
+            return self._dumps({"seq": seq, "rspTo": self.rsp_to, "data": data})
+
+        if fields:
+            encoded = self._dumps(fields)
+            if self.fixed:
+                data = b"," + encoded[1:]
+            else:
+                data = encoded[1:]
+        else:
+            data = b"}"
+
+        return self._template % (seq, data)
@@ -0,0 +1,160 @@
+"""Colour temperature and RGB conversions, backed by lookup tables built at import time.
+
+The gateway reports and accepts colour temperatures in kelvin between LIGHT_MHT_MIN_KELVIN and
+LIGHT_MHT_MAX_KELVIN, while Home Assistant uses mireds between LIGHT_MIN_KELVIN and LIGHT_MAX_KELVIN.
+Every value of both ranges is converted once here, so the hot paths only index a table.
+
+This module must not import anything from Home Assistant or the integration, so it can also be
+loaded on its own by the benchmarks."""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Sequence
+
+"""Colour temperature range of Home Assistant, in mireds"""
+LIGHT_MIN_KELVIN = 153
+
+LIGHT_MAX_KELVIN = 500
+
+"""Colour temperature range of the gateway, in kelvin"""
+LIGHT_MHT_MIN_KELVIN = 2700
+
+LIGHT_MHT_MAX_KELVIN = 6500
+
+
+def compute_color_temp_to_rgb(color_temp) -> tuple[int, int, int]:
+    """Approximate the RGB colour of a colour temperature in kelvin"""
+
+    if color_temp < 1000:
+        color_temp = 1000.0
+
+    if color_temp > 40000:
+        color_temp = 40000.0
+
+    tempera = color_temp / 100.0
+    if tempera <= 66:
+        red = 255.0
+    else:
+        red = tempera - 60
+        red = 329.698727446 * math.pow(red, -0.1332047592)
+        if red < 0:
+            red = 0.0
+        elif red > 255.0:
+            red = 255.0
+
+    if tempera <= 66:
+        green = tempera
+        green = 99.4708025861 * math.log(green) - 161.1195681661
+        if green < 0:
+            green = 0.0
+
+        if green > 255:
+            green = 255.0
+    else:
+        green = tempera - 60
+        green = 288.1221695283 * math.pow(green, -0.0755148492)
+        if green < 0:
+            green = 0.0
+
+        if green > 255:
+            green = 255.0
+
+    if tempera >= 66:
+        blue = 255.0
+    else:
+        if tempera <= 19:
+            blue = 0.0
+        else:
+            blue = tempera - 10
+            blue = 138.5177312231 * math.log(blue) - 305.0447927307
+            if blue < 0:
+                blue = 0.0
+            if blue > 255:
+                blue = 255.0
+
+    color_rgb = (int(red), int(green), int(blue))
+
+    return color_rgb
+
+
+def compute_device_kelvin_to_mired(kelvin: int) -> int:
+    """HA colour temperature of a gateway colour temperature, the HA scale is reversed"""
+
+    kelvin = min(max(int(kelvin), LIGHT_MHT_MIN_KELVIN), LIGHT_MHT_MAX_KELVIN)
+
+    kelvin_bl = (kelvin - LIGHT_MHT_MIN_KELVIN) / (LIGHT_MHT_MAX_KELVIN - LIGHT_MHT_MIN_KELVIN)
+
+    return LIGHT_MAX_KELVIN - round(kelvin_bl * (LIGHT_MAX_KELVIN - LIGHT_MIN_KELVIN))
+
+
+def compute_mired_to_device_kelvin(mired: int) -> int:
+    """Gateway colour temperature of a HA colour temperature, the HA scale is reversed"""
+
+    kelvin_bl = (int(mired) - LIGHT_MIN_KELVIN) / (LIGHT_MAX_KELVIN - LIGHT_MIN_KELVIN)
+    kelvin = LIGHT_MHT_MAX_KELVIN - round(kelvin_bl * (LIGHT_MHT_MAX_KELVIN - LIGHT_MHT_MIN_KELVIN))
+
+    return min(max(kelvin, LIGHT_MHT_MIN_KELVIN), LIGHT_MHT_MAX_KELVIN)
+
+
+"""Lookup tables over the whole range of the gateway and of Home Assistant"""
+_MIRED_BY_KELVIN = tuple(
+    compute_device_kelvin_to_mired(kelvin) for kelvin in range(LIGHT_MHT_MIN_KELVIN, LIGHT_MHT_MAX_KELVIN + 1)
+)
+
+_KELVIN_BY_MIRED = tuple(
+    compute_mired_to_device_kelvin(mired) for mired in range(LIGHT_MIN_KELVIN, LIGHT_MAX_KELVIN + 1)
+)
+
+_RGB_BY_KELVIN = tuple(
+    compute_color_temp_to_rgb(kelvin) for kelvin in range(LIGHT_MHT_MIN_KELVIN, LIGHT_MHT_MAX_KELVIN + 1)
+)
+
+_KELVIN_SPAN = LIGHT_MHT_MAX_KELVIN - LIGHT_MHT_MIN_KELVIN
+
+_MIRED_SPAN = LIGHT_MAX_KELVIN - LIGHT_MIN_KELVIN
+
+
+def device_kelvin_to_mired(kelvin) -> int:
+    """HA colour temperature (mireds) of a colour temperature reported by the gateway"""
+
+    index = int(kelvin) - LIGHT_MHT_MIN_KELVIN
+    if index < 0:
+        index = 0
+    elif index > _KELVIN_SPAN:
+        index = _KELVIN_SPAN
+    return _MIRED_BY_KELVIN[index]
+
+
+def mired_to_device_kelvin(mired) -> int:
+    """Gateway colour temperature (kelvin) of a HA colour temperature"""
+
+    index = int(mired) - LIGHT_MIN_KELVIN
+    if index < 0:
+        index = 0
+    elif index > _MIRED_SPAN:
+        index = _MIRED_SPAN
+    return _KELVIN_BY_MIRED[index]
+
+
+def color_temp_to_rgb(color_temp) -> tuple[int, int, int]:
+    """RGB colour of a colour temperature in kelvin, from the table inside the gateway range"""
+
+    if isinstance(color_temp, int) and LIGHT_MHT_MIN_KELVIN <= color_temp <= LIGHT_MHT_MAX_KELVIN:
+        return _RGB_BY_KELVIN[color_temp - LIGHT_MHT_MIN_KELVIN]
+    return _cached_color_temp_to_rgb(color_temp)
+
+
+@lru_cache(maxsize=256)
+def _cached_color_temp_to_rgb(color_temp) -> tuple[int, int, int]:
+    return compute_color_temp_to_rgb(color_temp)
+
+
+def rgb_int_to_tuple(rgb: int) -> tuple[int, int, int]:
+    """Split the packed RGB value of the gateway"""
+    return (rgb >> 16) & 255, (rgb >> 8) & 255, rgb & 255
+
+
+def rgb_tuple_to_int(rgb: Sequence[int]) -> int:
+    """Pack an RGB colour the way the gateway expects it"""
+    return (rgb[0] << 16) + (rgb[1] << 8) + rgb[2]
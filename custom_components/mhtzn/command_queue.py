@@ -0,0 +1,91 @@
+"""Ordered, non-blocking command queues per device"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _QueuedCommand:
+    __slots__ = ("send", "gap", "future")
+
+    def __init__(self, send: Callable[[], Awaitable[Any]], gap: float, future: asyncio.Future) -> None:
+        self.send = send
+        self.gap = gap
+        self.future = future
+
+
+class CommandQueue:
+    """Send the commands of each device in order, with the delays the device needs between them.
+
+    Every key (a device sn, or a room/subgroup) has its own queue drained by its own task, so the gap
+    after a command only delays the following commands of the same device. Nothing blocks the event
+    loop, and commands to different devices are sent concurrently."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._queues: dict[str, deque[_QueuedCommand]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of commands waiting to be sent"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def async_send(self, key: str, send: Callable[[], Awaitable[Any]], gap: float = 0) -> Any:
+        """Queue a command and wait until it has been sent.
+
+        gap is the number of seconds the device needs before it can accept its next command"""
+
+        future = self._hass.loop.create_future()
+        self._queues.setdefault(key, deque()).append(_QueuedCommand(send, gap, future))
+
+        if key not in self._workers:
+            self._workers[key] = self._hass.async_create_task(self._async_drain(key))
+
+        return await future
+
+    @callback
+    def async_cancel(self) -> None:
+        """Drop all queued commands"""
+
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+
+        for queue in self._queues.values():
+            for command in queue:
+                if not command.future.done():
+                    command.future.cancel()
+        self._queues.clear()
+
+    async def _async_drain(self, key: str) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                command = queue.popleft()
+                try:
+                    result = await command.send()
+                except asyncio.CancelledError:
+                    """The queue is cancelled while this command is in flight, its caller must not wait forever"""
+                    command.future.cancel()
+                    raise
+                except Exception as err:
+                    if not command.future.done():
+                        command.future.set_exception(err)
+                else:
+                    if not command.future.done():
+                        command.future.set_result(result)
+
+                if command.gap > 0:
+                    await asyncio.sleep(command.gap)
+        finally:
+            if self._workers.get(key) is asyncio.current_task():
+                self._workers.pop(key, None)
+                if not queue:
+                    self._queues.pop(key, None)
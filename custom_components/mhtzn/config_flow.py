@@ -1,6 +1,7 @@
 """Config flow for MHTZN integration."""
 from __future__ import annotations
 
+import asyncio
 import logging
 from collections import OrderedDict
 
@@ -8,6 +9,7 @@ import voluptuous as vol
 
 from homeassistant import config_entries, exceptions
 from homeassistant.components import zeroconf
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.const import (
     CONF_NAME,
@@ -17,35 +19,56 @@ from homeassistant.const import (
 )
 
 from .const import (
-    DOMAIN, CONF_BROKER, CONF_LIGHT_DEVICE_TYPE
+    DOMAIN, CONF_BROKER, CONF_HOSTS, CONF_LIGHT_DEVICE_TYPE, CONF_STATE_COALESCE_WINDOW, CONF_LIGHT_COMMAND_RATE
 )
-from .scan import scan_and_get_connection_dict
-from .util import format_connection
+from .probe import ProbeRefused, async_probe, async_probe_best
+from .scan import scan_and_get_connection_dict, async_get_discovery
+from .util import format_connection, gateway_options
 
-connection_dict = {}
-light_device_type = None
-scan_flag = False
 _LOGGER = logging.getLogger(__name__)
 
+"""Seconds the scan step waits for a first gateway when none is known yet"""
+SCAN_TIMEOUT = 3
+
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for MHTZN."""
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> OptionsFlow:
+        """Tune the state coalescing and the light command rate of a gateway"""
+        return OptionsFlow(config_entry)
+
+    def __init__(self) -> None:
+        """Gateways offered by the scan step, by name"""
+        self._connections: dict[str, dict] = {}
+        """Lighting control method chosen in the option step, single or group"""
+        self._light_device_type: str | None = None
+
     async def async_step_zeroconf(
             self, discovery_info: zeroconf.ZeroconfServiceInfo
     ) -> FlowResult:
         """Handle zeroconf discovery."""
-        global scan_flag
 
         """Format the connection information reported by mdns"""
-        connection = format_connection(discovery_info)
+        connection = format_connection(
+            discovery_info, [str(address) for address in getattr(discovery_info, "ip_addresses", ())]
+        )
+
+        """Share what Home Assistant discovered with the registry the scan step reads"""
+        (await async_get_discovery(self.hass)).async_add(connection)
 
         """Realize the change of gateway connection information and trigger HA to reconnect to the gateway"""
+        configured = False
         for entry in self._async_current_entries():
             entry_data = entry.data
             if entry_data[CONF_NAME] == connection[CONF_NAME]:
+                configured = True
+                if len(connection[CONF_HOSTS]) > 1:
+                    await self._async_keep_broker(connection, entry_data.get(CONF_BROKER))
                 if CONF_LIGHT_DEVICE_TYPE in entry_data:
                     connection[CONF_LIGHT_DEVICE_TYPE] = entry_data[CONF_LIGHT_DEVICE_TYPE]
                 self.hass.config_entries.async_update_entry(
@@ -53,39 +76,35 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     data=connection,
                 )
 
-        """When an available gateway connection is found, the configuration card is displayed"""
-        if (not self._async_current_entries()
-                and not scan_flag
-                and connection[CONF_NAME] is not None
+        if configured:
+            return self.async_abort(reason="already_configured")
+
+        """When an available gateway connection is found, the configuration card is displayed, once per gateway"""
+        if (connection[CONF_NAME] is not None
                 and connection[CONF_BROKER] is not None
                 and connection[CONF_PORT] is not None
                 and connection[CONF_USERNAME] is not None
                 and connection[CONF_PASSWORD] is not None):
-            scan_flag = True
+            await self.async_set_unique_id(connection[CONF_NAME])
             return await self.async_step_option()
 
-        return self.async_abort(reason="single_instance_allowed")
+        return self.async_abort(reason="not_found_device")
 
     async def async_step_user(self, user_input=None):
-        """Handle a flow initialized by the user."""
-
-        """Only one integration instance is allowed to be added"""
-        if self._async_current_entries():
-            return self.async_abort(reason="single_instance_allowed")
+        """Handle a flow initialized by the user, each gateway is added as its own entry."""
 
         return await self.async_step_option()
 
     async def async_step_option(self, user_input=None):
         """Configure the lighting control method"""
 
-        global light_device_type
         errors = {}
 
         if user_input is not None:
             if user_input[CONF_LIGHT_DEVICE_TYPE] == "单灯":
-                light_device_type = "single"
+                self._light_device_type = "single"
             else:
-                light_device_type = "group"
+                self._light_device_type = "group"
 
             return await self.async_step_scan()
 
@@ -100,36 +119,38 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_scan(self, user_input=None):
         """Select a gateway from the list of discovered gateways to connect to"""
-        global scan_flag
-        global connection_dict
-        global light_device_type
         errors = {}
 
         if user_input is not None:
             name = user_input[CONF_NAME]
-            connection = connection_dict.get(name)
+            connection = self._connections.get(name)
             if connection is not None:
-                can_connect = self._try_mqtt_connect(connection)
-                if can_connect:
-                    connection[CONF_LIGHT_DEVICE_TYPE] = light_device_type
-                    scan_flag = False
+                error = await self._async_probe_connection(connection)
+                if error is None:
+                    connection[CONF_LIGHT_DEVICE_TYPE] = self._light_device_type
+                    await self.async_set_unique_id(name, raise_on_progress=False)
+                    self._abort_if_unique_id_configured()
                     """Create an integration based on selected configuration information"""
                     return self.async_create_entry(
                         title=connection[CONF_NAME], data=connection
                     )
                 else:
-                    errors["base"] = "cannot_connect"
+                    errors["base"] = error
             else:
                 return self.async_abort(reason="select_error")
 
-        """Search the LAN's gateway list"""
-        connection_dict = await scan_and_get_connection_dict(3)
+        """Gateways known to the discovery registry, only waits when none has been found yet"""
+        connection_dict = await scan_and_get_connection_dict(self.hass, SCAN_TIMEOUT)
+        self._connections = connection_dict
 
         connection_name_list = []
 
+        """Gateways that already have an entry are not offered again"""
+        configured_names = {entry.data.get(CONF_NAME) for entry in self._async_current_entries()}
         if connection_dict is not None:
             for connection_name in list(connection_dict.keys()):
-                connection_name_list.append(connection_name)
+                if connection_name not in configured_names:
+                    connection_name_list.append(connection_name)
 
         if len(connection_name_list) < 1:
             return self.async_abort(reason="not_found_device")
@@ -141,19 +162,67 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="scan", data_schema=vol.Schema(fields), errors=errors
         )
 
-    def _try_mqtt_connect(self, connection):
-        return self.hass.async_add_executor_job(
-            try_connection,
-            self.hass,
-            connection[CONF_BROKER],
-            connection[CONF_PORT],
-            connection[CONF_USERNAME],
-            connection[CONF_PASSWORD],
-        )
+    async def _async_keep_broker(self, connection: dict, broker: str | None) -> None:
+        """Keep the broker in use while it still answers, so a faster address never causes a reconnect.
+
+        Only when it is gone or stops answering are the addresses ranked again, the advertised one is kept
+        when none answers"""
+
+        if broker in connection[CONF_HOSTS]:
+            try:
+                await async_probe(broker, connection[CONF_PORT], connection[CONF_USERNAME], connection[CONF_PASSWORD])
+            except (ProbeRefused, OSError, asyncio.TimeoutError) as err:
+                _LOGGER.info("Gateway %s no longer answers at %s: %r", connection[CONF_NAME], broker, err)
+            else:
+                connection[CONF_BROKER] = broker
+                return
+
+        await self._async_probe_connection(connection)
+
+    async def _async_probe_connection(self, connection: dict) -> str | None:
+        """Connect to every address of the gateway at once and keep the fastest one as broker.
 
+        Returns the error key shown by the form when no address accepts the connection"""
+
+        hosts = connection.get(CONF_HOSTS) or [connection[CONF_BROKER]]
+        try:
+            host, rtt = await async_probe_best(
+                hosts, connection[CONF_PORT], connection[CONF_USERNAME], connection[CONF_PASSWORD]
+            )
+        except ProbeRefused as err:
+            _LOGGER.warning("Gateway %s refused the connection: %s", connection[CONF_NAME], err)
+            return "invalid_auth" if err.bad_credentials else "cannot_connect"
+        except (OSError, asyncio.TimeoutError) as err:
+            _LOGGER.warning("Gateway %s cannot be reached at %s: %r", connection[CONF_NAME], hosts, err)
+            return "cannot_connect"
+
+        _LOGGER.info("Gateway %s answered at %s in %.1f ms", connection[CONF_NAME], host, rtt * 1000)
+        connection[CONF_BROKER] = host
+        return None
+
+
+class OptionsFlow(config_entries.OptionsFlow):
+    """Handle the options of a gateway, the entry is reloaded when they change"""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Seconds during which state reports are merged, and light commands sent per second, 0 for no limit"""
+
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = gateway_options(self.config_entry)
+        fields = OrderedDict()
+        fields[vol.Required(CONF_STATE_COALESCE_WINDOW, default=options[CONF_STATE_COALESCE_WINDOW])] = vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=5)
+        )
+        fields[vol.Required(CONF_LIGHT_COMMAND_RATE, default=options[CONF_LIGHT_COMMAND_RATE])] = vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=100)
+        )
 
-def try_connection(hass, broker, port, username, password, protocol="3.1.1"):
-    return True
+        return self.async_show_form(step_id="init", data_schema=vol.Schema(fields))
 
 
 class CannotConnect(exceptions.HomeAssistantError):
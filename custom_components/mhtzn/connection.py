@@ -0,0 +1,155 @@
+"""Connection state machine of the gateway MQTT link"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from enum import Enum
+from typing import Awaitable, Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+"""Delay before the first reconnection attempt, doubled after every failure up to BACKOFF_MAX"""
+BACKOFF_BASE = 1
+
+BACKOFF_MAX = 300
+
+"""Seconds to wait for the broker to acknowledge a connection"""
+CONNECT_TIMEOUT = 10
+
+"""Seconds between two checks of an established connection"""
+MONITOR_INTERVAL = 5
+
+
+class ConnectionState(str, Enum):
+    """States of the gateway connection"""
+
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    BACKING_OFF = "backing_off"
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, so restarted sites do not reconnect to their gateways in lockstep"""
+
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** min(attempt, 16))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ConnectionManager:
+    """Keep the gateway connected from a single tracked task.
+
+    connect() performs one connection attempt and returns whether the link is up, is_connected() reports
+    the current link state and on_connected(first) runs every time the link comes up. Failed attempts
+    are retried with exponential backoff and jitter instead of a fixed one second loop."""
+
+    def __init__(
+            self,
+            hass: HomeAssistant,
+            name: str,
+            connect: Callable[[], Awaitable[bool]],
+            is_connected: Callable[[], bool],
+            on_connected: Callable[[bool], Awaitable[None]],
+    ) -> None:
+        self._hass = hass
+        self._name = name
+        self._connect = connect
+        self._is_connected = is_connected
+        self._on_connected = on_connected
+
+        self.state = ConnectionState.DISCONNECTED
+        self.attempts = 0
+        self.connections = 0
+
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+
+    @callback
+    def async_start(self) -> None:
+        """Start keeping the link connected"""
+
+        if self._task is None or self._task.done():
+            """Not tracked by Home Assistant, the task runs until async_stop and async_block_till_done, which
+            Home Assistant also calls while it starts, would wait for it forever"""
+            self._task = self._hass.loop.create_task(self._async_run())
+
+    async def async_stop(self) -> None:
+        """Stop the connection task"""
+
+        task = self._task
+        self._task = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        self._set_state(ConnectionState.DISCONNECTED)
+
+    @callback
+    def async_check_now(self) -> None:
+        """Check the link immediately instead of waiting for the next check or backoff delay"""
+
+        self.attempts = 0
+        self._wakeup.set()
+
+    async def _async_run(self) -> None:
+        while True:
+            if not self._is_connected():
+                if self.state is ConnectionState.CONNECTED:
+                    _LOGGER.warning("Connection to gateway %s lost", self._name)
+
+                self._set_state(ConnectionState.CONNECTING)
+                try:
+                    connected = await asyncio.wait_for(self._connect(), CONNECT_TIMEOUT)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:
+                    _LOGGER.debug("Connecting to gateway %s failed: %s", self._name, err)
+                    connected = False
+
+                if not connected:
+                    delay = backoff_delay(self.attempts)
+                    if self.attempts == 0:
+                        _LOGGER.warning("Unable to connect to gateway %s, retrying in %.1fs", self._name, delay)
+                    else:
+                        _LOGGER.debug("Unable to connect to gateway %s (attempt %s), retrying in %.1fs",
+                                      self._name, self.attempts + 1, delay)
+                    self.attempts += 1
+                    self._set_state(ConnectionState.BACKING_OFF)
+                    await self._async_wait(delay)
+                    continue
+
+            if self.state is not ConnectionState.CONNECTED:
+                first = self.connections == 0
+                self.connections += 1
+                if self.attempts:
+                    _LOGGER.info("Connected to gateway %s after %s attempts", self._name, self.attempts + 1)
+                self.attempts = 0
+                self._set_state(ConnectionState.CONNECTED)
+                try:
+                    await self._on_connected(first)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    _LOGGER.exception("Error while setting up the connection to gateway %s", self._name)
+
+            await self._async_wait(MONITOR_INTERVAL)
+
+    async def _async_wait(self, delay: float) -> None:
+        """Sleep for the given delay, or until async_check_now is called"""
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _set_state(self, state: ConnectionState) -> None:
+        if state is not self.state:
+            _LOGGER.debug("Gateway %s connection: %s -> %s", self._name, self.state.value, state.value)
+            self.state = state
@@ -6,25 +6,41 @@ MANUFACTURER = "Netmoon"
 
 CONF_BROKER = "broker"
 
-CONF_LIGHT_DEVICE_TYPE = "light_device_type"
-
-FLAG_IS_INITIALIZED = "flag_is_initialized"
+"""Every address the gateway was announced with, the broker is the fastest one when the entry was created and
+is kept while it answers"""
+CONF_HOSTS = "hosts"
 
-CACHE_ENTITY_STATE_UPDATE_KEY_DICT = "mhtzn_entity_state_update_dict"
+CONF_LIGHT_DEVICE_TYPE = "light_device_type"
 
-EVENT_ENTITY_STATE_UPDATE = "mhtzn_entity_state_update_{}"
+CONF_STATE_COALESCE_WINDOW = "state_coalesce_window"
 
-EVENT_ENTITY_REGISTER = "mhtzn_entity_register_{}"
+CONF_LIGHT_COMMAND_RATE = "light_command_rate"
 
-MQTT_CLIENT_INSTANCE = "mqtt_client_instance"
+"""Dispatcher signal of the new entities of a platform, namespaced by the config entry: (entry_id, platform)"""
+EVENT_ENTITY_REGISTER = "mhtzn_entity_register_{}_{}"
 
 MQTT_TOPIC_PREFIX = DOMAIN
 
 DEVICE_COUNT_MAX = 100
 
+"""Seconds during which device state reports are merged before being written, 0 merges within one loop tick"""
+DEFAULT_STATE_COALESCE_WINDOW = 0.05
+
+"""Maximum number of commands per second sent to a single light or light group"""
+DEFAULT_LIGHT_COMMAND_RATE = 4
+
+SERVICE_START_CAPTURE = "start_capture"
+
+SERVICE_STOP_CAPTURE = "stop_capture"
+
+SERVICE_REPLAY_CAPTURE = "replay_capture"
+
+SERVICE_PROFILE = "profile"
+
 PLATFORMS: list[str] = [
     "cover",
     "light",
     "scene",
-    "climate"
+    "climate",
+    "sensor"
 ]
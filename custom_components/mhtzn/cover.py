@@ -1,7 +1,6 @@
 """Business logic for cover entity."""
 from __future__ import annotations
 
-import json
 import logging
 from typing import Any
 
@@ -18,8 +17,9 @@ from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DOMAIN, MQTT_CLIENT_INSTANCE, EVENT_ENTITY_STATE_UPDATE, CACHE_ENTITY_STATE_UPDATE_KEY_DICT, \
-    EVENT_ENTITY_REGISTER, MANUFACTURER
+from .codec import CommandEnvelope
+from .const import DOMAIN, EVENT_ENTITY_REGISTER, MANUFACTURER
+from .entity import StateChangeMixin
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -34,18 +34,22 @@ async def async_setup_entry(
     """This method is executed after the integration is initialized to create an event listener,
     which is used to create a sub-device"""
 
-    async def async_discover(config_payload):
+    async def async_discover(config_payloads: list[dict]):
         try:
-            async_add_entities([CustomCover(hass, config_payload, config_entry)])
+            async_add_entities([CustomCover(hass, config_payload, config_entry) for config_payload in config_payloads])
         except Exception:
             raise
 
-    async_dispatcher_connect(
-        hass, EVENT_ENTITY_REGISTER.format(COMPONENT), async_discover
-    )
+    """The listener is removed when the entry is unloaded, so a reload does not keep the old platform alive"""
+    config_entry.async_on_unload(async_dispatcher_connect(
+        hass, EVENT_ENTITY_REGISTER.format(config_entry.entry_id, COMPONENT), async_discover
+    ))
 
+    """Create the entities the gateway already knows, including those restored from the catalog cache"""
+    hass.data[DOMAIN][config_entry.entry_id].async_platform_ready(COMPONENT)
 
-class CustomCover(CoverEntity):
+
+class CustomCover(StateChangeMixin, CoverEntity):
     """Custom entity class to handle business logic related to curtains"""
 
     def close_cover(self, **kwargs: Any) -> None:
@@ -62,6 +66,9 @@ class CustomCover(CoverEntity):
     """Device class is curtain"""
     device_class = "curtain"
 
+    """A curtain can take this long to reach its position, intermediate reports do not confirm the command"""
+    optimistic_timeout = 60
+
     def __init__(self, hass: HomeAssistant, config: dict, config_entry: ConfigEntry) -> None:
         self._attr_unique_id = config["unique_id"]
 
@@ -69,6 +76,8 @@ class CustomCover(CoverEntity):
 
         self.sn = config["sn"]
 
+        self._command = CommandEnvelope("P/0/center/q21", {"sn": self.sn})
+
         self._attr_name = config["name"]
 
         self._attr_device_class = "curtain"
@@ -83,22 +92,7 @@ class CustomCover(CoverEntity):
 
         self.moving = 0
 
-        self.update_state(config)
-
-        async def async_discover(data: dict):
-            try:
-                self.update_state(data)
-                self.async_write_ha_state()
-            except Exception:
-                raise
-
-        """Add a device state change event listener, and execute the specified method when the device state changes. 
-        Note: It is necessary to determine whether an event listener has been added here to avoid repeated additions."""
-        key = EVENT_ENTITY_STATE_UPDATE.format(self.unique_id)
-        if key not in hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT]:
-            hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT][key] = async_dispatcher_connect(
-                hass, key, async_discover
-            )
+        self.init_state(config)
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -140,55 +134,41 @@ class CustomCover(CoverEntity):
         """Return position for roller."""
         return self._current_position
 
+    def state_snapshot(self) -> tuple:
+        return self._current_position, self.moving
+
     def update_state(self, data):
-        position = int(data["travel"] * 100)
-        self._target_position = position
+        travel = data.get("travel")
+        if travel is None:
+            return
+        self._target_position = int(travel * 100)
         self._current_position = self._target_position
 
     async def async_stop_cover(self, **kwargs: Any) -> None:
-        """Open the cover."""
+        """Stop the cover, it stays where it is, the position it was moving to is no longer expected."""
+        self.async_cancel_optimistic()
         await self.exec_command(0, 0)
 
     async def async_open_cover(self, **kwargs: Any) -> None:
         """Open the cover."""
-        await self.set_position(100)
-        await self.exec_command(1, 0)
+        await self.async_publish_optimistic({"travel": 1}, self.exec_command(1, 0))
 
     async def async_close_cover(self, **kwargs: Any) -> None:
         """Close the cover."""
-        await self.set_position(0)
-        await self.exec_command(2, 0)
+        await self.async_publish_optimistic({"travel": 0}, self.exec_command(2, 0))
 
     async def async_set_cover_position(self, **kwargs: Any) -> None:
-        """Close the cover."""
+        """Move the cover to a position."""
         position = kwargs[ATTR_POSITION]
-        await self.set_position(kwargs[ATTR_POSITION])
-        await self.exec_command(3, position)
-
-    async def set_position(self, position: int) -> None:
-        """Change curtain position in HA"""
-        self._target_position = position
-
-        self._current_position = self._target_position
-
-        self.async_write_ha_state()
+        await self.async_publish_optimistic({"travel": round(position / 100, 2)}, self.exec_command(3, position))
 
     async def exec_command(self, action: int, position: int):
         """Execute MQTT commands"""
-        message = {
-            "seq": 1,
-            "data": {
-                "sn": self.sn,
-                "action": action
-            }
+        data = {
+            "action": action
         }
 
         if action == 3:
-            message["data"]["travel"] = round(position / 100, 2)
-
-        await self.hass.data[MQTT_CLIENT_INSTANCE].async_publish(
-            "P/0/center/q21",
-            json.dumps(message),
-            0,
-            False
-        )
+            data["travel"] = round(position / 100, 2)
+
+        await self.async_publish_command(self._command, data)
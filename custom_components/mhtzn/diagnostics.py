@@ -0,0 +1,63 @@
+"""Diagnostics support for the gateway"""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_BROKER, CONF_HOSTS, DOMAIN
+
+TO_REDACT = {CONF_PASSWORD, CONF_USERNAME, CONF_BROKER, CONF_HOSTS}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Snapshot of the metrics and counters of the gateway"""
+
+    diagnostics: dict[str, Any] = {"entry": async_redact_data(dict(entry.data), TO_REDACT)}
+
+    hub = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if hub is None:
+        return diagnostics
+
+    diagnostics.update({
+        "connection": {
+            "state": hub.connection.state.value,
+            "attempts": hub.connection.attempts,
+            "connections": hub.connection.connections,
+        },
+        "metrics": hub.metrics.as_dict(),
+        "requests": {topic: stats.as_dict() for topic, stats in hub.requests.stats.items()},
+        "state_writes": hub.write_stats.as_dict(),
+        "optimistic_commands": hub.optimistic_stats.as_dict(),
+        "state_coalescer": {
+            "window": hub.state_coalescer.window,
+            "received": hub.state_coalescer.received,
+            "flushed": hub.state_coalescer.flushed,
+        },
+        "registration": hub.registration_stats.as_dict(),
+        "resync": {"count": hub.resync_count, "last_seconds": hub.resync_seconds},
+        "catalog": {
+            "complete": hub.catalog_fetcher.complete,
+            "total": hub.catalog_fetcher.total,
+            "page_size": hub.catalog_fetcher.page_size,
+            "requests": hub.catalog_fetcher.requests,
+            "retries": hub.catalog_fetcher.retries,
+            "duplicates": hub.catalog_fetcher.duplicates,
+        },
+        "light_commands": {
+            "submitted": hub.light_pipeline.submitted,
+            "sent": hub.light_pipeline.sent,
+            "group_commands": hub.group_planner.group_commands,
+            "replaced_commands": hub.group_planner.replaced_commands,
+        },
+        "command_queue_pending": hub.command_queue.pending,
+        "capture": None if hub.recorder is None else {
+            "path": hub.recorder.path,
+            "frames": hub.recorder.frames,
+            "bytes": hub.recorder.bytes,
+        },
+    })
+    return diagnostics
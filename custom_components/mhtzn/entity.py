@@ -0,0 +1,241 @@
+"""Shared behaviour of the entities created from gateway devices"""
+from __future__ import annotations
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .codec import CommandEnvelope
+from .const import DOMAIN
+from .optimistic import DEFAULT_TIMEOUT, OptimisticState, OptimisticStats, PendingCommand
+
+_LOGGER = logging.getLogger(__name__)
+
+"""Applies a merged state report to an entity"""
+StateHandler = Callable[[dict], Any]
+
+
+class StateWriteStats:
+    """Counters of the state writes performed and skipped by the entities of a gateway"""
+
+    __slots__ = ("written", "skipped")
+
+    def __init__(self) -> None:
+        self.written = 0
+        self.skipped = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {"written": self.written, "skipped": self.skipped}
+
+
+class RegistrationStats:
+    """Counters of the entity batches sent to the platforms, each batch is one async_add_entities call"""
+
+    __slots__ = ("batches", "entities")
+
+    def __init__(self) -> None:
+        self.batches = 0
+        self.entities = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {"batches": self.batches, "entities": self.entities}
+
+
+class GatewayEntityMixin:
+    """Access to the gateway owning an entity"""
+
+    @property
+    def gateway(self):
+        """Gateway the entity was discovered from"""
+        return self.hass.data[DOMAIN][self.config_entry.entry_id]
+
+    async def async_publish_command(self, command: CommandEnvelope, data: dict | None = None,
+                                    gap: float = 0) -> int:
+        """Publish a command through the gateway, after the previous commands of this entity.
+
+        gap is the number of seconds the device needs before it can accept the next command"""
+        return await self.gateway.async_publish_command(command, data, key=self.unique_id, gap=gap)
+
+
+class StateChangeMixin(GatewayEntityMixin, ABC):
+    """Only write the HA state of an entity when a device report actually changed it.
+
+    Entities implement update_state(data) to decode a report and state_snapshot() to return the decoded
+    attributes that make up their HA state. Reports repeating the current values are then dropped
+    before async_write_ha_state, which also saves the recorder rows and websocket pushes that follow it.
+
+    Commands show their result at once through async_apply_optimistic, with the values they are expected to
+    produce in the format of a report. For devices with state reports these values stay pending until a
+    report echoes them, they are rolled back to the last reported state after optimistic_timeout."""
+
+    """Seconds a command waits for the device to echo its values"""
+    optimistic_timeout: float = DEFAULT_TIMEOUT
+
+    _optimistic: OptimisticState | None = None
+
+    _optimistic_timer: Callable[[], None] | None = None
+
+    @abstractmethod
+    def state_snapshot(self) -> tuple[Any, ...]:
+        """Return the decoded attributes compared before and after a report is applied"""
+
+    @abstractmethod
+    def update_state(self, data: dict) -> None:
+        """Decode the fields present in a report or in the expected values of a command, others are left as is"""
+
+    def init_state(self, data: dict) -> None:
+        """Decode the state the device was created with, the first state a command can be rolled back to"""
+        self._optimistic = OptimisticState(data)
+        self.update_state(data)
+
+    @property
+    def write_stats(self) -> StateWriteStats | None:
+        """Write counters of the gateway owning this entity"""
+        hub = self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id)
+        return getattr(hub, "write_stats", None)
+
+    @property
+    def optimistic_stats(self) -> OptimisticStats | None:
+        """Optimistic command counters of the gateway owning this entity"""
+        hub = self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id)
+        return getattr(hub, "optimistic_stats", None)
+
+    async def async_added_to_hass(self) -> None:
+        """Receive the state reports of the device from the gateway while the entity is in HA"""
+        await super().async_added_to_hass()
+
+        sn = getattr(self, "sn", None)
+        if sn is not None:
+            self.async_on_remove(self.gateway.async_register_state_handler(sn, self.async_apply_state))
+        self.async_on_remove(self._async_cancel_expiry)
+
+    @callback
+    def async_apply_state(self, data: dict) -> bool:
+        """Apply a device report, return True if the HA state was written"""
+
+        optimistic = self._optimistic
+        before = self.state_snapshot()
+        self.update_state(data)
+        if optimistic is not None:
+            confirmed = optimistic.report(data)
+            if confirmed and (optimistic_stats := self.optimistic_stats) is not None:
+                optimistic_stats.confirmed += confirmed
+            if optimistic.pending:
+                """Values still expected stay shown, the report may have been sent before the command arrived"""
+                self.update_state(optimistic.overlay())
+        changed = self.state_snapshot() != before
+
+        stats = self.write_stats
+        if changed:
+            self.async_write_ha_state()
+            if stats is not None:
+                stats.written += 1
+        elif stats is not None:
+            stats.skipped += 1
+
+        return changed
+
+    @callback
+    def async_apply_optimistic(self, expected: dict) -> PendingCommand | None:
+        """Show the values a command is expected to produce before the device reports them.
+
+        Returns the pending command, None for entities without state reports, such as light groups, which
+        keep the values until they are changed again"""
+
+        stats = self.optimistic_stats
+        if stats is not None:
+            stats.applied += 1
+
+        pending = None
+        optimistic = self._optimistic
+        if optimistic is not None and getattr(self, "sn", None) is not None:
+            pending, superseded = optimistic.expect(expected, time.monotonic() + self.optimistic_timeout)
+            if stats is not None:
+                stats.superseded += superseded
+            self._async_schedule_expiry()
+
+        self.update_state(expected)
+        self.async_write_ha_state()
+        return pending
+
+    async def async_publish_optimistic(self, expected: dict, publish: Awaitable) -> None:
+        """Apply the expected values, then await the publication, they are rolled back at once if it fails"""
+
+        pending = self.async_apply_optimistic(expected)
+        try:
+            await publish
+        except Exception:
+            self.async_discard_optimistic(pending)
+            raise
+
+    @callback
+    def async_discard_optimistic(self, pending: PendingCommand | None) -> None:
+        """Roll back the values of a command that could not be published"""
+
+        if pending is not None and self._optimistic.discard(pending):
+            self._async_rolled_back(1)
+
+    @callback
+    def async_cancel_optimistic(self) -> None:
+        """Stop showing the values still waiting for their echo, for commands that end the previous ones"""
+
+        optimistic = self._optimistic
+        if optimistic is None or not optimistic.pending:
+            return
+
+        cancelled = optimistic.clear()
+        stats = self.optimistic_stats
+        if stats is not None:
+            stats.superseded += cancelled
+        self._async_cancel_expiry()
+        self._async_show_reported()
+
+    @callback
+    def _async_schedule_expiry(self) -> None:
+        if self._optimistic_timer is not None:
+            return
+        deadline = self._optimistic.next_deadline
+        if deadline is not None:
+            self._optimistic_timer = async_call_later(
+                self.hass, max(0.0, deadline - time.monotonic()), self._async_expire
+            )
+
+    @callback
+    def _async_cancel_expiry(self) -> None:
+        if self._optimistic_timer is not None:
+            self._optimistic_timer()
+            self._optimistic_timer = None
+
+    @callback
+    def _async_expire(self, _now) -> None:
+        self._optimistic_timer = None
+        expired = self._optimistic.expire(time.monotonic())
+        if expired:
+            _LOGGER.debug("%s: %s command(s) were not echoed by the device", self.entity_id, expired)
+            self._async_rolled_back(expired)
+        self._async_schedule_expiry()
+
+    @callback
+    def _async_rolled_back(self, count: int) -> None:
+        """Count commands that were not echoed and show the last reported state again"""
+
+        stats = self.optimistic_stats
+        if stats is not None:
+            stats.rolled_back += count
+        self._async_show_reported()
+
+    @callback
+    def _async_show_reported(self) -> None:
+        """Show the last reported state, with the values of the commands still pending on top"""
+
+        optimistic = self._optimistic
+        before = self.state_snapshot()
+        self.update_state(optimistic.confirmed)
+        if optimistic.pending:
+            self.update_state(optimistic.overlay())
+        if self.state_snapshot() != before:
+            self.async_write_ha_state()
@@ -1,7 +1,6 @@
 """Business logic for light entity."""
 from __future__ import annotations
 
-import json
 import logging
 from typing import Any
 
@@ -12,21 +11,19 @@ from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DOMAIN, MQTT_CLIENT_INSTANCE, \
-    EVENT_ENTITY_REGISTER, EVENT_ENTITY_STATE_UPDATE, CACHE_ENTITY_STATE_UPDATE_KEY_DICT, MANUFACTURER
-from .util import color_temp_to_rgb
+from .codec import CommandEnvelope
+from .color import LIGHT_MIN_KELVIN, LIGHT_MAX_KELVIN, color_temp_to_rgb, device_kelvin_to_mired, \
+    mired_to_device_kelvin, rgb_int_to_tuple, rgb_tuple_to_int
+from .const import DOMAIN, EVENT_ENTITY_REGISTER, MANUFACTURER
+from .entity import StateChangeMixin
+from .optimistic import PendingCommand
 
 _LOGGER = logging.getLogger(__name__)
 
 COMPONENT = "light"
 
-LIGHT_MIN_KELVIN = 153
-
-LIGHT_MAX_KELVIN = 500
-
-LIGHT_MHT_MIN_KELVIN = 2700
-
-LIGHT_MHT_MAX_KELVIN = 6500
+"""Report fields setting the colour of a light, the last one present decides the colour mode"""
+COLOR_KEYS = ("kelvin", "rgb")
 
 
 async def async_setup_entry(
@@ -37,18 +34,22 @@ async def async_setup_entry(
     """This method is executed after the integration is initialized to create an event listener,
     which is used to create a sub-device"""
 
-    async def async_discover(config_payload):
+    async def async_discover(config_payloads: list[dict]):
         try:
-            async_add_entities([CustomLight(hass, config_payload, config_entry)])
+            async_add_entities([CustomLight(hass, config_payload, config_entry) for config_payload in config_payloads])
         except Exception:
             raise
 
-    async_dispatcher_connect(
-        hass, EVENT_ENTITY_REGISTER.format(COMPONENT), async_discover
-    )
+    """The listener is removed when the entry is unloaded, so a reload does not keep the old platform alive"""
+    config_entry.async_on_unload(async_dispatcher_connect(
+        hass, EVENT_ENTITY_REGISTER.format(config_entry.entry_id, COMPONENT), async_discover
+    ))
+
+    """Create the entities the gateway already knows, including those restored from the catalog cache"""
+    hass.data[DOMAIN][config_entry.entry_id].async_platform_ready(COMPONENT)
 
 
-class CustomLight(LightEntity):
+class CustomLight(StateChangeMixin, LightEntity):
     """Custom entity class to handle business logic related to lights"""
 
     def turn_on(self, **kwargs: Any) -> None:
@@ -83,10 +84,12 @@ class CustomLight(LightEntity):
         if self.is_group:
             self.room = int(config["room"])
             self.subgroup = int(config["subgroup"])
+            self._command = CommandEnvelope("P/0/center/q20", {"room": self.room, "subgroup": self.subgroup})
             # self._attr_supported_color_modes.add(ColorMode.RGB)
             # self._attr_color_mode = ColorMode.RGB
         else:
             self.sn = config["sn"]
+            self._command = CommandEnvelope("P/0/center/q20", {"sn": self.unique_id})
             if ColorMode.RGB in config:
                 self._attr_supported_color_modes.add(ColorMode.RGB)
                 self._attr_color_mode = ColorMode.RGB
@@ -95,22 +98,7 @@ class CustomLight(LightEntity):
 
         self.config_entry = config_entry
 
-        self.update_state(config)
-
-        async def async_discover(data: dict):
-            try:
-                self.update_state(data)
-                self.async_write_ha_state()
-            except Exception:
-                raise
-
-        """Add a device state change event listener, and execute the specified method when the device state changes. 
-        Note: It is necessary to determine whether an event listener has been added here to avoid repeated additions."""
-        key = EVENT_ENTITY_STATE_UPDATE.format(self.unique_id)
-        if key not in hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT]:
-            hass.data[CACHE_ENTITY_STATE_UPDATE_KEY_DICT][key] = async_dispatcher_connect(
-                hass, key, async_discover
-            )
+        self.init_state(config)
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -134,6 +122,9 @@ class CustomLight(LightEntity):
     def rgb_color(self) -> tuple[int, int, int] | None:
         return self._attr_rgb_color
 
+    def state_snapshot(self) -> tuple:
+        return self.on_off, self._attr_brightness, self._attr_color_temp, self._attr_rgb_color, self._attr_color_mode
+
     def update_state(self, data):
         """Light event reporting changes the light state in HA"""
 
@@ -144,27 +135,23 @@ class CustomLight(LightEntity):
                 self.on_off = True
 
         if "kelvin" in data:
-            kelvin = int(data["kelvin"])
-
-            if kelvin > LIGHT_MHT_MAX_KELVIN:
-                kelvin = LIGHT_MAX_KELVIN
-            if kelvin < LIGHT_MHT_MIN_KELVIN:
-                kelvin = LIGHT_MIN_KELVIN
-
-            kelvin_bl = (kelvin - LIGHT_MHT_MIN_KELVIN) / (LIGHT_MHT_MAX_KELVIN - LIGHT_MHT_MIN_KELVIN)
-
-            kelvin = LIGHT_MAX_KELVIN - round(kelvin_bl * (LIGHT_MAX_KELVIN - LIGHT_MIN_KELVIN))
-            self._attr_color_temp = kelvin
+            self._attr_color_temp = device_kelvin_to_mired(data["kelvin"])
 
         if "rgb" in data:
-            rgb = data["rgb"]
-            blue = rgb & 255
-            green = (rgb >> 8) & 255
-            red = (rgb >> 16) & 255
-            self._attr_rgb_color = (red, green, blue)
+            self._attr_rgb_color = rgb_int_to_tuple(data["rgb"])
+
+        """The colour set last decides the mode, reports and expected values keep their keys in the order they
+        changed, so rolling back to the last reported state also restores its mode"""
+        latest = next((key for key in reversed(data) if key in COLOR_KEYS), None)
+        if latest == "kelvin":
+            self._attr_rgb_color = color_temp_to_rgb(data["kelvin"])
+            self._attr_color_mode = ColorMode.COLOR_TEMP
+        elif latest == "rgb" and ColorMode.RGB in self._attr_supported_color_modes:
+            self._attr_color_mode = ColorMode.RGB
 
         if "level" in data:
-            self._attr_brightness = int(data["level"] * 255)
+            """Rounded, levels are sent with 6 decimals and truncating would turn some brightnesses into one less"""
+            self._attr_brightness = round(data["level"] * 255)
 
     async def async_turn_on(self, **kwargs):
         """Turn on the light, switch color temperature, switch brightness, switch color operations"""
@@ -173,77 +160,61 @@ class CustomLight(LightEntity):
         kelvin = None
         rgb = None
 
+        """Values the light is expected to report once the command is applied"""
+        expected = {"on": 1}
+
         if "color_temp" in kwargs:
             """HA color temperature control page is reversed"""
-            kelvin = int(kwargs["color_temp"])
-            kelvin_bl = (kelvin - LIGHT_MIN_KELVIN) / (LIGHT_MAX_KELVIN - LIGHT_MIN_KELVIN)
-            kelvin = LIGHT_MHT_MAX_KELVIN - round(kelvin_bl * (LIGHT_MHT_MAX_KELVIN - LIGHT_MHT_MIN_KELVIN))
-            if kelvin > LIGHT_MHT_MAX_KELVIN:
-                kelvin = LIGHT_MHT_MAX_KELVIN
-            if kelvin < LIGHT_MHT_MIN_KELVIN:
-                kelvin = LIGHT_MHT_MIN_KELVIN
+            kelvin = mired_to_device_kelvin(kwargs["color_temp"])
             on = None
-            self._attr_color_temp = kwargs["color_temp"]
-            self._attr_rgb_color = color_temp_to_rgb(kelvin)
-            self._attr_color_mode = ColorMode.COLOR_TEMP
+            expected["kelvin"] = kelvin
 
         if "brightness" in kwargs:
             brightness_normalized = kwargs["brightness"] / 255
             level = round(brightness_normalized, 6)
 
             on = None
-            self._attr_brightness = kwargs["brightness"]
+            expected["level"] = level
 
         if "rgb_color" in kwargs:
-            rgb = kwargs["rgb_color"]
-            rgb = (rgb[0] << 16) + (rgb[1] << 8) + rgb[2]
+            rgb = rgb_tuple_to_int(kwargs["rgb_color"])
 
             on = None
-            self._attr_rgb_color = kwargs["rgb_color"]
-            self._attr_color_mode = ColorMode.RGB
+            expected["rgb"] = rgb
 
-        await self.exec_command(on=on, level=level, kelvin=kelvin, rgb=rgb)
+        pending = self.async_apply_optimistic(expected)
 
-        self.on_off = True
-
-        self.async_write_ha_state()
+        await self.exec_command(on=on, level=level, kelvin=kelvin, rgb=rgb, pending=pending)
 
     async def async_turn_off(self, **kwargs):
         """Turn off the lights"""
 
-        await self.exec_command(on=0)
-
-        self.on_off = False
-
-        self.async_write_ha_state()
+        pending = self.async_apply_optimistic({"on": 0})
 
-    async def exec_command(self, on=None, level=None, kelvin=None, rgb=None):
-        message = {
-            "seq": 1,
-            "data": {}
-        }
+        await self.exec_command(on=0, pending=pending)
 
-        if self.is_group:
-            message["data"]["room"] = self.room
-            message["data"]["subgroup"] = self.subgroup
-        else:
-            message["data"]["sn"] = self.unique_id
+    async def exec_command(self, on=None, level=None, kelvin=None, rgb=None, pending: PendingCommand | None = None):
+        data = {}
 
         if on is not None:
-            message["data"]["on"] = int(on)
+            data["on"] = int(on)
 
         if level is not None:
-            message["data"]["level"] = level
+            data["level"] = level
 
         if kelvin is not None:
-            message["data"]["kelvin"] = kelvin
+            data["kelvin"] = kelvin
 
         if rgb is not None:
-            message["data"]["rgb"] = rgb
-
-        await self.hass.data[MQTT_CLIENT_INSTANCE].async_publish(
-            "P/0/center/q20",
-            json.dumps(message),
-            0,
-            False
+            data["rgb"] = rgb
+
+        """Commands are coalesced per light, so a slider drag only sends the values the gateway can keep up with,
+        the values applied by the caller stay pending meanwhile, those of replaced commands are superseded,
+        they are rolled back if the command carrying them cannot be published"""
+        self.gateway.light_pipeline.async_submit(
+            self.unique_id, data, self._async_send_command,
+            lambda _err: self.async_discard_optimistic(pending),
         )
+
+    async def _async_send_command(self, data: dict):
+        await self.async_publish_command(self._command, data)
@@ -0,0 +1,135 @@
+"""Counters and latency histograms of the gateway hot paths"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any
+
+"""Upper bounds of the histogram buckets in seconds, the last bucket has no upper bound"""
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+"""Key of the messages whose topic has no route, so the number of keys stays bounded"""
+UNROUTED = "unrouted"
+
+
+class LatencyHistogram:
+    """Fixed bucket histogram, cheap enough to observe every message"""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float | None:
+        """Upper bound of the bucket holding the given fraction of the observations, in seconds"""
+
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_ms": milliseconds(self.percentile(0.5)),
+            "p99_ms": milliseconds(self.percentile(0.99)),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+def milliseconds(seconds: float | None) -> float | None:
+    """Duration in seconds shown in milliseconds, as the diagnostics and the sensors report them"""
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class TopicMetrics:
+    """Counters of the messages received on one route"""
+
+    __slots__ = ("received", "bytes", "dropped", "failed", "parse", "dispatch")
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.bytes = 0
+        """Empty or unparseable payloads"""
+        self.dropped = 0
+        """Messages whose handler raised"""
+        self.failed = 0
+        self.parse = LatencyHistogram()
+        self.dispatch = LatencyHistogram()
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "received": self.received,
+            "bytes": self.bytes,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "parse": self.parse.as_dict(),
+            "dispatch": self.dispatch.as_dict(),
+        }
+
+
+class GatewayMetrics:
+    """Metrics of one gateway, received messages per route pattern and published messages per topic"""
+
+    def __init__(self) -> None:
+        self.topics: dict[str, TopicMetrics] = {}
+        self.published: dict[str, int] = {}
+        """State reports of devices that have no entity"""
+        self.unknown_sn = 0
+
+    def topic(self, key: str) -> TopicMetrics:
+        metrics = self.topics.get(key)
+        if metrics is None:
+            metrics = self.topics[key] = TopicMetrics()
+        return metrics
+
+    def record_publish(self, topic: str) -> None:
+        self.published[topic] = self.published.get(topic, 0) + 1
+
+    @property
+    def received(self) -> int:
+        return sum(metrics.received for metrics in self.topics.values())
+
+    @property
+    def dropped(self) -> int:
+        return sum(metrics.dropped for metrics in self.topics.values())
+
+    @property
+    def published_total(self) -> int:
+        return sum(self.published.values())
+
+    def merged(self, attribute: str) -> LatencyHistogram:
+        """Histogram of all routes together, attribute is parse or dispatch"""
+
+        merged = LatencyHistogram()
+        for metrics in self.topics.values():
+            histogram: LatencyHistogram = getattr(metrics, attribute)
+            merged.buckets = [total + count for total, count in zip(merged.buckets, histogram.buckets)]
+            merged.count += histogram.count
+            merged.total += histogram.total
+            merged.max = max(merged.max, histogram.max)
+        return merged
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "received": {key: metrics.as_dict() for key, metrics in self.topics.items()},
+            "published": dict(self.published),
+            "unknown_sn": self.unknown_sn,
+        }
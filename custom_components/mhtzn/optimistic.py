@@ -0,0 +1,142 @@
+"""Optimistic entity state, reconciled against the state reports the gateway echoes after a command"""
+from __future__ import annotations
+
+import math
+from typing import Any
+
+"""Seconds a command waits for its echo before the state it announced is rolled back"""
+DEFAULT_TIMEOUT = 5
+
+"""Reported numbers within this relative or absolute distance of the expected ones confirm a command,
+devices round levels and colour temperatures"""
+REL_TOLERANCE = 0.01
+
+ABS_TOLERANCE = 0.01
+
+
+def _update_recent(values: dict, data: dict) -> None:
+    """Update values with data, the keys of data move to the end so the order tells which changed last"""
+
+    for key in values.keys() & data.keys():
+        del values[key]
+    values.update(data)
+
+
+def _matches(expected: Any, reported: Any) -> bool:
+    if isinstance(expected, (int, float)) and isinstance(reported, (int, float)):
+        return math.isclose(expected, reported, rel_tol=REL_TOLERANCE, abs_tol=ABS_TOLERANCE)
+    return expected == reported
+
+
+class PendingCommand:
+    """Values a command is expected to produce, in the format of a device state report"""
+
+    __slots__ = ("expected", "deadline")
+
+    def __init__(self, expected: dict, deadline: float) -> None:
+        self.expected = expected
+        self.deadline = deadline
+
+
+class OptimisticStats:
+    """Counters of the optimistic commands of the entities of a gateway"""
+
+    __slots__ = ("applied", "confirmed", "superseded", "rolled_back")
+
+    def __init__(self) -> None:
+        self.applied = 0
+        """Commands whose values were echoed by the device"""
+        self.confirmed = 0
+        """Commands replaced by a newer command on the same values before their echo"""
+        self.superseded = 0
+        """Commands whose echo never came, or whose publication failed"""
+        self.rolled_back = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "applied": self.applied,
+            "confirmed": self.confirmed,
+            "superseded": self.superseded,
+            "rolled_back": self.rolled_back,
+        }
+
+
+class OptimisticState:
+    """Last state confirmed by a device and the commands still waiting for their echo.
+
+    The state shown is the confirmed one with the expected values of the pending commands on top. Each value
+    a report echoes is confirmed on its own, a command is confirmed once all its values are. A report
+    contradicting a value leaves it pending, the report may have been sent before the command arrived."""
+
+    __slots__ = ("confirmed", "pending")
+
+    def __init__(self, confirmed: dict | None = None) -> None:
+        self.confirmed: dict = dict(confirmed or {})
+        self.pending: list[PendingCommand] = []
+
+    def expect(self, expected: dict, deadline: float) -> tuple[PendingCommand, int]:
+        """Add a pending command, return it and the number of older commands it replaced entirely"""
+
+        superseded = 0
+        for command in list(self.pending):
+            for key in expected.keys() & command.expected.keys():
+                del command.expected[key]
+            if not command.expected:
+                self.pending.remove(command)
+                superseded += 1
+        command = PendingCommand(dict(expected), deadline)
+        self.pending.append(command)
+        return command, superseded
+
+    def report(self, data: dict) -> int:
+        """Record a device report, return the number of pending commands it confirmed"""
+
+        _update_recent(self.confirmed, data)
+        if not self.pending:
+            return 0
+
+        confirmed = 0
+        for command in list(self.pending):
+            expected = command.expected
+            for key in expected.keys() & data.keys():
+                if _matches(expected[key], data[key]):
+                    del expected[key]
+            if not expected:
+                self.pending.remove(command)
+                confirmed += 1
+        return confirmed
+
+    def expire(self, now: float) -> int:
+        """Drop the commands whose deadline passed, return how many"""
+
+        expired = [command for command in self.pending if command.deadline <= now]
+        for command in expired:
+            self.pending.remove(command)
+        return len(expired)
+
+    def discard(self, command: PendingCommand) -> bool:
+        """Drop a pending command, used when it could not be published"""
+
+        if command in self.pending:
+            self.pending.remove(command)
+            return True
+        return False
+
+    def clear(self) -> int:
+        """Drop every pending command, return how many"""
+
+        count = len(self.pending)
+        self.pending.clear()
+        return count
+
+    def overlay(self) -> dict:
+        """Values of the pending commands, newest last"""
+
+        values: dict = {}
+        for command in self.pending:
+            _update_recent(values, command.expected)
+        return values
+
+    @property
+    def next_deadline(self) -> float | None:
+        return min((command.deadline for command in self.pending), default=None)
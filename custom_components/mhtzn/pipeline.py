@@ -0,0 +1,157 @@
+"""Latest-wins coalescing of the commands sent to lights"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+CommandSender = Callable[[dict], Awaitable[object]]
+
+"""Called with the error when the command carrying the fields of a submission could not be sent"""
+FailureHandler = Callable[[Exception], None]
+
+"""Receives the commands due at the same time (key -> fields), sends what it can combine and returns the
+keys it has taken care of"""
+BatchPlanner = Callable[[dict[str, dict]], Awaitable[set[str]]]
+
+
+def merge_light_fields(pending: dict, fields: dict) -> dict:
+    """Merge the fields of a new light command into the pending ones, later values win.
+
+    Turning the light off discards the pending brightness and colour, and any later change of
+    brightness or colour turns it back on, exactly like sending the commands one after the other."""
+
+    if fields.get("on") == 0:
+        return {"on": 0}
+
+    merged = dict(pending)
+    if merged.get("on") == 0:
+        del merged["on"]
+    merged.update(fields)
+    return merged
+
+
+class CommandPipeline:
+    """Coalesce the commands sent to each target and send at most `rate` commands per second to it.
+
+    The first command of a burst is sent immediately. Commands submitted while a target has to wait are
+    merged into one pending command, which is sent when the target is allowed again, so intermediate
+    values of a slider drag are dropped but the final value is always delivered.
+
+    Commands that become due within the same event loop iteration, such as those of one service call
+    targeting many lights, are handed to the planner together before being sent.
+
+    Submissions are not awaited, when the command carrying their fields fails the failure handlers of all
+    the submissions merged into it are called."""
+
+    def __init__(self, hass: HomeAssistant, rate: float, planner: BatchPlanner | None = None) -> None:
+        self._hass = hass
+        self._interval = 1 / rate if rate > 0 else 0
+        self._planner = planner
+        self._pending: dict[str, dict] = {}
+        self._senders: dict[str, CommandSender] = {}
+        self._failure_handlers: dict[str, list[FailureHandler]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._last_sent: dict[str, float] = {}
+        self._ready: dict[str, tuple[dict, CommandSender, list[FailureHandler]]] = {}
+        self._ready_handle: asyncio.Handle | None = None
+
+        """Number of submitted commands and number of commands actually sent"""
+        self.submitted = 0
+        self.sent = 0
+
+    @callback
+    def async_submit(self, key: str, fields: dict, send: CommandSender, failed: FailureHandler | None = None) -> None:
+        """Queue the fields of a command for a target, send() publishes the merged command and failed() is
+        called if it cannot"""
+
+        self.submitted += 1
+        self._pending[key] = merge_light_fields(self._pending.get(key, {}), fields)
+        self._senders[key] = send
+        if failed is not None:
+            self._failure_handlers.setdefault(key, []).append(failed)
+
+        if key in self._timers:
+            return
+
+        delay = self._last_sent.get(key, 0) + self._interval - time.monotonic()
+        if delay <= 0:
+            self._async_flush(key)
+        else:
+            self._timers[key] = self._hass.loop.call_later(delay, self._async_flush, key)
+
+    @callback
+    def async_cancel(self) -> None:
+        """Drop all pending commands"""
+
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+        self._senders.clear()
+        self._failure_handlers.clear()
+
+        if self._ready_handle is not None:
+            self._ready_handle.cancel()
+            self._ready_handle = None
+        self._ready.clear()
+
+    @callback
+    def _async_flush(self, key: str) -> None:
+        self._timers.pop(key, None)
+
+        fields = self._pending.pop(key, None)
+        send = self._senders.pop(key, None)
+        failure_handlers = self._failure_handlers.pop(key, [])
+        if fields is None or send is None:
+            return
+
+        self._last_sent[key] = time.monotonic()
+        ready = self._ready.get(key)
+        if ready is not None:
+            """Without a rate limit a target can be flushed twice before the ready commands are sent"""
+            fields = merge_light_fields(ready[0], fields)
+            failure_handlers = ready[2] + failure_handlers
+        self._ready[key] = (fields, send, failure_handlers)
+        if self._ready_handle is None:
+            self._ready_handle = self._hass.loop.call_soon(self._async_send_ready)
+
+    @callback
+    def _async_send_ready(self) -> None:
+        self._ready_handle = None
+        batch = self._ready
+        self._ready = {}
+        self._hass.async_create_task(self._async_send_batch(batch))
+
+    async def _async_send_batch(self, batch: dict[str, tuple[dict, CommandSender, list[FailureHandler]]]) -> None:
+        covered: set[str] = set()
+        if self._planner is not None and len(batch) > 1:
+            try:
+                covered = await self._planner({key: fields for key, (fields, _send, _failed) in batch.items()})
+            except Exception:
+                _LOGGER.exception("Error while planning %s commands", len(batch))
+                covered = set()
+
+        self.sent += len(batch) - len(covered)
+        await asyncio.gather(*(
+            self._async_send(key, send, fields, failure_handlers)
+            for key, (fields, send, failure_handlers) in batch.items()
+            if key not in covered
+        ))
+
+    async def _async_send(self, key: str, send: CommandSender, fields: dict,
+                          failure_handlers: list[FailureHandler]) -> None:
+        try:
+            await send(fields)
+        except Exception as err:
+            _LOGGER.exception("Error while sending command to %s", key)
+            for failed in failure_handlers:
+                try:
+                    failed(err)
+                except Exception:
+                    _LOGGER.exception("Error while handling the failed command of %s", key)
@@ -0,0 +1,110 @@
+"""Replace batches of single light commands by room and light group commands"""
+from __future__ import annotations
+
+import logging
+from typing import Callable, Iterable
+
+from .codec import CommandEnvelope
+
+_LOGGER = logging.getLogger(__name__)
+
+LIGHT_COMMAND_TOPIC = "P/0/center/q20"
+
+"""A group command only replaces at least this many single light commands"""
+MIN_GROUP_SIZE = 2
+
+
+class GroupCommandPlanner:
+    """Find the rooms and light groups completely covered by a batch of identical light commands.
+
+    Membership comes from the room and subgroup reported with each light in the device list, a room is
+    addressed with subgroup 0 and the whole house with room 0. No group is used before the complete device
+    list is known, a group command also switches the members that are not known yet. Lights without a
+    reported room are always sent one by one."""
+
+    def __init__(self, lights: Callable[[], Iterable[dict]], complete: Callable[[], bool]) -> None:
+        """lights returns the discovery payloads of the single lights, complete tells whether it is the
+        complete list of lights of the gateway"""
+        self._lights = lights
+        self._complete = complete
+        self._groups: list[tuple[tuple[int, int], frozenset[str]]] | None = None
+        self._envelopes: dict[tuple[int, int], CommandEnvelope] = {}
+
+        """Number of group commands sent and single light commands they replaced"""
+        self.group_commands = 0
+        self.replaced_commands = 0
+
+    def invalidate(self) -> None:
+        """Rebuild the membership the next time a batch is planned"""
+        self._groups = None
+
+    def _build_groups(self) -> list[tuple[tuple[int, int], frozenset[str]]]:
+        members: dict[tuple[int, int], set[str]] = {}
+        every_light: set[str] = set()
+
+        for light in self._lights():
+            sn = light["unique_id"]
+            every_light.add(sn)
+            room = light.get("room")
+            if room is None:
+                continue
+            members.setdefault((int(room), 0), set()).add(sn)
+            subgroup = light.get("subgroup")
+            if subgroup:
+                members.setdefault((int(room), int(subgroup)), set()).add(sn)
+
+        members[(0, 0)] = every_light
+
+        """Largest groups first, so a whole room wins over the light groups inside it"""
+        groups = [
+            (address, frozenset(sn_set))
+            for address, sn_set in members.items()
+            if len(sn_set) >= MIN_GROUP_SIZE
+        ]
+        groups.sort(key=lambda group: len(group[1]), reverse=True)
+        return groups
+
+    def plan(self, commands: dict[str, dict]) -> tuple[list[tuple[CommandEnvelope, dict]], set[str]]:
+        """Plan a batch of single light commands (sn -> fields).
+
+        Return the group commands to send and the sns they cover, the other commands are sent as is"""
+
+        if self._groups is None:
+            if not self._complete():
+                return [], set()
+            self._groups = self._build_groups()
+        if not self._groups or len(commands) < MIN_GROUP_SIZE:
+            return [], set()
+
+        """Only lights receiving exactly the same fields can share a command"""
+        by_fields: dict[tuple, set[str]] = {}
+        for sn, fields in commands.items():
+            by_fields.setdefault(tuple(sorted(fields.items())), set()).add(sn)
+
+        group_commands = []
+        covered: set[str] = set()
+        for fields_key, sn_set in by_fields.items():
+            if len(sn_set) < MIN_GROUP_SIZE:
+                continue
+            remaining = set(sn_set)
+            for address, members in self._groups:
+                if len(members) > len(remaining):
+                    continue
+                if members <= remaining:
+                    group_commands.append((self._envelope(address), dict(fields_key)))
+                    remaining -= members
+                    covered |= members
+                    self.group_commands += 1
+                    self.replaced_commands += len(members)
+                    if len(remaining) < MIN_GROUP_SIZE:
+                        break
+
+        return group_commands, covered
+
+    def _envelope(self, address: tuple[int, int]) -> CommandEnvelope:
+        envelope = self._envelopes.get(address)
+        if envelope is None:
+            room, subgroup = address
+            envelope = CommandEnvelope(LIGHT_COMMAND_TOPIC, {"room": room, "subgroup": subgroup})
+            self._envelopes[address] = envelope
+        return envelope
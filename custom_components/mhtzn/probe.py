@@ -0,0 +1,128 @@
+"""Check that a gateway broker accepts a connection before its entry is created"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+import struct
+import time
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+"""Seconds an address is given to accept the TCP connection and acknowledge the MQTT CONNECT"""
+PROBE_TIMEOUT = 5
+
+"""Keepalive announced in the CONNECT packet, the probe disconnects long before it matters"""
+PROBE_KEEPALIVE = 10
+
+"""CONNACK return codes of MQTT 3.1.1 meaning the credentials were rejected"""
+REFUSED_AUTH_CODES = (4, 5)
+
+PACKET_CONNACK = 0x20
+
+PACKET_DISCONNECT = b"\xe0\x00"
+
+
+class ProbeRefused(Exception):
+    """The broker answered the CONNECT with a non zero return code"""
+
+    def __init__(self, return_code: int) -> None:
+        super().__init__(f"connection refused with return code {return_code}")
+        self.return_code = return_code
+
+    @property
+    def bad_credentials(self) -> bool:
+        return self.return_code in REFUSED_AUTH_CODES
+
+
+def _string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _remaining_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | 0x80 if length else digit)
+        if not length:
+            return bytes(encoded)
+
+
+def connect_packet(client_id: str, username: str | None, password: str | None) -> bytes:
+    """MQTT 3.1.1 CONNECT packet with a clean session"""
+
+    flags = 0x02
+    payload = _string(client_id)
+    if username is not None:
+        flags |= 0x80
+        payload += _string(username)
+        if password is not None:
+            flags |= 0x40
+            payload += _string(password)
+
+    variable_header = _string("MQTT") + struct.pack("!BBH", 4, flags, PROBE_KEEPALIVE)
+    body = variable_header + payload
+    return b"\x10" + _remaining_length(len(body)) + body
+
+
+async def async_probe(host: str, port: int, username: str | None, password: str | None,
+                      timeout: float = PROBE_TIMEOUT) -> float:
+    """Connect to the broker at host, return the seconds until it acknowledged the MQTT CONNECT.
+
+    Raises ProbeRefused when the broker rejects the connection, OSError or asyncio.TimeoutError when it
+    cannot be reached"""
+
+    started = time.monotonic()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(connect_packet(f"{DOMAIN}-probe-{secrets.token_hex(4)}", username, password))
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(4), timeout - (time.monotonic() - started))
+        rtt = time.monotonic() - started
+
+        if header[0] != PACKET_CONNACK:
+            raise ProbeRefused(-1)
+        if header[3]:
+            raise ProbeRefused(header[3])
+
+        writer.write(PACKET_DISCONNECT)
+        await writer.drain()
+        return rtt
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def async_probe_best(hosts: list[str], port: int, username: str | None, password: str | None,
+                           timeout: float = PROBE_TIMEOUT) -> tuple[str, float]:
+    """Probe all the addresses of a gateway at once, return the first one to accept and its round trip time.
+
+    The probes start together, so the first to succeed is the fastest, the others are cancelled then.
+    When none succeeds the refusal of the broker is raised if there was one, otherwise the last error"""
+
+    tasks = {asyncio.create_task(async_probe(host, port, username, password, timeout)): host for host in hosts}
+    error: BaseException | None = None
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                host = tasks[task]
+                exception = task.exception()
+                if exception is None:
+                    _LOGGER.debug("Gateway broker %s:%s answered in %.1f ms", host, port, task.result() * 1000)
+                    return host, task.result()
+                _LOGGER.debug("Gateway broker %s:%s cannot be used: %r", host, port, exception)
+                if error is None or not isinstance(error, ProbeRefused):
+                    error = exception
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    raise error if error is not None else OSError("no address to probe")
@@ -0,0 +1,175 @@
+"""On-demand profiling of the event loop while it runs the integration"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+METHOD_SAMPLING = "sampling"
+
+METHOD_DETERMINISTIC = "deterministic"
+
+"""Seconds between two samples of the event loop stack"""
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+"""Samples whose stack has no frame in this directory are only counted, not kept"""
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+Frame = tuple[str, int, str]
+
+_active = False
+
+
+class SamplingProfiler:
+    """Sample the stack of one thread from a background thread.
+
+    The profiled thread is never interrupted or instrumented, its cost is the GIL handover at each
+    sample, so it is safe to run on a busy production event loop. Functions implemented in C, such as
+    json.loads, do not have a frame of their own and are accounted to the Python function calling them."""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL, root: str = PACKAGE_DIR) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._root = root
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+        """Number of times each stack was seen, stacks listed from the outermost frame"""
+        self.stacks: Counter[tuple[Frame, ...]] = Counter()
+        """Number of samples taken and of samples running integration code"""
+        self.samples = 0
+        self.kept = 0
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"{DOMAIN}_profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._elapsed = time.monotonic() - self._started
+
+    def _run(self) -> None:
+        root = self._root
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+
+            stack = []
+            in_package = False
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                if not in_package and code.co_filename.startswith(root):
+                    in_package = True
+                frame = frame.f_back
+
+            if in_package:
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+                self.kept += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and similar tools"""
+        return "".join(
+            ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            + f" {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+    def pstats(self) -> dict:
+        """Samples converted to the marshalled format of pstats.Stats.
+
+        Times are estimated from the number of samples, the interval actually achieved between two samples
+        can be longer than requested while the profiled thread holds the GIL"""
+
+        per_sample = self._elapsed / self.samples if self.samples and self._elapsed else self._interval
+        stats: dict[Frame, list] = {}
+        for stack, count in self.stacks.items():
+            seconds = count * per_sample
+            seen = set()
+            for index, function in enumerate(stack):
+                entry = stats.setdefault(function, [0, 0, 0.0, 0.0, {}])
+                leaf = index == len(stack) - 1
+                entry[1] += count
+                if function not in seen:
+                    """Recursive calls are counted once in the cumulative time"""
+                    seen.add(function)
+                    entry[0] += count
+                    entry[3] += seconds
+                if leaf:
+                    entry[2] += seconds
+                if index:
+                    caller = stack[index - 1]
+                    nc, cc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                    entry[4][caller] = (nc + count, cc + count, tt + (seconds if leaf else 0.0), ct + seconds)
+
+        return {function: (cc, nc, tt, ct, callers) for function, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def _write_profile(profiler: SamplingProfiler, base: str) -> list[str]:
+    with open(f"{base}.pstats", "wb") as file:
+        marshal.dump(profiler.pstats(), file)
+    with open(f"{base}.collapsed", "w", encoding="utf-8") as file:
+        file.write(profiler.collapsed())
+    return [f"{base}.pstats", f"{base}.collapsed"]
+
+
+async def async_profile(hass: HomeAssistant, duration: float, method: str = METHOD_SAMPLING,
+                        interval: float = DEFAULT_SAMPLE_INTERVAL) -> list[str]:
+    """Profile the event loop for duration seconds, return the files written to the configuration directory.
+
+    The sampling method writes a .pstats and a .collapsed file, the deterministic method runs cProfile on
+    the event loop thread, which is exact but slows it down, and writes a .pstats file"""
+
+    global _active
+    if _active:
+        raise HomeAssistantError("A profile is already running")
+    _active = True
+
+    base = hass.config.path(f"{DOMAIN}_profile_{time.strftime('%Y%m%d_%H%M%S')}")
+    try:
+        if method == METHOD_DETERMINISTIC:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profile.disable()
+            await hass.async_add_executor_job(profile.dump_stats, f"{base}.pstats")
+            files = [f"{base}.pstats"]
+        else:
+            profiler = SamplingProfiler(threading.get_ident(), interval)
+            profiler.start()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                await hass.async_add_executor_job(profiler.stop)
+            files = await hass.async_add_executor_job(_write_profile, profiler, base)
+            _LOGGER.info(
+                "Profile sampled %s stacks, %s of them running %s code", profiler.samples, profiler.kept, DOMAIN
+            )
+    finally:
+        _active = False
+
+    _LOGGER.info("Profile of %.0fs written to %s", duration, ", ".join(files))
+    return files
@@ -0,0 +1,177 @@
+"""Correlation of the requests sent to the gateway with their responses"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+"""Seconds to wait for the response of a request"""
+DEFAULT_REQUEST_TIMEOUT = 10
+
+SEQ_MAX = 0x7FFFFFFF
+
+
+def response_suffix(topic: str) -> str:
+    """Topic suffix of the response to a request topic, for example P/0/center/q5 -> center/p5"""
+
+    parts = topic.split("/")
+    last = parts[-1]
+    if last.startswith("q"):
+        last = "p" + last[1:]
+    return f"{parts[-2]}/{last}" if len(parts) > 1 else last
+
+
+class RequestTimeout(asyncio.TimeoutError):
+    """The gateway did not answer a request in time"""
+
+
+class _PendingRequest:
+    __slots__ = ("seq", "topic", "suffix", "future", "sent")
+
+    def __init__(self, seq: int, topic: str, suffix: str, future: asyncio.Future) -> None:
+        self.seq = seq
+        self.topic = topic
+        self.suffix = suffix
+        self.future = future
+        self.sent = time.monotonic()
+
+
+class RequestStats:
+    """Counters and latency of the requests sent to one topic"""
+
+    __slots__ = ("requests", "responses", "timeouts", "latency_total", "latency_last", "latency_max")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.latency_total = 0.0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "timeouts": self.timeouts,
+            "latency_last": round(self.latency_last, 4),
+            "latency_max": round(self.latency_max, 4),
+            "latency_avg": round(self.latency_total / self.responses, 4) if self.responses else None,
+        }
+
+
+class RequestManager:
+    """Assign sequence numbers to outgoing messages and match responses to the pending requests.
+
+    A response is matched by the seq it echoes. When the gateway does not echo the seq, the oldest
+    pending request whose response topic matches is resolved instead.
+
+    publish is called as publish(topic, data, seq=seq)."""
+
+    def __init__(self, hass: HomeAssistant, publish: Callable[..., Awaitable[None]]) -> None:
+        self._hass = hass
+        self._publish = publish
+        self._seq = 0
+        self._pending: dict[int, _PendingRequest] = {}
+        self._pending_by_suffix: dict[str, deque[_PendingRequest]] = {}
+
+        self.stats: dict[str, RequestStats] = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of requests waiting for a response"""
+        return len(self._pending)
+
+    def next_seq(self) -> int:
+        """Return a sequence number not used by any pending request"""
+
+        while True:
+            self._seq = self._seq + 1 if self._seq < SEQ_MAX else 1
+            if self._seq not in self._pending:
+                return self._seq
+
+    async def async_request(self, topic: str, data: dict, timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                            retries: int = 0) -> dict:
+        """Publish a request and wait for its response, raise RequestTimeout if none arrives"""
+
+        stats = self.stats.setdefault(topic, RequestStats())
+
+        for attempt in range(retries + 1):
+            seq = self.next_seq()
+            suffix = response_suffix(topic)
+            pending = _PendingRequest(seq, topic, suffix, self._hass.loop.create_future())
+            self._pending[seq] = pending
+            self._pending_by_suffix.setdefault(suffix, deque()).append(pending)
+            stats.requests += 1
+
+            try:
+                await self._publish(topic, data, seq=seq)
+                return await asyncio.wait_for(asyncio.shield(pending.future), timeout)
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                _LOGGER.debug("Request %s seq %s timed out (attempt %s)", topic, seq, attempt + 1)
+            finally:
+                self._discard(pending)
+
+        raise RequestTimeout(f"No response to {topic} after {retries + 1} attempts")
+
+    @callback
+    def async_resolve(self, topic: str, payload: Any) -> bool:
+        """Complete the pending request answered by a message, return True if one was found"""
+
+        if not self._pending:
+            return False
+
+        pending = None
+        seq = payload.get("seq") if isinstance(payload, dict) else None
+        if isinstance(seq, int):
+            pending = self._pending.get(seq)
+            if pending is not None and not topic.endswith(pending.suffix):
+                pending = None
+
+        if pending is None:
+            for suffix, queue in self._pending_by_suffix.items():
+                if queue and topic.endswith(suffix):
+                    pending = queue[0]
+                    break
+
+        if pending is None:
+            return False
+
+        self._discard(pending)
+
+        if not pending.future.done():
+            latency = time.monotonic() - pending.sent
+            stats = self.stats.setdefault(pending.topic, RequestStats())
+            stats.responses += 1
+            stats.latency_last = latency
+            stats.latency_total += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            pending.future.set_result(payload)
+
+        return True
+
+    @callback
+    def async_cancel(self) -> None:
+        """Cancel all pending requests"""
+
+        for pending in list(self._pending.values()):
+            if not pending.future.done():
+                pending.future.cancel()
+        self._pending.clear()
+        self._pending_by_suffix.clear()
+
+    def _discard(self, pending: _PendingRequest) -> None:
+        self._pending.pop(pending.seq, None)
+        queue = self._pending_by_suffix.get(pending.suffix)
+        if queue:
+            try:
+                queue.remove(pending)
+            except ValueError:
+                pass
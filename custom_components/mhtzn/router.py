@@ -0,0 +1,108 @@
+"""Table driven topic router for the messages reported by the gateway"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Awaitable, Callable
+
+_LOGGER = logging.getLogger(__name__)
+
+"""Receives the topic, the decoded payload and the size of the raw payload in bytes"""
+MessageHandler = Callable[[str, Any, int], Awaitable[None]]
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """Determine whether a topic matches an MQTT subscription pattern ('+' and '#' wildcards)"""
+
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+
+    for index, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+
+    return len(pattern_levels) == len(topic_levels)
+
+
+class Route:
+    """A subscribed topic and its handler, the messages it receives are counted by the gateway metrics"""
+
+    __slots__ = ("pattern", "handler")
+
+    def __init__(self, pattern: str, handler: MessageHandler) -> None:
+        self.pattern = pattern
+        self.handler = handler
+
+
+class TopicRouter:
+    """Dispatch messages to the handler registered for their topic.
+
+    Exact topics are resolved with a single dictionary lookup. Wildcard topics are matched once per
+    concrete topic and the result is cached, so every following message on that topic is also a
+    single dictionary lookup, no matter how many routes are registered."""
+
+    def __init__(self) -> None:
+        self._exact: dict[str, Route] = {}
+        self._wildcard: list[Route] = []
+        self._resolved: dict[str, Route | None] = {}
+
+    @property
+    def patterns(self) -> list[str]:
+        """All registered subscription patterns"""
+        return [*self._exact, *(route.pattern for route in self._wildcard)]
+
+    @property
+    def routes(self) -> list[Route]:
+        """All registered routes"""
+        return [*self._exact.values(), *self._wildcard]
+
+    def register(self, pattern: str, handler: MessageHandler) -> Route:
+        """Register the handler of a subscription pattern"""
+
+        route = Route(pattern, handler)
+
+        if "+" in pattern or "#" in pattern:
+            self._wildcard = [item for item in self._wildcard if item.pattern != pattern]
+            self._wildcard.append(route)
+        else:
+            self._exact[pattern] = route
+
+        """Previously resolved topics may now belong to the new route"""
+        self._resolved.clear()
+
+        return route
+
+    def resolve(self, topic: str) -> Route | None:
+        """Find the route of a concrete topic"""
+
+        route = self._exact.get(topic)
+        if route is not None:
+            return route
+
+        try:
+            return self._resolved[topic]
+        except KeyError:
+            pass
+
+        route = None
+        for candidate in self._wildcard:
+            if topic_matches(candidate.pattern, topic):
+                route = candidate
+                break
+
+        self._resolved[topic] = route
+        return route
+
+    async def async_dispatch(self, topic: str, payload: Any, payload_size: int = 0) -> bool:
+        """Deliver a message to the handler of its topic, return False if no route matches"""
+
+        route = self.resolve(topic)
+        if route is None:
+            _LOGGER.debug("No route for topic: '%s'", topic)
+            return False
+
+        await route.handler(topic, payload, payload_size)
+        return True
@@ -1,90 +1,167 @@
 """Scan for LAN Gateways"""
+from __future__ import annotations
 
 import asyncio
 import logging
+import time
 
+from homeassistant.components import zeroconf
 from homeassistant.components.zeroconf import info_from_service
-from zeroconf import IPVersion, ServiceBrowser, ServiceStateChange, Zeroconf
+from homeassistant.const import CONF_NAME, EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, Event, callback
+from zeroconf import ServiceStateChange, Zeroconf
+from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo
 
+from .const import DOMAIN
 from .util import format_connection
 
-connection_dict = {}
-
 _LOGGER = logging.getLogger(__name__)
 
+SERVICE_TYPE = "_mqtt._tcp.local."
 
-def on_service_state_change(
-        zeroconf: Zeroconf, service_type: str, name: str, state_change: ServiceStateChange
-) -> None:
-    """This callback function is triggered when a gateway device is found"""
-    global connection_dict
-    if state_change is ServiceStateChange.Added or state_change is ServiceStateChange.Updated:
-        discovery_info = zeroconf.get_service_info(service_type, name)
-        _LOGGER.warning("state_change : %s ; data : %s", state_change, discovery_info)
-        if discovery_info is not None:
-            discovery_info = info_from_service(discovery_info)
-            service_type = service_type[:-1]
-            name = name.replace(f".{service_type}.", "")
-            connection = format_connection(discovery_info)
-            connection_dict[name] = connection
-    elif state_change is ServiceStateChange.Removed:
-        _LOGGER.warning("state_change : %s", state_change)
-        service_type = service_type[:-1]
-        name = name.replace(f".{service_type}.", "")
-        del connection_dict[name]
-
-    _LOGGER.warning("change on_service_state_change : %s", connection_dict)
-
-
-async def scan_and_get_connection_dict(timeout):
-    """Search a list of gateways within a specified time range"""
-    return await scan_commpn(scan_type="dict", timeout=timeout)
-
-
-async def scan_commpn(scan_type: str, timeout: int, name=None):
-    """scan gateway"""
-    global connection_dict
-    zc = Zeroconf(ip_version=IPVersion.All)
-    zc.start()
-    services = ["_mqtt._tcp.local."]
-    kwargs = {'handlers': [on_service_state_change]}
-    browser = ServiceBrowser(zc, services, **kwargs)  # type: ignore
-
-    connection = None
-    time1 = 1
-
-    if scan_type == "dict":
-        while True:
-            if time1 > timeout:
-                break
-            await asyncio.sleep(1)
-            time1 = time1 + 1
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
 
-        if browser is not None:
-            browser.cancel()
+"""Seconds a gateway stays known without being announced again, the usual mDNS TTL of a service pointer"""
+DISCOVERY_TTL = 4500
 
-        if zc is not None:
-            zc.close()
+"""Milliseconds to wait for the address and properties of an announced gateway"""
+RESOLVE_TIMEOUT = 3000
 
-        return connection_dict
 
-    else:
-        while True:
-            if time1 > timeout:
-                break
-            await asyncio.sleep(1)
-            if name in connection_dict:
-                connection = connection_dict[name]
-            time1 = time1 + 1
+class _DiscoveredGateway:
+    __slots__ = ("connection", "expires")
+
+    def __init__(self, connection: dict, expires: float) -> None:
+        self.connection = connection
+        self.expires = expires
+
+
+class GatewayDiscovery:
+    """Long-lived registry of the gateways announced on the LAN.
 
-        if browser is not None:
-            browser.cancel()
+    It browses with the Zeroconf instance Home Assistant shares between integrations. Browser callbacks
+    may come from the Zeroconf thread, they are handed to the event loop, which is the only place the
+    registry is modified. Waiters are woken up as soon as a gateway is resolved."""
 
-        if zc is not None:
-            zc.close()
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._gateways: dict[str, _DiscoveredGateway] = {}
+        self._browser: AsyncServiceBrowser | None = None
+        self._aiozc = None
+        self._changed = asyncio.Event()
+        self._resolving: dict[str, asyncio.Task] = {}
 
-        return connection
+    async def async_start(self) -> None:
+        self._aiozc = await zeroconf.async_get_async_instance(self._hass)
+        self._browser = AsyncServiceBrowser(
+            self._aiozc.zeroconf, [SERVICE_TYPE], handlers=[self._on_service_state_change]
+        )
 
+    async def async_stop(self) -> None:
+        for task in self._resolving.values():
+            task.cancel()
+        self._resolving.clear()
+        if self._browser is not None:
+            await self._browser.async_cancel()
+            self._browser = None
 
-async def scan_and_get_connection_info(name: str, timeout: int):
-    return await scan_commpn(scan_type="info", name=name, timeout=timeout)
+    @callback
+    def async_connections(self) -> dict[str, dict]:
+        """Gateways currently known, by name"""
+
+        now = time.monotonic()
+        for name in [name for name, gateway in self._gateways.items() if gateway.expires <= now]:
+            del self._gateways[name]
+        return {name: dict(gateway.connection) for name, gateway in self._gateways.items()}
+
+    @callback
+    def async_add(self, connection: dict) -> None:
+        """Record a gateway, also used for the gateways Home Assistant's own zeroconf discovery reports"""
+
+        name = connection.get(CONF_NAME)
+        if name is None:
+            return
+        self._gateways[name] = _DiscoveredGateway(connection, time.monotonic() + DISCOVERY_TTL)
+        self._changed.set()
+
+    async def async_wait(self, timeout: float, name: str | None = None) -> dict[str, dict]:
+        """Return the known gateways as soon as there is one (or the named one), at the latest after timeout"""
+
+        deadline = time.monotonic() + timeout
+        while True:
+            connections = self.async_connections()
+            found = bool(connections) if name is None else name in connections
+            if found:
+                return connections
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return connections
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return self.async_connections()
+
+    def _on_service_state_change(self, zeroconf: Zeroconf, service_type: str, name: str,
+                                 state_change: ServiceStateChange) -> None:
+        """Browser callback, possibly called from the Zeroconf thread"""
+        self._hass.loop.call_soon_threadsafe(self._async_service_state_change, service_type, name, state_change)
+
+    @callback
+    def _async_service_state_change(self, service_type: str, name: str, state_change: ServiceStateChange) -> None:
+        short_name = name.replace(f".{service_type[:-1]}.", "")
+
+        if state_change is ServiceStateChange.Removed:
+            task = self._resolving.pop(name, None)
+            if task is not None:
+                task.cancel()
+            if self._gateways.pop(short_name, None) is not None:
+                _LOGGER.debug("Gateway %s left the network", short_name)
+                self._changed.set()
+            return
+
+        if name not in self._resolving:
+            self._resolving[name] = self._hass.async_create_task(self._async_resolve(service_type, name))
+
+    async def _async_resolve(self, service_type: str, name: str) -> None:
+        try:
+            info = AsyncServiceInfo(service_type, name)
+            if not await info.async_request(self._aiozc.zeroconf, RESOLVE_TIMEOUT):
+                _LOGGER.debug("Gateway %s did not answer the mDNS query", name)
+                return
+            discovery_info = info_from_service(info)
+            if discovery_info is None:
+                return
+            connection = format_connection(discovery_info, info.parsed_addresses())
+            _LOGGER.debug("Gateway %s found at %s", connection[CONF_NAME], discovery_info.host)
+            self.async_add(connection)
+        finally:
+            if self._resolving.get(name) is asyncio.current_task():
+                del self._resolving[name]
+
+
+async def async_get_discovery(hass: HomeAssistant) -> GatewayDiscovery:
+    """The discovery registry of this Home Assistant instance, started on first use"""
+
+    discovery: GatewayDiscovery | None = hass.data.get(DATA_DISCOVERY)
+    if discovery is None:
+        discovery = hass.data[DATA_DISCOVERY] = GatewayDiscovery(hass)
+        await discovery.async_start()
+
+        async def async_stop_discovery(_event: Event):
+            await discovery.async_stop()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_discovery)
+    return discovery
+
+
+async def scan_and_get_connection_dict(hass: HomeAssistant, timeout: float) -> dict[str, dict]:
+    """Gateways on the LAN by name, waits at most timeout seconds when none is known yet"""
+    discovery = await async_get_discovery(hass)
+    return await discovery.async_wait(timeout)
+
+
+async def scan_and_get_connection_info(hass: HomeAssistant, name: str, timeout: float) -> dict | None:
+    """Connection information of a gateway, waits at most timeout seconds when it is not known yet"""
+    discovery = await async_get_discovery(hass)
+    return (await discovery.async_wait(timeout, name)).get(name)
@@ -1,7 +1,6 @@
 """Business logic for scene entity."""
 from __future__ import annotations
 
-import json
 import logging
 from typing import Any
 
@@ -12,7 +11,9 @@ from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DOMAIN, MQTT_CLIENT_INSTANCE, EVENT_ENTITY_REGISTER, MANUFACTURER
+from .codec import CommandEnvelope
+from .const import DOMAIN, EVENT_ENTITY_REGISTER, MANUFACTURER
+from .entity import GatewayEntityMixin
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,18 +28,22 @@ async def async_setup_entry(
     """This method is executed after the integration is initialized to create an event listener,
      which is used to create a sub-device"""
 
-    async def async_discover(config_payload):
+    async def async_discover(config_payloads: list[dict]):
         try:
-            async_add_entities([CustomScene(hass, config_payload, config_entry)])
+            async_add_entities([CustomScene(hass, config_payload, config_entry) for config_payload in config_payloads])
         except Exception:
             raise
 
-    async_dispatcher_connect(
-        hass, EVENT_ENTITY_REGISTER.format(COMPONENT), async_discover
-    )
+    """The listener is removed when the entry is unloaded, so a reload does not keep the old platform alive"""
+    config_entry.async_on_unload(async_dispatcher_connect(
+        hass, EVENT_ENTITY_REGISTER.format(config_entry.entry_id, COMPONENT), async_discover
+    ))
 
+    """Create the entities the gateway already knows, including those restored from the catalog cache"""
+    hass.data[DOMAIN][config_entry.entry_id].async_platform_ready(COMPONENT)
 
-class CustomScene(Scene):
+
+class CustomScene(GatewayEntityMixin, Scene):
     """Custom entity class to handle business logic related to scenes"""
 
     def activate(self, **kwargs: Any) -> None:
@@ -53,6 +58,8 @@ class CustomScene(Scene):
 
         self.id = config["id"]
 
+        self._command = CommandEnvelope("P/0/center/q30", {"id": self.id})
+
         self._attr_name = config["name"]
 
         self.hass = hass
@@ -75,16 +82,4 @@ class CustomScene(Scene):
         await self.exec_command()
 
     async def exec_command(self):
-        message = {
-            "seq": 1,
-            "data": {
-                "id": self.id
-            }
-        }
-
-        await self.hass.data[MQTT_CLIENT_INSTANCE].async_publish(
-            "P/0/center/q30",
-            json.dumps(message),
-            0,
-            False
-        )
+        await self.async_publish_command(self._command)
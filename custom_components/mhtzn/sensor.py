@@ -0,0 +1,131 @@
+"""Diagnostic sensors exposing the metrics of a gateway"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Any, Callable
+
+from homeassistant.components.sensor import SensorEntity, SensorEntityDescription, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import TIME_MILLISECONDS
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN, MANUFACTURER
+from .metrics import milliseconds
+
+_LOGGER = logging.getLogger(__name__)
+
+COMPONENT = "sensor"
+
+"""The metrics are read from the gateway counters, polling them keeps the hot paths free of state writes"""
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+"""Description, value and extra attributes of each sensor, the functions receive the gateway"""
+SENSORS: tuple[tuple[SensorEntityDescription, Callable[[Any], Any], Callable[[Any], dict] | None], ...] = (
+    (
+        SensorEntityDescription(key="messages_received", name="Messages received",
+                                state_class=SensorStateClass.TOTAL_INCREASING),
+        lambda hub: hub.metrics.received,
+        lambda hub: {key: metrics.received for key, metrics in hub.metrics.topics.items()},
+    ),
+    (
+        SensorEntityDescription(key="messages_dropped", name="Messages dropped",
+                                state_class=SensorStateClass.TOTAL_INCREASING),
+        lambda hub: hub.metrics.dropped,
+        lambda hub: {
+            **{key: metrics.dropped for key, metrics in hub.metrics.topics.items()},
+            "unknown_sn": hub.metrics.unknown_sn,
+        },
+    ),
+    (
+        SensorEntityDescription(key="parse_p99", name="JSON parse time p99",
+                                native_unit_of_measurement=TIME_MILLISECONDS,
+                                state_class=SensorStateClass.MEASUREMENT),
+        lambda hub: milliseconds(hub.metrics.merged("parse").percentile(0.99)),
+        lambda hub: {key: metrics.parse.as_dict() for key, metrics in hub.metrics.topics.items()},
+    ),
+    (
+        SensorEntityDescription(key="dispatch_p99", name="Dispatch time p99",
+                                native_unit_of_measurement=TIME_MILLISECONDS,
+                                state_class=SensorStateClass.MEASUREMENT),
+        lambda hub: milliseconds(hub.metrics.merged("dispatch").percentile(0.99)),
+        lambda hub: {key: metrics.dispatch.as_dict() for key, metrics in hub.metrics.topics.items()},
+    ),
+    (
+        SensorEntityDescription(key="state_writes", name="Entity state writes",
+                                state_class=SensorStateClass.TOTAL_INCREASING),
+        lambda hub: hub.write_stats.written,
+        lambda hub: hub.write_stats.as_dict(),
+    ),
+    (
+        SensorEntityDescription(key="messages_published", name="Messages published",
+                                state_class=SensorStateClass.TOTAL_INCREASING),
+        lambda hub: hub.metrics.published_total,
+        lambda hub: dict(hub.metrics.published),
+    ),
+)
+
+
+async def async_setup_entry(
+        hass: HomeAssistant,
+        config_entry: ConfigEntry,
+        async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Create the metric sensors of the gateway, they are disabled until the user enables them"""
+
+    async_add_entities([
+        GatewayMetricSensor(config_entry, description, value, attributes)
+        for description, value, attributes in SENSORS
+    ])
+
+
+class GatewayMetricSensor(SensorEntity):
+    """Metric of a gateway, such as the number of messages received"""
+
+    should_poll = True
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, config_entry: ConfigEntry, description: SensorEntityDescription,
+                 value: Callable[[Any], Any], attributes: Callable[[Any], dict] | None) -> None:
+        self.entity_description = description
+        self.config_entry = config_entry
+        self._value = value
+        self._attributes = attributes
+
+        self._attr_unique_id = f"{config_entry.entry_id}-{description.key}"
+        self._attr_name = f"{config_entry.title} {description.name}"
+
+    @property
+    def gateway(self):
+        return self.hass.data[DOMAIN].get(self.config_entry.entry_id)
+
+    @property
+    def available(self) -> bool:
+        return self.gateway is not None
+
+    @property
+    def native_value(self):
+        hub = self.gateway
+        return None if hub is None else self._value(hub)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        hub = self.gateway
+        if hub is None or self._attributes is None:
+            return None
+        return self._attributes(hub)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """The gateway itself"""
+        return {
+            "identifiers": {(DOMAIN, self.config_entry.entry_id)},
+            "name": self.config_entry.title,
+            "manufacturer": MANUFACTURER,
+        }
@@ -0,0 +1,5 @@
+"""Make the integration importable as custom_components.mhtzn, the tests need Home Assistant installed"""
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
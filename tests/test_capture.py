@@ -0,0 +1,67 @@
+"""Replay of a capture into a gateway set up against the simulated gateway of the benchmarks"""
+import asyncio
+import json
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import BenchEntry, async_setup_gateway, async_unload_gateway, create_hass  # noqa: E402
+from homeassistant.const import CONF_NAME  # noqa: E402
+from homeassistant.helpers import entity_registry  # noqa: E402
+from simulator import GatewaySimulator  # noqa: E402
+
+from custom_components.mhtzn.capture import FRAME_HEADER, MAGIC  # noqa: E402
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE, DOMAIN  # noqa: E402
+
+
+def _write_capture(path: str, frames: list[tuple[str, dict]]) -> None:
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        for topic, message in frames:
+            payload = json.dumps(message).encode()
+            file.write(FRAME_HEADER.pack(time.time(), len(topic), len(payload)) + topic.encode() + payload)
+
+
+def test_replayed_catalog_leaves_entities_registry_and_cache_alone():
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            entry = BenchEntry("replay", {CONF_NAME: "replay", CONF_LIGHT_DEVICE_TYPE: "single"})
+            gateway, platforms = await async_setup_gateway(hass, GatewaySimulator(lights=3, scenes=1), entry)
+
+            foreign = {"sn": "FOREIGN0001", "devType": 1, "name": "Foreign", "room": 1, "subgroup": 1, "on": 1}
+            path = f"{config_dir}/replay.capture"
+            _write_capture(path, [
+                ("mhtzn/center/p5", {"seq": 1, "data": {"start": 0, "count": 1, "total": 1, "list": [foreign]}}),
+                ("mhtzn/center/p28", {"seq": 2, "data": [{"id": 99, "name": "Foreign scene"}]}),
+                ("p/SIM0001/event/3", {"seq": 0, "data": [{"sn": "L0000000", "on": 1, "level": 0.5}]}),
+            ])
+            replayed = await gateway.async_replay_capture(path, speed=0)
+            await asyncio.sleep(0.2)
+            await hass.async_block_till_done()
+
+            registry = entity_registry.async_get(hass)
+            result = {
+                "replayed": replayed,
+                "lights": set(gateway._entities["light"]),
+                "scenes": len(gateway._entities["scene"]),
+                "cached": set(gateway.catalog_cache.entities["light"]),
+                "foreign_entity": registry.async_get_entity_id("light", DOMAIN, "FOREIGN0001"),
+                "state": hass.states.get(registry.async_get_entity_id("light", DOMAIN, "L0000000")).state,
+            }
+
+            await async_unload_gateway(hass, entry, platforms)
+            await hass.async_stop(force=True)
+            return result
+
+    result = asyncio.run(run())
+
+    assert result["replayed"] == 3
+    assert result["lights"] == {"L0000000", "L0000001", "L0000002"}
+    assert result["cached"] == result["lights"]
+    assert result["scenes"] == 1
+    assert result["foreign_entity"] is None
+    assert result["state"] == "on"
@@ -0,0 +1,180 @@
+"""Tests of the pipelined and adaptive paging of the device list"""
+import asyncio
+import json
+import types
+
+from custom_components.mhtzn import catalog
+from custom_components.mhtzn.catalog import DeviceCatalogFetcher, PAGE_SIZE_MAX, PAGE_SIZE_MIN, PAGE_WINDOW
+
+
+def _devices(count):
+    return [{"sn": f"D{index:06d}", "devType": 1} for index in range(count)]
+
+
+async def _fetcher():
+    loop = asyncio.get_running_loop()
+    requests = []
+
+    async def publish(data):
+        requests.append(data)
+
+    fetcher = DeviceCatalogFetcher(types.SimpleNamespace(loop=loop, async_create_task=loop.create_task), publish)
+    return fetcher, requests
+
+
+async def _serve(fetcher, requests, devices, max_page=None, drop=lambda request: False):
+    """Answer the q5 requests like the gateway, return the devices reported by the fetcher"""
+
+    received = []
+    while requests:
+        request = requests.pop(0)
+        if drop(request):
+            continue
+        count = request["max"] if max_page is None else min(request["max"], max_page)
+        page = devices[request["start"]:request["start"] + count]
+        data = {"start": request["start"], "count": len(page), "total": len(devices), "list": page}
+        received += await fetcher.async_handle_page(data, len(json.dumps(data)))
+    return received
+
+
+def test_pages_the_whole_list_with_several_pages_in_flight():
+    async def run():
+        fetcher, requests = await _fetcher()
+        devices = _devices(1234)
+        await fetcher.async_start()
+        assert len(requests) == 1
+
+        received = await _serve(fetcher, requests, devices)
+        return fetcher, received, devices
+
+    fetcher, received, devices = asyncio.run(run())
+    assert [device["sn"] for device in received] == [device["sn"] for device in devices]
+    assert fetcher.complete
+    assert fetcher.retries == 0 and fetcher.duplicates == 0
+    assert 1 < fetcher.requests < 1234 / PAGE_SIZE_MIN
+
+
+def test_short_pages_are_requested_again_from_where_they_stopped():
+    async def run():
+        fetcher, requests = await _fetcher()
+        devices = _devices(300)
+        await fetcher.async_start()
+        received = await _serve(fetcher, requests, devices, max_page=30)
+        return fetcher, received
+
+    fetcher, received = asyncio.run(run())
+    assert len(received) == 300
+    assert fetcher.complete
+
+
+def test_devices_received_twice_are_reported_once():
+    async def run():
+        fetcher, requests = await _fetcher()
+        devices = _devices(150)
+        await fetcher.async_start()
+        received = await _serve(fetcher, requests, devices)
+
+        """A late answer to an overlapping request"""
+        page = {"start": 100, "count": 50, "total": 150, "list": devices[100:150]}
+        received += await fetcher.async_handle_page(page, 1000)
+        return fetcher, received
+
+    fetcher, received = asyncio.run(run())
+    assert len(received) == 150
+    assert fetcher.duplicates == 50
+
+
+def test_total_changing_during_the_fetch_is_followed():
+    async def run():
+        fetcher, requests = await _fetcher()
+        devices = _devices(250)
+        await fetcher.async_start()
+
+        """The first page announces 250 devices, then devices are added on the gateway"""
+        received = []
+        first = requests.pop(0)
+        page = {"start": 0, "count": first["max"], "total": 250, "list": devices[:first["max"]]}
+        received += await fetcher.async_handle_page(page, 5000)
+
+        devices += _devices(400)[250:]
+        received += await _serve(fetcher, requests, devices)
+        return fetcher, received
+
+    fetcher, received = asyncio.run(run())
+    assert fetcher.total == 400
+    assert len(received) == 400
+    assert fetcher.complete
+
+
+def test_missing_page_is_retried_then_the_fetch_fails(monkeypatch):
+    monkeypatch.setattr(catalog, "PAGE_TIMEOUT", 0.01)
+
+    async def run():
+        fetcher, requests = await _fetcher()
+        devices = _devices(500)
+        await fetcher.async_start()
+
+        """The first answer of the page after the first one is lost, its retry arrives"""
+        lost = []
+
+        def drop_once(request):
+            if request["start"] == 100 and not lost:
+                lost.append(request)
+                return True
+            return False
+
+        received = await _serve(fetcher, requests, devices, drop=drop_once)
+        while not fetcher.complete:
+            await asyncio.sleep(0.02)
+            received += await _serve(fetcher, requests, devices)
+        recovered = (fetcher.retries, len(received), fetcher.complete)
+
+        """The gateway never answers the page at 0 again"""
+        await fetcher.async_start()
+        await _serve(fetcher, requests, devices, drop=lambda request: request["start"] == 0)
+        finished = await fetcher.async_wait(timeout=1)
+        return recovered, finished, fetcher.retries, fetcher.complete
+
+    recovered, finished, retries, complete = asyncio.run(run())
+    assert recovered == (1, 500, True)
+    assert finished is False
+    assert retries == catalog.PAGE_RETRIES
+    assert complete is False
+
+
+def test_page_size_adapts_to_the_payload_size_and_throughput():
+    async def run():
+        fetcher, _requests = await _fetcher()
+
+        """Large devices: the page is bounded by the payload target"""
+        fetcher._adapt_page_size(payload_size=100 * 2000, received=100, latency=0.01)
+        large = fetcher.page_size
+
+        """Small devices on a fast link: bounded by PAGE_SIZE_MAX"""
+        fetcher._adapt_page_size(payload_size=100 * 50, received=100, latency=0.001)
+        small = fetcher.page_size
+
+        """Slow link: bounded by the time a page should take"""
+        fetcher._adapt_page_size(payload_size=100 * 100, received=100, latency=10)
+        slow = fetcher.page_size
+        return large, small, slow
+
+    large, small, slow = asyncio.run(run())
+    assert large == catalog.PAGE_TARGET_BYTES // 2000
+    assert small == PAGE_SIZE_MAX
+    assert slow == PAGE_SIZE_MIN
+
+
+def test_request_window_is_bounded():
+    async def run():
+        fetcher, requests = await _fetcher()
+        await fetcher.async_start()
+        first = requests.pop(0)
+        devices = _devices(10000)
+        page = {"start": 0, "count": first["max"], "total": 10000, "list": devices[:first["max"]]}
+        await fetcher.async_handle_page(page, 100 * first["max"])
+        in_flight = len(requests)
+        fetcher.async_cancel()
+        return in_flight
+
+    assert asyncio.run(run()) == PAGE_WINDOW
@@ -0,0 +1,104 @@
+"""Tests of the ordered command queues of the devices"""
+import asyncio
+import time
+import types
+
+import pytest
+
+from custom_components.mhtzn.command_queue import CommandQueue
+
+
+def _queue():
+    loop = asyncio.get_running_loop()
+    return CommandQueue(types.SimpleNamespace(loop=loop, async_create_task=loop.create_task))
+
+
+def test_commands_of_a_key_are_sent_in_order():
+    async def run():
+        queue = _queue()
+        sent = []
+
+        def command(name, delay):
+            async def send():
+                await asyncio.sleep(delay)
+                sent.append(name)
+                return name
+            return send
+
+        results = await asyncio.gather(
+            queue.async_send("a", command("a1", 0.03)),
+            queue.async_send("a", command("a2", 0)),
+            queue.async_send("b", command("b1", 0)),
+        )
+        return results, sent, queue.pending
+
+    results, sent, pending = asyncio.run(run())
+    assert results == ["a1", "a2", "b1"]
+    """The other key is not held up by the slow first command"""
+    assert sent == ["b1", "a1", "a2"]
+    assert pending == 0
+
+
+def test_gap_only_delays_the_next_command_of_the_same_key():
+    async def run():
+        queue = _queue()
+        sent_at = {}
+
+        def command(name):
+            async def send():
+                sent_at[name] = time.monotonic()
+            return send
+
+        started = time.monotonic()
+        await asyncio.gather(
+            queue.async_send("a", command("a1"), gap=0.1),
+            queue.async_send("a", command("a2")),
+            queue.async_send("b", command("b1")),
+        )
+        return {name: at - started for name, at in sent_at.items()}
+
+    sent_at = asyncio.run(run())
+    assert sent_at["a2"] - sent_at["a1"] >= 0.1
+    assert sent_at["b1"] < 0.05
+
+
+def test_failed_command_raises_to_its_caller_only():
+    async def run():
+        queue = _queue()
+
+        async def fail():
+            raise OSError("broker gone")
+
+        async def succeed():
+            return "ok"
+
+        return await asyncio.gather(
+            queue.async_send("a", fail), queue.async_send("a", succeed), return_exceptions=True
+        )
+
+    failed, succeeded = asyncio.run(run())
+    assert isinstance(failed, OSError)
+    assert succeeded == "ok"
+
+
+def test_cancel_releases_the_command_in_flight_and_the_queued_ones():
+    async def run():
+        queue = _queue()
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        in_flight = asyncio.ensure_future(queue.async_send("k", slow))
+        queued = asyncio.ensure_future(queue.async_send("k", slow))
+        await asyncio.sleep(0.01)
+
+        queue.async_cancel()
+        done, _pending = await asyncio.wait({in_flight, queued}, timeout=0.5)
+        return in_flight, queued, done, queue.pending
+
+    in_flight, queued, done, pending = asyncio.run(run())
+    assert done == {in_flight, queued}
+    for caller in (in_flight, queued):
+        with pytest.raises(asyncio.CancelledError):
+            caller.result()
+    assert pending == 0
@@ -0,0 +1,90 @@
+"""Tests of the broker kept when a configured gateway is announced again and of the gateway options"""
+import asyncio
+import types
+
+from homeassistant import config_entries  # noqa: F401
+from homeassistant.const import CONF_NAME, CONF_PASSWORD, CONF_PORT, CONF_USERNAME
+
+from custom_components.mhtzn import config_flow
+from custom_components.mhtzn.const import CONF_BROKER, CONF_HOSTS, CONF_LIGHT_COMMAND_RATE, \
+    CONF_STATE_COALESCE_WINDOW, DEFAULT_LIGHT_COMMAND_RATE, DEFAULT_STATE_COALESCE_WINDOW
+from custom_components.mhtzn.util import gateway_options
+
+
+def _connection():
+    return {
+        CONF_NAME: "gateway",
+        CONF_BROKER: "10.0.0.1",
+        CONF_HOSTS: ["10.0.0.1", "10.0.0.2", "10.0.0.3"],
+        CONF_PORT: 1883,
+        CONF_USERNAME: "user",
+        CONF_PASSWORD: "password",
+    }
+
+
+def _keep_broker(monkeypatch, broker, answering, fastest):
+    """Run the broker choice with probes where only the answering hosts accept, return the chosen broker"""
+
+    probed = []
+
+    async def probe(host, port, username, password, timeout=None):
+        probed.append(host)
+        if host not in answering:
+            raise OSError("unreachable")
+        return 0.001
+
+    async def probe_best(hosts, port, username, password, timeout=None):
+        probed.extend(hosts)
+        return fastest, 0.0001
+
+    monkeypatch.setattr(config_flow, "async_probe", probe)
+    monkeypatch.setattr(config_flow, "async_probe_best", probe_best)
+
+    connection = _connection()
+    asyncio.run(config_flow.ConfigFlow()._async_keep_broker(connection, broker))
+    return connection[CONF_BROKER], probed
+
+
+def test_answering_broker_is_kept_over_a_faster_address(monkeypatch):
+    broker, probed = _keep_broker(monkeypatch, "10.0.0.2", {"10.0.0.2", "10.0.0.3"}, "10.0.0.3")
+
+    assert broker == "10.0.0.2"
+    assert probed == ["10.0.0.2"]
+
+
+def test_unreachable_broker_is_replaced_by_the_fastest_address(monkeypatch):
+    broker, _ = _keep_broker(monkeypatch, "10.0.0.2", {"10.0.0.3"}, "10.0.0.3")
+
+    assert broker == "10.0.0.3"
+
+
+def test_broker_no_longer_advertised_is_replaced(monkeypatch):
+    broker, probed = _keep_broker(monkeypatch, "10.0.0.9", {"10.0.0.9"}, "10.0.0.3")
+
+    assert broker == "10.0.0.3"
+    assert "10.0.0.9" not in probed
+
+
+def test_options_override_the_entry_data_and_the_defaults():
+    entry = types.SimpleNamespace(data={CONF_STATE_COALESCE_WINDOW: 0.2}, options={CONF_LIGHT_COMMAND_RATE: 10})
+
+    assert gateway_options(entry) == {CONF_STATE_COALESCE_WINDOW: 0.2, CONF_LIGHT_COMMAND_RATE: 10}
+
+    entry.options = {CONF_STATE_COALESCE_WINDOW: 0, CONF_LIGHT_COMMAND_RATE: 0}
+    assert gateway_options(entry) == {CONF_STATE_COALESCE_WINDOW: 0, CONF_LIGHT_COMMAND_RATE: 0}
+
+    assert gateway_options(types.SimpleNamespace(data={}, options={})) == {
+        CONF_STATE_COALESCE_WINDOW: DEFAULT_STATE_COALESCE_WINDOW, CONF_LIGHT_COMMAND_RATE: DEFAULT_LIGHT_COMMAND_RATE
+    }
+
+
+def test_options_form_submits_the_entered_values():
+    entry = types.SimpleNamespace(data={}, options={CONF_LIGHT_COMMAND_RATE: 2})
+    flow = config_flow.ConfigFlow.async_get_options_flow(entry)
+
+    form = asyncio.run(flow.async_step_init())
+    schema = form["data_schema"]
+    assert schema({}) == {CONF_STATE_COALESCE_WINDOW: DEFAULT_STATE_COALESCE_WINDOW, CONF_LIGHT_COMMAND_RATE: 2}
+
+    result = asyncio.run(flow.async_step_init(schema({CONF_LIGHT_COMMAND_RATE: "8"})))
+    assert result["data"] == {CONF_STATE_COALESCE_WINDOW: DEFAULT_STATE_COALESCE_WINDOW, CONF_LIGHT_COMMAND_RATE: 8}
@@ -0,0 +1,148 @@
+"""Tests of the connection state machine of the gateway link"""
+import asyncio
+import pathlib
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import BenchEntry, create_hass  # noqa: E402
+from homeassistant.const import CONF_NAME  # noqa: E402
+from simulator import FakeMQTTClient, GatewaySimulator  # noqa: E402
+
+from custom_components.mhtzn import connection  # noqa: E402
+from custom_components.mhtzn.Gateway import Gateway  # noqa: E402
+from custom_components.mhtzn.connection import BACKOFF_MAX, ConnectionManager, ConnectionState, \
+    backoff_delay  # noqa: E402
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE  # noqa: E402
+
+
+def test_backoff_doubles_with_jitter_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(connection.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(attempt) for attempt in range(4)] == [1, 2, 4, 8]
+    assert backoff_delay(8) == 256
+    assert backoff_delay(9) == BACKOFF_MAX
+    assert backoff_delay(10_000) == BACKOFF_MAX
+
+    monkeypatch.setattr(connection.random, "uniform", lambda low, high: low)
+    assert backoff_delay(2) == 2
+    assert backoff_delay(10_000) == BACKOFF_MAX / 2
+
+
+class _Link:
+    """Link failing a given number of attempts before the broker accepts it"""
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.up = False
+        self.attempts = []
+        self.connected = []
+
+    async def connect(self, manager) -> bool:
+        self.attempts.append(manager.state)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("gateway unreachable")
+        self.up = True
+        return True
+
+    async def on_connected(self, first: bool) -> None:
+        self.connected.append(first)
+
+
+def _manager(link: _Link) -> ConnectionManager:
+    loop = asyncio.get_running_loop()
+    hass = types.SimpleNamespace(loop=loop)
+    manager = ConnectionManager(hass, "test", lambda: link.connect(manager), lambda: link.up, link.on_connected)
+    return manager
+
+
+async def _wait_state(manager: ConnectionManager, state: ConnectionState) -> None:
+    while manager.state is not state:
+        await asyncio.sleep(0.001)
+
+
+def test_failed_attempts_back_off_until_the_link_comes_up(monkeypatch):
+    monkeypatch.setattr(connection, "BACKOFF_BASE", 0.001)
+
+    async def run():
+        link = _Link(failures=3)
+        manager = _manager(link)
+        manager.async_start()
+        await asyncio.wait_for(_wait_state(manager, ConnectionState.CONNECTED), 1)
+        connected = (list(link.attempts), manager.attempts, manager.connections, list(link.connected))
+
+        """A lost link is connected again at the next check, without counting as a first connection"""
+        link.up = False
+        manager.async_check_now()
+        while manager.connections < 2:
+            await asyncio.sleep(0.001)
+        await manager.async_stop()
+        return connected, list(link.attempts), link.connected, manager.state
+
+    connected, attempts, firsts, state = asyncio.run(run())
+
+    assert connected == ([ConnectionState.CONNECTING] * 4, 0, 1, [True])
+    assert attempts == [ConnectionState.CONNECTING] * 5
+    assert firsts == [True, False]
+    assert state is ConnectionState.DISCONNECTED
+
+
+def test_stop_cancels_the_backoff(monkeypatch):
+    monkeypatch.setattr(connection, "BACKOFF_BASE", 100)
+
+    async def run():
+        link = _Link(failures=1_000)
+        manager = _manager(link)
+        manager.async_start()
+        await asyncio.wait_for(_wait_state(manager, ConnectionState.BACKING_OFF), 1)
+        task = manager._task
+
+        await asyncio.wait_for(manager.async_stop(), 1)
+        return task.cancelled(), manager.state, len(link.attempts)
+
+    assert asyncio.run(run()) == (True, ConnectionState.DISCONNECTED, 1)
+
+
+def test_gateway_retries_with_the_same_client_and_unload_cancels_the_backoff(monkeypatch):
+    monkeypatch.setattr(connection, "BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(connection, "CONNECT_TIMEOUT", 0.01)
+    rebuilt = []
+    monkeypatch.setattr(FakeMQTTClient, "init_client", lambda client: rebuilt.append(client))
+
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            simulator = GatewaySimulator(lights=2)
+            simulator.reachable = False
+            clients = []
+
+            def factory(hass, entry, conf):
+                clients.append(simulator.client_factory(hass, entry, conf))
+                return clients[-1]
+
+            gateway = Gateway(hass, BenchEntry("test", {CONF_NAME: "test", CONF_LIGHT_DEVICE_TYPE: "single"}),
+                              mqtt_factory=factory)
+            await gateway.connect()
+            while gateway.connection.attempts < 3:
+                await asyncio.sleep(0.001)
+
+            simulator.reachable = True
+            await asyncio.wait_for(_wait_state(gateway.connection, ConnectionState.CONNECTED), 1)
+            await gateway._discovery_task
+
+            """The link drops and the gateway stays unreachable for long"""
+            monkeypatch.setattr(connection, "BACKOFF_BASE", 100)
+            simulator.reachable = False
+            await clients[0].async_disconnect()
+            gateway.connection.async_check_now()
+            await asyncio.wait_for(_wait_state(gateway.connection, ConnectionState.BACKING_OFF), 1)
+            task = gateway.connection._task
+
+            await asyncio.wait_for(gateway.async_unload(), 1)
+            result = len(clients), len(rebuilt), task.done(), gateway.connection.state
+            await hass.async_stop(force=True)
+        return result
+
+    assert asyncio.run(run()) == (1, 0, True, ConnectionState.DISCONNECTED)
@@ -0,0 +1,221 @@
+"""Tests of the optimistic state shown before the devices echo a command, and of its rollback"""
+import asyncio
+import types
+
+from homeassistant import config_entries  # noqa: F401
+from homeassistant.components.light import ColorMode
+from homeassistant.helpers.entity import Entity
+
+from custom_components.mhtzn import entity as entity_module
+from custom_components.mhtzn.const import DOMAIN
+from custom_components.mhtzn.entity import StateChangeMixin, StateWriteStats
+from custom_components.mhtzn.light import CustomLight
+from custom_components.mhtzn.optimistic import OptimisticState, OptimisticStats
+
+
+def test_report_confirms_each_echoed_value_on_its_own():
+    state = OptimisticState({"on": 0, "level": 0.2})
+    command, superseded = state.expect({"on": 1, "level": 0.8}, deadline=10)
+
+    assert superseded == 0
+    assert state.overlay() == {"on": 1, "level": 0.8}
+
+    """A report sent before the command arrived contradicts it, the values stay pending"""
+    assert state.report({"on": 0}) == 0
+    assert state.pending == [command]
+
+    assert state.report({"on": 1}) == 0
+    assert command.expected == {"level": 0.8}
+
+    """Devices round the levels they report"""
+    assert state.report({"level": 0.801}) == 1
+    assert state.pending == []
+    assert state.confirmed == {"on": 1, "level": 0.801}
+
+
+def test_newer_command_supersedes_the_values_it_repeats():
+    state = OptimisticState()
+    first, _ = state.expect({"level": 0.2, "kelvin": 3000}, deadline=10)
+    second, superseded = state.expect({"level": 0.5}, deadline=10)
+
+    assert superseded == 0
+    assert first.expected == {"kelvin": 3000}
+
+    _third, superseded = state.expect({"kelvin": 4000}, deadline=10)
+    assert superseded == 1
+    assert state.overlay() == {"level": 0.5, "kelvin": 4000}
+    assert second in state.pending
+
+
+def test_expire_discard_and_clear_drop_pending_commands():
+    state = OptimisticState()
+    early, _ = state.expect({"on": 1}, deadline=1)
+    late, _ = state.expect({"level": 0.5}, deadline=5)
+    assert state.next_deadline == 1
+
+    assert state.expire(now=2) == 1
+    assert state.pending == [late]
+    assert state.next_deadline == 5
+
+    assert state.discard(early) is False
+    assert state.discard(late) is True
+    assert state.next_deadline is None
+
+    state.expect({"on": 1}, deadline=1)
+    state.expect({"level": 1}, deadline=1)
+    assert state.clear() == 2
+    assert state.overlay() == {}
+
+
+def test_reported_and_expected_keys_keep_the_order_they_changed():
+    state = OptimisticState({"kelvin": 3000, "rgb": 255})
+    state.report({"kelvin": 4000})
+    assert list(state.confirmed) == ["rgb", "kelvin"]
+
+    state.expect({"rgb": 1}, deadline=10)
+    state.expect({"kelvin": 5000}, deadline=10)
+    assert list(state.overlay()) == ["rgb", "kelvin"]
+
+
+class _Timers:
+    """Stand-in for async_call_later, the tests fire the timers themselves"""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def __call__(self, hass, delay, action):
+        timer = [delay, action, False]
+        self.scheduled.append(timer)
+
+        def cancel():
+            timer[2] = True
+
+        return cancel
+
+    def fire(self):
+        for timer in list(self.scheduled):
+            self.scheduled.remove(timer)
+            if not timer[2]:
+                timer[1](None)
+
+
+def _hub():
+    return types.SimpleNamespace(optimistic_stats=OptimisticStats(), write_stats=StateWriteStats())
+
+
+class _Device(StateChangeMixin, Entity):
+    """Entity with a single level, like the light and cover ones"""
+
+    def __init__(self, hub, sn="SN1"):
+        self.sn = sn
+        self.level = None
+        self.writes = 0
+        self.hass = types.SimpleNamespace(data={DOMAIN: {"entry": hub}})
+        self.config_entry = types.SimpleNamespace(entry_id="entry")
+        self.init_state({"level": 0.1})
+
+    def state_snapshot(self):
+        return (self.level,)
+
+    def update_state(self, data):
+        if "level" in data:
+            self.level = data["level"]
+
+    def async_write_ha_state(self):
+        self.writes += 1
+
+
+def test_expired_command_rolls_back_to_the_reported_state(monkeypatch):
+    timers = _Timers()
+    monkeypatch.setattr(entity_module, "async_call_later", timers)
+    hub = _hub()
+    device = _Device(hub)
+
+    device.async_apply_optimistic({"level": 0.9})
+    assert device.level == 0.9
+
+    """A report of another value does not hide the pending one"""
+    device.async_apply_state({"level": 0.3})
+    assert device.level == 0.9
+
+    monkeypatch.setattr(entity_module.time, "monotonic", lambda: 1e12)
+    timers.fire()
+
+    assert device.level == 0.3
+    assert hub.optimistic_stats.as_dict() == {"applied": 1, "confirmed": 0, "superseded": 0, "rolled_back": 1}
+
+
+def test_echo_confirms_and_cancel_shows_the_reported_state(monkeypatch):
+    monkeypatch.setattr(entity_module, "async_call_later", _Timers())
+    hub = _hub()
+    device = _Device(hub)
+
+    device.async_apply_optimistic({"level": 0.5})
+    assert device.async_apply_state({"level": 0.5}) is False
+    assert hub.optimistic_stats.confirmed == 1
+
+    device.async_apply_optimistic({"level": 0.7})
+    device.async_cancel_optimistic()
+    assert device.level == 0.5
+    assert hub.optimistic_stats.superseded == 1
+
+
+def test_failed_publication_rolls_back_at_once(monkeypatch):
+    monkeypatch.setattr(entity_module, "async_call_later", _Timers())
+    hub = _hub()
+    device = _Device(hub)
+
+    async def publish():
+        raise OSError("broker gone")
+
+    async def run():
+        try:
+            await device.async_publish_optimistic({"level": 0.8}, publish())
+        except OSError:
+            return True
+        return False
+
+    assert asyncio.run(run()) is True
+    assert device.level == 0.1
+    assert hub.optimistic_stats.rolled_back == 1
+
+
+def test_repeated_report_skips_the_state_write(monkeypatch):
+    monkeypatch.setattr(entity_module, "async_call_later", _Timers())
+    hub = _hub()
+    device = _Device(hub)
+
+    assert device.async_apply_state({"level": 0.4}) is True
+    assert device.async_apply_state({"level": 0.4}) is False
+    assert device.async_apply_state({"other": 1}) is False
+    assert hub.write_stats.as_dict() == {"written": 1, "skipped": 2}
+    assert device.writes == 1
+
+
+class _Pipeline:
+    def __init__(self):
+        self.failed = []
+
+    def async_submit(self, key, fields, send, failed=None):
+        self.failed.append(failed)
+
+
+def test_failed_light_colour_command_restores_the_colour_and_mode(monkeypatch):
+    monkeypatch.setattr(entity_module, "async_call_later", _Timers())
+    hub = _hub()
+    hub.light_pipeline = _Pipeline()
+    hass = types.SimpleNamespace(data={DOMAIN: {"entry": hub}})
+    """Lights with an rgb field support the RGB mode, the kelvin reported after it puts them in COLOR_TEMP"""
+    config = {"unique_id": "L1", "sn": "L1", "name": "Light", "is_group": False, "on": 1, "level": 1.0,
+              "rgb": 0x00FF00, "kelvin": 3000}
+    light = CustomLight(hass, config, types.SimpleNamespace(entry_id="entry"))
+    light.async_write_ha_state = lambda: None
+    before = (light.rgb_color, light.color_mode)
+    assert light.color_mode == ColorMode.COLOR_TEMP
+
+    asyncio.run(light.async_turn_on(rgb_color=(255, 0, 0)))
+    assert (light.rgb_color, light.color_mode) == ((255, 0, 0), ColorMode.RGB)
+
+    hub.light_pipeline.failed[0](OSError("broker gone"))
+    assert (light.rgb_color, light.color_mode) == before
+    assert hub.optimistic_stats.rolled_back == 1
@@ -0,0 +1,65 @@
+"""Tests of the coalescing of the light commands"""
+import asyncio
+import types
+
+from custom_components.mhtzn.pipeline import CommandPipeline
+
+
+def _pipeline(rate=0):
+    loop = asyncio.get_running_loop()
+    return CommandPipeline(types.SimpleNamespace(loop=loop, async_create_task=loop.create_task), rate)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_commands_flushed_in_one_iteration_are_merged():
+    async def run():
+        pipeline = _pipeline()
+        sent = []
+
+        async def send(fields):
+            sent.append(fields)
+
+        pipeline.async_submit("light", {"on": 1, "level": 0.5}, send)
+        pipeline.async_submit("light", {"kelvin": 4000}, send)
+        await _settle()
+        return sent
+
+    assert asyncio.run(run()) == [{"on": 1, "level": 0.5, "kelvin": 4000}]
+
+
+def test_failed_send_reports_every_merged_submission():
+    async def run():
+        pipeline = _pipeline()
+        failures = []
+
+        async def send(fields):
+            raise OSError("broker gone")
+
+        pipeline.async_submit("light", {"level": 0.5}, send, lambda err: failures.append(("level", err)))
+        pipeline.async_submit("light", {"kelvin": 4000}, send, lambda err: failures.append(("kelvin", err)))
+        pipeline.async_submit("other", {"on": 0}, send)
+        await _settle()
+        return failures
+
+    failures = asyncio.run(run())
+    assert [name for name, _err in failures] == ["level", "kelvin"]
+    assert all(isinstance(err, OSError) for _name, err in failures)
+
+
+def test_successful_send_reports_no_failure():
+    async def run():
+        pipeline = _pipeline()
+        failures = []
+
+        async def send(fields):
+            pass
+
+        pipeline.async_submit("light", {"level": 0.5}, send, failures.append)
+        await _settle()
+        return failures
+
+    assert asyncio.run(run()) == []
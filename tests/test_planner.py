@@ -0,0 +1,81 @@
+"""Group command planning of a gateway set up against the simulated gateway of the benchmarks"""
+import asyncio
+import pathlib
+import sys
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import BenchEntry, async_setup_gateway, async_unload_gateway, create_hass  # noqa: E402
+from homeassistant.const import CONF_NAME  # noqa: E402
+from simulator import GatewaySimulator  # noqa: E402
+
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE  # noqa: E402
+from custom_components.mhtzn.planner import GroupCommandPlanner  # noqa: E402
+
+
+def _lights(count, room=1, subgroup=1):
+    return [{"unique_id": f"L{index}", "room": room, "subgroup": subgroup} for index in range(count)]
+
+
+def test_no_group_command_while_the_catalog_is_partial():
+    lights = _lights(2)
+    complete = False
+    planner = GroupCommandPlanner(lambda: lights, lambda: complete)
+
+    """Only two lights of the room are known yet, the room command would also switch the others"""
+    assert planner.plan({"L0": {"on": 1}, "L1": {"on": 1}}) == ([], set())
+
+    lights = _lights(3)
+    complete = True
+    planner.invalidate()
+    group_commands, covered = planner.plan({"L0": {"on": 1}, "L1": {"on": 1}})
+    assert group_commands == [] and covered == set()
+
+    group_commands, covered = planner.plan({sn: {"on": 1} for sn in ("L0", "L1", "L2")})
+    assert covered == {"L0", "L1", "L2"}
+    assert len(group_commands) == 1
+
+
+def test_only_lights_with_the_same_fields_share_a_group_command():
+    lights = _lights(2, room=1) + [{"unique_id": "L9", "room": 2, "subgroup": 1}]
+    planner = GroupCommandPlanner(lambda: lights, lambda: True)
+
+    group_commands, covered = planner.plan({"L0": {"on": 1}, "L1": {"on": 1}, "L9": {"on": 0}})
+
+    assert covered == {"L0", "L1"}
+    assert [(envelope.fixed, fields) for envelope, fields in group_commands] == [
+        ({"room": 1, "subgroup": 0}, {"on": 1})
+    ]
+
+
+def test_removed_light_leaves_the_group_membership():
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            entry = BenchEntry("planner", {CONF_NAME: "planner", CONF_LIGHT_DEVICE_TYPE: "single"})
+            simulator = GatewaySimulator(lights=3, rooms=1, subgroups=0)
+            gateway, platforms = await async_setup_gateway(hass, simulator, entry)
+
+            """Build the membership with the three lights"""
+            _commands, covered = gateway.group_planner.plan({sn: {"on": 1} for sn in ("L0000000", "L0000001")})
+            assert not covered
+
+            """A refresh in which the gateway no longer reports the third light"""
+            gateway._live_ids = {"light": {"L0000000", "L0000001"}}
+            gateway._async_remove_stale("light")
+
+            group_commands, covered = gateway.group_planner.plan(
+                {sn: {"on": 1} for sn in ("L0000000", "L0000001")}
+            )
+            lights = set(gateway._entities["light"])
+
+            await async_unload_gateway(hass, entry, platforms)
+            await hass.async_stop(force=True)
+            return lights, len(group_commands), covered
+
+    lights, group_commands, covered = asyncio.run(run())
+
+    assert lights == {"L0000000", "L0000001"}
+    assert group_commands == 1
+    assert covered == {"L0000000", "L0000001"}
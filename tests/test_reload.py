@@ -0,0 +1,64 @@
+"""Config entry reloads through hass.config_entries, against the simulated gateway of the benchmarks"""
+import asyncio
+import pathlib
+import sys
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import async_wait_discovery  # noqa: E402
+from bench_reload import async_reload, async_reload_cycles, async_setup_hass, create_entry, entry_gateway, \
+    growth_per_cycle, simulated_gateway  # noqa: E402
+from homeassistant.config_entries import ConfigEntryState  # noqa: E402
+from simulator import GatewaySimulator  # noqa: E402
+
+from custom_components.mhtzn.const import DOMAIN, SERVICE_START_CAPTURE  # noqa: E402
+
+"""Growth per cycle tolerated for allocator and cache noise, a leaked entity set is several hundred KiB"""
+MAX_GROWTH_PER_CYCLE = 16 * 1024
+
+
+def test_reload_cycles_release_gateway_and_entities():
+    alive = []
+    growth, counts = asyncio.run(async_reload_cycles(
+        devices=1000, cycles=6, messages=20, report=lambda _cycle, _current, _growth, live: alive.append(live)
+    ))
+
+    """Only the objects of the reloaded entry are alive between the cycles"""
+    assert all(live == {"Gateway": 1, "CustomLight": 800, "CustomCover": 100, "CustomClimate": 100}
+               for live in alive)
+    assert counts == {"Gateway": 0, "CustomLight": 0, "CustomCover": 0, "CustomClimate": 0}
+    assert growth_per_cycle(growth) < MAX_GROWTH_PER_CYCLE
+
+
+def test_reload_and_unload_run_the_entry_setup_and_unload():
+    async def run():
+        simulator = GatewaySimulator(lights=2, covers=1)
+        with tempfile.TemporaryDirectory() as config_dir, simulated_gateway(simulator):
+            hass = await async_setup_hass(config_dir)
+            entry = create_entry("reload")
+            await hass.config_entries.async_add(entry)
+            await async_wait_discovery(hass, entry_gateway(hass, entry))
+            first = entry_gateway(hass, entry)
+
+            await async_reload(hass, entry)
+            reloaded = (
+                entry_gateway(hass, entry) is not first, first.mqtt_client is None, len(entry.update_listeners),
+                {hass.states.get(entity_id).state for entity_id in hass.states.async_entity_ids("light")},
+            )
+
+            await hass.config_entries.async_unload(entry.entry_id)
+            await hass.async_block_till_done()
+            unloaded = (
+                entry.state, entry.update_listeners, hass.data[DOMAIN],
+                hass.services.has_service(DOMAIN, SERVICE_START_CAPTURE),
+                {hass.states.get(entity_id).state for entity_id in hass.states.async_entity_ids("light")},
+            )
+            await hass.async_stop(force=True)
+        return reloaded, unloaded
+
+    reloaded, unloaded = asyncio.run(run())
+
+    assert reloaded[:3] == (True, True, 1)
+    assert reloaded[3] <= {"on", "off"}
+    assert unloaded == (ConfigEntryState.NOT_LOADED, [], {}, False, {"unavailable"})
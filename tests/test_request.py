@@ -0,0 +1,84 @@
+"""Tests of the correlation of the gateway requests with their responses"""
+import asyncio
+import types
+
+import pytest
+
+from custom_components.mhtzn.request import RequestManager, RequestTimeout
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _manager(reply):
+    """RequestManager whose publish answers through reply(topic, message), message as the gateway sees it"""
+
+    hass = types.SimpleNamespace(loop=asyncio.get_running_loop())
+    sent = []
+
+    async def publish(topic, data, seq=None):
+        message = {"seq": seq, "rspTo": "mhtzn", "data": data}
+        sent.append((topic, message))
+        reply(manager, topic, message)
+
+    manager = RequestManager(hass, publish)
+    return manager, sent
+
+
+def test_response_echoing_seq_resolves_request():
+    async def run():
+        def reply(manager, topic, message):
+            asyncio.get_running_loop().call_soon(
+                manager.async_resolve, "mhtzn/center/p28", {"seq": message["seq"], "data": ["scene"]}
+            )
+
+        manager, sent = await _manager(reply)
+        response = await manager.async_request("P/0/center/q28", {"page": 1}, timeout=1)
+
+        topic, message = sent[0]
+        assert topic == "P/0/center/q28"
+        assert message["data"] == {"page": 1}
+        assert isinstance(message["seq"], int)
+        assert response == {"seq": message["seq"], "data": ["scene"]}
+        assert manager.pending == 0
+        assert manager.stats["P/0/center/q28"].responses == 1
+
+    _run(run())
+
+
+def test_response_without_seq_resolves_oldest_request_of_topic():
+    async def run():
+        def reply(manager, topic, message):
+            asyncio.get_running_loop().call_soon(manager.async_resolve, "mhtzn/center/p33", {"data": {}})
+
+        manager, _sent = await _manager(reply)
+        assert await manager.async_request("P/0/center/q33", {}, timeout=1) == {"data": {}}
+
+    _run(run())
+
+
+def test_malformed_seq_does_not_raise():
+    async def run():
+        manager, _sent = await _manager(lambda manager, topic, message: None)
+        request = asyncio.ensure_future(manager.async_request("P/0/center/q31", {}, timeout=1))
+        await asyncio.sleep(0)
+
+        assert manager.async_resolve("mhtzn/center/p31", {"seq": {}, "data": 1})
+        assert await request == {"seq": {}, "data": 1}
+
+    _run(run())
+
+
+def test_request_times_out_after_retries():
+    async def run():
+        manager, sent = await _manager(lambda manager, topic, message: None)
+        with pytest.raises(RequestTimeout):
+            await manager.async_request("P/0/center/q28", {}, timeout=0.01, retries=1)
+
+        assert len(sent) == 2
+        assert sent[0][1]["seq"] != sent[1][1]["seq"]
+        assert manager.stats["P/0/center/q28"].timeouts == 2
+        assert manager.pending == 0
+
+    _run(run())
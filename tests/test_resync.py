@@ -0,0 +1,139 @@
+"""The state coalescer is released however the resynchronisation after a reconnection ends"""
+import asyncio
+import importlib
+import pathlib
+import sys
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import BenchEntry, create_hass  # noqa: E402
+from homeassistant.const import CONF_NAME  # noqa: E402
+from simulator import GatewaySimulator  # noqa: E402
+
+from custom_components.mhtzn.Gateway import Gateway  # noqa: E402
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE  # noqa: E402
+
+"""The package exports the Gateway class under the name of its module"""
+gateway_module = importlib.import_module("custom_components.mhtzn.Gateway")
+
+
+async def _resync(scenario):
+    """Run scenario(gateway) on a connected gateway with a report held by the resynchronisation, return its
+    result, whether the coalescer is still held and the reports delivered to the entity handler"""
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await create_hass(config_dir)
+        simulator = GatewaySimulator(lights=3)
+        gateway = Gateway(hass, BenchEntry("test", {CONF_NAME: "test", CONF_LIGHT_DEVICE_TYPE: "single"}),
+                          mqtt_factory=simulator.client_factory)
+        await gateway.connect()
+        while gateway._discovery_task is None:
+            await asyncio.sleep(0.001)
+        await gateway._discovery_task
+
+        delivered = []
+        gateway.async_register_state_handler("L0000000", delivered.append)
+
+        async def held_report():
+            while not gateway.state_coalescer._held:
+                await asyncio.sleep(0)
+            gateway.state_coalescer.async_add({"sn": "L0000000", "level": 0.5})
+
+        reporter = asyncio.create_task(held_report())
+        try:
+            result = await scenario(gateway)
+        except BaseException as err:
+            result = type(err)
+        await reporter
+        held = gateway.state_coalescer._held
+        await asyncio.sleep(0)
+
+        await gateway.async_unload()
+        await hass.async_stop(force=True)
+    return result, held, [state.get("level") for state in delivered]
+
+
+def test_complete_resync_releases_the_coalescer():
+    result, held, delivered = asyncio.run(_resync(lambda gateway: gateway.async_resync_states()))
+
+    """The report is merged with the state of the device list and delivered with it in one pass"""
+    assert result is True
+    assert held is False
+    assert len(delivered) == 1
+
+
+def test_timed_out_resync_releases_the_coalescer(monkeypatch):
+    monkeypatch.setattr(gateway_module, "RESYNC_TIMEOUT", 0.05)
+
+    async def scenario(gateway):
+        async def lost(_data):
+            pass
+
+        gateway.catalog_fetcher._publish = lost
+        return await gateway.async_resync_states()
+
+    result, held, delivered = asyncio.run(_resync(scenario))
+
+    assert result is False
+    assert held is False
+    assert delivered == [0.5]
+
+
+def test_cancelled_resync_releases_the_coalescer():
+    async def scenario(gateway):
+        async def lost(_data):
+            pass
+
+        gateway.catalog_fetcher._publish = lost
+        task = asyncio.create_task(gateway.async_resync_states())
+        while not gateway.state_coalescer._held:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        return await task
+
+    result, held, delivered = asyncio.run(_resync(scenario))
+
+    assert result is asyncio.CancelledError
+    assert held is False
+    assert delivered == [0.5]
+
+
+def test_failed_request_releases_the_coalescer():
+    async def scenario(gateway):
+        async def broken(_data):
+            """Let the report arrive while the coalescer is held"""
+            await asyncio.sleep(0.01)
+            raise OSError("broker gone")
+
+        gateway.catalog_fetcher._publish = broken
+        return await gateway.async_resync_states()
+
+    result, held, delivered = asyncio.run(_resync(scenario))
+
+    assert result is OSError
+    assert held is False
+    assert delivered == [0.5]
+
+
+def test_hold_is_bounded_while_the_resync_waits(monkeypatch):
+    monkeypatch.setattr(gateway_module, "RESYNC_HOLD_MAX", 0.01)
+    monkeypatch.setattr(gateway_module, "RESYNC_TIMEOUT", 0.5)
+
+    async def scenario(gateway):
+        async def lost(_data):
+            pass
+
+        gateway.catalog_fetcher._publish = lost
+        task = asyncio.create_task(gateway.async_resync_states())
+        await asyncio.sleep(0.1)
+        released = not gateway.state_coalescer._held and not task.done()
+        await task
+        return released
+
+    result, held, delivered = asyncio.run(_resync(scenario))
+
+    assert result is True
+    assert held is False
+    assert delivered == [0.5]
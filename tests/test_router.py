@@ -0,0 +1,81 @@
+"""Tests of the resolution of the gateway topics to their handlers"""
+import asyncio
+
+from custom_components.mhtzn import router as router_module
+from custom_components.mhtzn.router import TopicRouter, topic_matches
+
+
+async def _handler(topic, payload, payload_size):
+    pass
+
+
+def test_topic_matches_the_mqtt_wildcards():
+    assert topic_matches("p/+/event/3", "p/SN1/event/3")
+    assert not topic_matches("p/+/event/3", "p/SN1/event/4")
+    assert not topic_matches("p/+/event/3", "p/SN1/event/3/extra")
+    assert not topic_matches("p/+/event/3", "p/SN1/event")
+    assert topic_matches("mhtzn/#", "mhtzn/center/p5")
+    assert topic_matches("mhtzn/center/p5", "mhtzn/center/p5")
+    assert not topic_matches("mhtzn/center/p5", "mhtzn/center/p50")
+
+
+def test_exact_topics_take_precedence_over_wildcards():
+    router = TopicRouter()
+    exact = router.register("mhtzn/center/p5", _handler)
+    wildcard = router.register("mhtzn/center/+", _handler)
+
+    assert router.resolve("mhtzn/center/p5") is exact
+    assert router.resolve("mhtzn/center/p28") is wildcard
+    assert router.resolve("other/topic") is None
+    assert router.patterns == ["mhtzn/center/p5", "mhtzn/center/+"]
+
+
+def test_wildcard_resolution_is_matched_once_per_topic(monkeypatch):
+    calls = []
+
+    def counting_matches(pattern, topic):
+        calls.append(topic)
+        return topic_matches(pattern, topic)
+
+    monkeypatch.setattr(router_module, "topic_matches", counting_matches)
+    router = TopicRouter()
+    route = router.register("p/+/event/3", _handler)
+
+    for _ in range(3):
+        assert router.resolve("p/SN1/event/3") is route
+        assert router.resolve("p/SN1/event/9") is None
+    assert calls == ["p/SN1/event/3", "p/SN1/event/9"]
+
+    """A new route may match topics resolved before, including those without a route"""
+    other = router.register("p/+/event/9", _handler)
+    assert router.resolve("p/SN1/event/9") is other
+    assert router.resolve("p/SN1/event/3") is route
+
+
+def test_registering_a_pattern_again_replaces_its_route():
+    router = TopicRouter()
+    router.register("p/+/event/3", _handler)
+    assert router.resolve("p/SN1/event/3") is not None
+
+    replacement = router.register("p/+/event/3", _handler)
+    assert router.resolve("p/SN1/event/3") is replacement
+    assert router.routes == [replacement]
+
+
+def test_dispatch_passes_the_topic_payload_and_size():
+    router = TopicRouter()
+    received = []
+
+    async def handler(topic, payload, payload_size):
+        received.append((topic, payload, payload_size))
+
+    router.register("p/+/event/3", handler)
+
+    async def run():
+        return (
+            await router.async_dispatch("p/SN1/event/3", {"data": []}, 12),
+            await router.async_dispatch("unknown", {}, 2),
+        )
+
+    assert asyncio.run(run()) == (True, False)
+    assert received == [("p/SN1/event/3", {"data": []}, 12)]
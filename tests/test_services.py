@@ -0,0 +1,52 @@
+"""Paths accepted by the capture services"""
+import os
+import tempfile
+import types
+
+import pytest
+from homeassistant import config_entries  # noqa: F401
+from homeassistant.core import Config
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.mhtzn import _capture_path
+
+
+def _hass(config_dir: str):
+    hass = types.SimpleNamespace()
+    hass.config = Config(hass)
+    hass.config.config_dir = config_dir
+    return hass
+
+
+def _call(path):
+    return types.SimpleNamespace(data={} if path is None else {"path": path})
+
+
+def test_relative_path_is_in_the_configuration_directory():
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = _hass(config_dir)
+
+        assert _capture_path(hass, _call("mhtzn.capture")) == os.path.join(config_dir, "mhtzn.capture")
+        assert _capture_path(hass, _call(os.path.join(config_dir, "captures", "a.capture"))) == os.path.join(
+            config_dir, "captures", "a.capture"
+        )
+        assert _capture_path(hass, _call(None)) is None
+
+
+def test_path_outside_the_configuration_directory_is_rejected():
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = _hass(config_dir)
+
+        with pytest.raises(HomeAssistantError):
+            _capture_path(hass, _call("../outside.capture"))
+        with pytest.raises(HomeAssistantError):
+            _capture_path(hass, _call("/etc/mhtzn.capture"))
+
+
+def test_path_in_an_allowed_external_directory_is_accepted():
+    with tempfile.TemporaryDirectory() as config_dir, tempfile.TemporaryDirectory() as external:
+        hass = _hass(config_dir)
+        hass.config.allowlist_external_dirs = {external}
+
+        path = os.path.join(external, "mhtzn.capture")
+        assert _capture_path(hass, _call(path)) == path
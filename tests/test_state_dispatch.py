@@ -0,0 +1,89 @@
+"""Delivery of the device reports to the entity registered for their sn"""
+import asyncio
+import json
+import pathlib
+import sys
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from bench_gateway import BenchEntry, create_hass  # noqa: E402
+from homeassistant.const import CONF_NAME  # noqa: E402
+
+from custom_components.mhtzn.Gateway import Gateway  # noqa: E402
+from custom_components.mhtzn.const import CONF_LIGHT_DEVICE_TYPE, CONF_STATE_COALESCE_WINDOW  # noqa: E402
+
+
+def _gateway(hass) -> Gateway:
+    entry = BenchEntry("test", {CONF_NAME: "test", CONF_LIGHT_DEVICE_TYPE: "single"},
+                       {CONF_STATE_COALESCE_WINDOW: 0})
+    return Gateway(hass, entry)
+
+
+def test_reports_reach_the_registered_handler_and_unknown_sn_are_counted():
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            gateway = _gateway(hass)
+            delivered = []
+            gateway.async_register_state_handler("SN1", delivered.append)
+
+            report = {"seq": 0, "data": [
+                {"sn": "SN1", "on": 1}, {"sn": "SN2", "on": 1}, {"sn": "SN1", "level": 0.5},
+            ]}
+            await gateway._async_process_message("p/GW/event/3", json.dumps(report).encode())
+            await asyncio.sleep(0)
+            await hass.async_stop(force=True)
+        return delivered, gateway.metrics.unknown_sn, gateway.metrics.as_dict()["unknown_sn"]
+
+    delivered, unknown_sn, reported = asyncio.run(run())
+
+    """The reports of a device are merged by the coalescer before they are delivered"""
+    assert delivered == [{"sn": "SN1", "on": 1, "level": 0.5}]
+    assert unknown_sn == reported == 1
+
+
+def test_removed_handler_counts_the_reports_as_unknown():
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            gateway = _gateway(hass)
+            first, second = [], []
+
+            remove_first = gateway.async_register_state_handler("SN1", first.append)
+            """An entity added again for the same device replaces the handler of the previous one"""
+            remove_second = gateway.async_register_state_handler("SN1", second.append)
+            remove_first()
+            gateway._async_dispatch_state("SN1", {"sn": "SN1", "on": 1})
+
+            remove_second()
+            gateway._async_dispatch_state("SN1", {"sn": "SN1", "on": 0})
+            await hass.async_stop(force=True)
+        return first, second, gateway.metrics.unknown_sn
+
+    first, second, unknown_sn = asyncio.run(run())
+
+    assert first == []
+    assert second == [{"sn": "SN1", "on": 1}]
+    assert unknown_sn == 1
+
+
+def test_failing_handler_does_not_stop_the_other_devices():
+    async def run():
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await create_hass(config_dir)
+            gateway = _gateway(hass)
+            delivered = []
+
+            def broken(_state):
+                raise ValueError("bad report")
+
+            gateway.async_register_state_handler("SN1", broken)
+            gateway.async_register_state_handler("SN2", delivered.append)
+            gateway.state_coalescer.async_add({"sn": "SN1", "on": 1})
+            gateway.state_coalescer.async_add({"sn": "SN2", "on": 1})
+            gateway.state_coalescer.async_flush()
+            await hass.async_stop(force=True)
+        return delivered, gateway.metrics.unknown_sn
+
+    assert asyncio.run(run()) == ([{"sn": "SN2", "on": 1}], 0)
@@ -0,0 +1,68 @@
+"""Reports that change nothing the entity shows skip the state write, and are counted as skipped"""
+import types
+
+from homeassistant import config_entries  # noqa: F401
+
+from custom_components.mhtzn.const import DOMAIN
+from custom_components.mhtzn.cover import CustomCover
+from custom_components.mhtzn.entity import StateWriteStats
+from custom_components.mhtzn.light import CustomLight
+from custom_components.mhtzn.optimistic import OptimisticStats
+
+ENTRY = types.SimpleNamespace(entry_id="entry")
+
+
+def _hass(hub):
+    return types.SimpleNamespace(data={DOMAIN: {"entry": hub}})
+
+
+def _hub():
+    return types.SimpleNamespace(optimistic_stats=OptimisticStats(), write_stats=StateWriteStats())
+
+
+def _written(entity):
+    entity.writes = 0
+
+    def write():
+        entity.writes += 1
+
+    entity.async_write_ha_state = write
+    return entity
+
+
+def test_light_reports_write_only_the_changes():
+    hub = _hub()
+    light = _written(CustomLight(_hass(hub), {
+        "unique_id": "L1", "sn": "L1", "name": "Light", "is_group": False, "on": 1, "level": 0.5, "kelvin": 3000,
+    }, ENTRY))
+
+    assert light.async_apply_state({"on": 1, "level": 0.5, "kelvin": 3000}) is False
+    """Within the rounding of the brightness"""
+    assert light.async_apply_state({"level": 0.501}) is False
+    assert light.async_apply_state({"on": 0}) is True
+    assert light.async_apply_state({"kelvin": 4000}) is True
+    assert light.async_apply_state({"kelvin": 4000, "on": 0}) is False
+
+    assert hub.write_stats.as_dict() == {"written": 2, "skipped": 3}
+    assert light.writes == 2
+
+
+def test_cover_reports_without_a_new_position_are_skipped():
+    hub = _hub()
+    cover = _written(CustomCover(_hass(hub), {"unique_id": "C1", "sn": "C1", "name": "Cover", "travel": 1}, ENTRY))
+
+    assert cover.async_apply_state({"travel": 1}) is False
+    assert cover.async_apply_state({"other": 3}) is False
+    assert cover.async_apply_state({"travel": 0.4}) is True
+
+    assert hub.write_stats.as_dict() == {"written": 1, "skipped": 2}
+    assert cover.writes == 1
+
+
+def test_entities_without_a_gateway_are_not_counted():
+    cover = _written(CustomCover(_hass(None), {"unique_id": "C1", "sn": "C1", "name": "Cover", "travel": 1}, ENTRY))
+
+    assert cover.write_stats is None
+    assert cover.async_apply_state({"travel": 0.5}) is True
+    assert cover.async_apply_state({"travel": 0.5}) is False
+    assert cover.writes == 1